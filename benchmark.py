@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准脚本 - 超级Python模拟系统
+
+包含命令分派微基准和文件/文本/哈希/压缩/加密命令的基准测试套件。
+套件在合成夹具上运行命令并把结果写入 JSON, 与保存的基线比较,
+dir、grep、hash、zip 出现性能退化时以非零退出码结束。
+"""
+
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+
+
+def legacy_execute(system, command):
+    """旧版分派方式: 每次执行都重建命令表并按字符串拆分解析别名"""
+    parts = command.split()
+    if not parts:
+        return
+    cmd = parts[0].lower()
+    args = parts[1:] if len(parts) > 1 else []
+
+    if cmd in system.aliases:
+        alias_cmd = system.aliases[cmd]
+        if ' ' in alias_cmd:
+            alias_parts = alias_cmd.split()
+            cmd = alias_parts[0]
+            args = alias_parts[1:] + args
+        else:
+            cmd = alias_cmd
+
+    # 与旧版一样, 每次调用都重新创建约70个绑定方法
+    commands = {name: handler.__func__.__get__(system) if hasattr(handler, '__func__') else handler
+                for name, handler in system.commands.items()}
+
+    if cmd in commands:
+        try:
+            commands[cmd](args)
+        except Exception as e:
+            print(f"命令执行错误: {e}")
+    else:
+        print(f"未知命令: {cmd}")
+
+
+def _time_per_call(func, iterations):
+    """返回每次调用的平均耗时 (纳秒)"""
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def bench_dispatch(iterations=100000):
+    """命令分派微基准: 比较旧版与命令注册表的单条命令分派开销"""
+    from main import SuperCommandLineSystem
+
+    system = SuperCommandLineSystem()
+    # 空命令, 只测量分派本身的开销
+    system.register_command('noop', lambda args: None)
+    system.aliases['nop'] = 'noop -x'
+    system._rebuild_dispatch()
+
+    results = {}
+    with redirect_stdout(io.StringIO()):
+        for command in ('noop', 'nop'):
+            before = _time_per_call(lambda: legacy_execute(system, command), iterations)
+            after = _time_per_call(lambda: system.execute_command(command), iterations)
+            results[command] = (before, after)
+    return results
+
+
+# ==================== 基准测试套件 ====================
+
+# 夹具规模: 深层目录树、大文本文件、大量小文件
+SCALES = {
+    'small': {'tree_depth': 4, 'tree_fanout': 3, 'tree_files': 2,
+              'text_mb': 2, 'sort_mb': 1, 'small_files': 500, 'crypt_kb': 64},
+    'medium': {'tree_depth': 6, 'tree_fanout': 3, 'tree_files': 3,
+               'text_mb': 64, 'sort_mb': 8, 'small_files': 5000, 'crypt_kb': 512},
+    'large': {'tree_depth': 8, 'tree_fanout': 4, 'tree_files': 4,
+              'text_mb': 2048, 'sort_mb': 128, 'small_files': 50000, 'crypt_kb': 4096},
+}
+
+# 夹具格式版本: 生成规则改变时递增, 旧夹具会被重新生成
+FIXTURE_VERSION = 1
+
+# 基准用例: (名称, 命令)。命令在夹具目录中执行, 输出被丢弃
+CASES = [
+    ('dir', 'dir flat'),
+    ('tree', 'tree tree'),
+    ('size', 'size tree'),
+    ('find', 'find tree f1'),
+    ('grep', 'grep error big.log'),
+    ('wc', 'wc big.log'),
+    ('tail', 'tail big.log'),
+    ('sort', 'sort lines.txt'),
+    ('uniq', 'uniq lines.txt'),
+    ('hash', 'hash big.log'),
+    ('sha256', 'sha256 big.log'),
+    ('copy', 'copy flat scratch/flat'),
+    ('zip', 'zip scratch/flat.zip flat'),
+    ('tar', 'tar scratch/flat.tar.gz flat'),
+    ('encrypt', 'encrypt crypt.bin secret'),
+]
+
+# 这些用例变慢超出容差时基准测试失败
+GATED_CASES = ('dir', 'grep', 'hash', 'zip')
+
+# 默认容差: 中位数比基线慢 25% 以上视为退化
+DEFAULT_TOLERANCE = 0.25
+
+# 绝对差值低于该值 (毫秒) 时不视为退化, 避免极短用例的计时噪声
+MIN_REGRESSION_MS = 2.0
+
+_LEVELS = ('INFO', 'INFO', 'INFO', 'DEBUG', 'WARN')
+_WORDS = ('request', 'worker', 'cache', 'session', 'upload', 'query', 'socket', 'retry')
+
+
+def _log_block(rng, lines):
+    """生成一块日志文本 (约 2% 的行是 ERROR)"""
+    out = []
+    for i in range(lines):
+        level = 'ERROR' if rng.random() < 0.02 else rng.choice(_LEVELS)
+        out.append(f"2024-05-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:"
+                   f"{rng.randint(0, 59):02d} {level:<5} {rng.choice(_WORDS)}-{rng.randint(1, 64)} "
+                   f"id={rng.randint(0, 10 ** 6)} {' '.join(rng.choice(_WORDS) for _ in range(rng.randint(2, 8)))}\n")
+    return ''.join(out).encode('utf-8')
+
+
+def _write_text(path, size_mb, rng):
+    """写入约 size_mb MB 的日志文本 (重复写入最多 4MB 的随机块, 生成多 GB 文件也很快)"""
+    target = size_mb * 1024 * 1024
+    block = _log_block(rng, min(60000, target // 64 + 1))
+    written = 0
+    with open(path, 'wb') as f:
+        while written < target:
+            f.write(block)
+            written += len(block)
+
+
+def _make_tree(path, depth, fanout, files, rng):
+    """生成深度为 depth、每层 fanout 个子目录的目录树, 每个目录含 files 个小文件"""
+    os.makedirs(path, exist_ok=True)
+    for i in range(files):
+        with open(os.path.join(path, f"f{i}.txt"), 'wb') as f:
+            f.write(_log_block(rng, rng.randint(1, 20)))
+    if depth > 0:
+        for i in range(fanout):
+            _make_tree(os.path.join(path, f"d{i}"), depth - 1, fanout, files, rng)
+
+
+def make_fixtures(root, scale='medium', params=None):
+    """在 root 下生成基准夹具 (参数未变时复用已有夹具), 返回夹具参数"""
+    params = dict(params or SCALES[scale])
+    manifest_path = os.path.join(root, 'fixtures.json')
+    manifest = {'version': FIXTURE_VERSION, 'scale': scale, 'params': params}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == manifest:
+                return params
+    except (OSError, ValueError):
+        pass
+
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+    os.makedirs(root)
+    rng = random.Random(20240501)
+    _make_tree(os.path.join(root, 'tree'), params['tree_depth'], params['tree_fanout'],
+               params['tree_files'], rng)
+    _write_text(os.path.join(root, 'big.log'), params['text_mb'], rng)
+    _write_text(os.path.join(root, 'lines.txt'), params['sort_mb'], rng)
+    flat = os.path.join(root, 'flat')
+    os.makedirs(flat)
+    for i in range(params['small_files']):
+        with open(os.path.join(flat, f"file{i:06d}.txt"), 'wb') as f:
+            f.write(os.urandom(rng.randint(256, 4096)).hex().encode('ascii'))
+    with open(os.path.join(root, 'crypt.bin'), 'wb') as f:
+        f.write(os.urandom(params['crypt_kb'] * 1024))
+    # 清单最后写入: 生成中断时下次会重新生成
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return params
+
+
+class _NullOutput:
+    """丢弃写入内容的输出流"""
+
+    def write(self, text):
+        return len(text)
+
+    def writelines(self, lines):
+        pass
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def _reset_scratch(root):
+    """清空用例写出的文件, 使每次运行的条件相同"""
+    scratch = os.path.join(root, 'scratch')
+    if os.path.isdir(scratch):
+        shutil.rmtree(scratch)
+    os.makedirs(scratch)
+    encrypted = os.path.join(root, 'crypt.bin.enc')
+    if os.path.exists(encrypted):
+        os.remove(encrypted)
+
+
+def run_suite(root, cases=None, repeat=3, system_class=None, progress=None):
+    """在夹具目录 root 中运行基准用例, 返回 {名称: 结果}
+
+    每个用例先预热一次, 再运行 repeat 次; 命令输出被丢弃。
+    """
+    if system_class is None:
+        from main import SuperCommandLineSystem as system_class
+    # 与 system_class 使用同一模块的输出捕获, 在交互系统内运行时不影响其他线程的输出
+    runtime = sys.modules[system_class.__module__]
+    selected = [(name, command) for name, command in CASES if cases is None or name in cases]
+
+    results = {}
+    for name, command in selected:
+        system = system_class(current_dir=root)
+        walls = []
+        cpus = []
+        status = 0
+        read = written = None
+        for run in range(repeat + 1):
+            _reset_scratch(root)
+            with runtime.capture_output(_NullOutput()):
+                sample = runtime.ResourceSample()
+                status = system.execute_command(command)
+                wall, cpu, read, written = sample.finish()
+            if status != 0:
+                break
+            # 第一次运行为预热, 不计入结果
+            if run:
+                walls.append(wall * 1000)
+                cpus.append(cpu * 1000)
+        _reset_scratch(root)
+        result = {'command': command, 'status': status}
+        if walls:
+            result.update({
+                'median_ms': round(statistics.median(walls), 3),
+                'min_ms': round(min(walls), 3),
+                'max_ms': round(max(walls), 3),
+                'cpu_ms': round(statistics.median(cpus), 3),
+                'runs': len(walls),
+            })
+            if read is not None:
+                result.update({'bytes_read': read, 'bytes_written': written})
+        results[name] = result
+        if progress:
+            progress(name, result)
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE, gated=GATED_CASES):
+    """与基线比较, 返回退化列表 [(名称, 基线毫秒, 当前毫秒)]
+
+    受控用例失败或中位数超出基线 (1 + tolerance) 倍且差值超过 MIN_REGRESSION_MS 时视为退化。
+    """
+    regressions = []
+    for name in gated:
+        current = results.get(name)
+        before = baseline.get(name)
+        if current is None or before is None or 'median_ms' not in before:
+            continue
+        now = current.get('median_ms')
+        if now is None:
+            regressions.append((name, before['median_ms'], None))
+        elif now > before['median_ms'] * (1 + tolerance) and now - before['median_ms'] > MIN_REGRESSION_MS:
+            regressions.append((name, before['median_ms'], now))
+    return regressions
+
+
+def _print_result(name, result, baseline=None):
+    if 'median_ms' not in result:
+        print(f"  {name:<10} ❌ 失败 (退出码 {result['status']}): {result['command']}")
+        return
+    line = (f"  {name:<10} {result['median_ms']:>10.2f} {result['min_ms']:>10.2f} "
+            f"{result['cpu_ms']:>10.2f}")
+    before = (baseline or {}).get(name, {}).get('median_ms')
+    if before:
+        line += f" {result['median_ms'] / before:>7.2f}x"
+    print(line)
+
+
+def run_benchmarks(args=None, system_class=None) -> int:
+    """基准测试套件入口 (命令行与 bench 命令共用), 返回退出码"""
+    import argparse
+    if system_class is None:
+        from main import SuperCommandLineSystem as system_class
+    state_path = sys.modules[system_class.__module__].state_path
+
+    parser = argparse.ArgumentParser(prog='bench', description='文件、文本、哈希、压缩和加密命令的基准测试')
+    parser.add_argument('cases', nargs='*', help='只运行指定用例 (默认全部)')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='medium', help='夹具规模 (默认 medium)')
+    parser.add_argument('--repeat', type=int, default=3, help='每个用例的运行次数 (默认 3)')
+    parser.add_argument('--fixtures', help='夹具目录 (默认位于状态目录)')
+    parser.add_argument('--output', help='结果 JSON 文件 (默认位于状态目录)')
+    parser.add_argument('--baseline', help='基线 JSON 文件 (默认位于状态目录)')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='允许的变慢比例 (默认 0.25)')
+    parser.add_argument('--list', action='store_true', help='列出用例')
+    parser.add_argument('--dispatch', type=int, nargs='?', const=100000, metavar='N',
+                        help='运行命令分派微基准 (N 次迭代)')
+    try:
+        options = parser.parse_args(args)
+    except SystemExit as e:
+        return e.code or 0
+
+    if options.list:
+        for name, command in CASES:
+            print(f"  {name:<10} {command}{'  [受控]' if name in GATED_CASES else ''}")
+        return 0
+    if options.dispatch:
+        print("🚀 命令分派微基准")
+        print("=" * 50)
+        print(f"{'命令':<10} {'旧版(ns)':>12} {'注册表(ns)':>12} {'加速':>8}")
+        for command, (before, after) in bench_dispatch(options.dispatch).items():
+            print(f"{command:<10} {before:>12.0f} {after:>12.0f} {before / after:>7.1f}x")
+        return 0
+    unknown = set(options.cases) - {name for name, _ in CASES}
+    if unknown:
+        print(f"❌ 未知用例: {', '.join(sorted(unknown))} (使用 --list 查看)")
+        return 2
+
+    bench_dir = state_path('bench')
+    fixtures = options.fixtures or os.path.join(bench_dir, f"fixtures-{options.scale}")
+    output = options.output or os.path.join(bench_dir, 'last.json')
+    baseline_path = options.baseline or os.path.join(bench_dir, 'baseline.json')
+
+    print(f"🧪 准备夹具 ({options.scale}): {fixtures}")
+    params = make_fixtures(fixtures, options.scale)
+
+    baseline = None
+    try:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('scale') == options.scale:
+            baseline = data['results']
+        else:
+            print(f"⚠️  基线规模为 {data.get('scale')}, 与本次不同, 跳过比较")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️  无法读取基线 {baseline_path}: {e}")
+
+    print(f"  {'用例':<10} {'中位(ms)':>10} {'最小(ms)':>10} {'CPU(ms)':>10}" + (" 相对基线" if baseline else ""))
+    results = run_suite(fixtures, options.cases or None, max(1, options.repeat), system_class,
+                        progress=lambda name, result: _print_result(name, result, baseline))
+
+    report = {
+        'generated': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': options.scale,
+        'params': params,
+        'repeat': options.repeat,
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 结果已写入: {output}")
+
+    exit_code = 0
+    failed = [name for name, result in results.items() if result['status'] != 0]
+    if failed:
+        print(f"❌ 执行失败的用例: {', '.join(failed)}")
+        exit_code = 1
+    if baseline:
+        regressions = compare(results, baseline, options.tolerance)
+        for name, before, now in regressions:
+            detail = "执行失败" if now is None else f"{before:.2f}ms -> {now:.2f}ms ({now / before:.2f}x)"
+            print(f"❌ 性能退化: {name} {detail}")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"✅ 受控用例 ({', '.join(GATED_CASES)}) 未超出基线 {options.tolerance:.0%}")
+    if options.save_baseline:
+        if failed:
+            print("⚠️  有用例失败, 未保存基线")
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+            with open(baseline_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"✅ 基线已保存: {baseline_path}")
+    return exit_code
+
+
+def main():
+    """主函数"""
+    # 兼容旧用法: python benchmark.py <迭代次数>
+    args = sys.argv[1:]
+    if args and args[0].isdigit():
+        args = ['--dispatch', args[0]]
+    return run_benchmarks(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+守护进程客户端 - 超级Python模拟系统
+
+把命令发送给 `python main.py --daemon` 启动的守护进程执行。
+为了让单条命令在几毫秒内完成, 本脚本不导入 main 模块。
+"""
+
+import json
+import os
+import socket
+import sys
+
+
+def default_socket_path():
+    """守护进程套接字路径 (与 main.default_socket_path 规则相同)"""
+    if os.environ.get('SUPERSIM_SOCKET'):
+        return os.environ['SUPERSIM_SOCKET']
+    base = os.environ.get('SUPERSIM_HOME') or os.path.join(os.path.expanduser('~'), '.supersim')
+    return os.path.join(base, 'daemon.sock')
+
+
+class DaemonClient:
+    """与守护进程的一个会话 (一个连接即一个会话, 拥有独立的工作目录)"""
+
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.reader = self.sock.makefile('rb')
+        self.cwd = os.getcwd()
+
+    def request(self, payload):
+        self.sock.sendall(json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n')
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("守护进程关闭了连接")
+        return json.loads(line)
+
+    def execute(self, command):
+        """执行一行命令, 输出结果并返回 (状态码, 会话是否继续)"""
+        response = self.request({'cmd': command, 'cwd': self.cwd})
+        sys.stdout.write(response['out'])
+        self.cwd = response['cwd'] or self.cwd
+        return response['status'], response['running']
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+def main(argv=None):
+    """主函数"""
+    args = list(sys.argv[1:] if argv is None else argv)
+    socket_path = default_socket_path()
+    commands = None
+    script = None
+    stop = False
+    while args:
+        arg = args.pop(0)
+        if arg == '--socket' and args:
+            socket_path = args.pop(0)
+        elif arg == '-c' and args:
+            commands = [args.pop(0)]
+        elif arg == '-f' and args:
+            script = args.pop(0)
+        elif arg == '--stop':
+            stop = True
+        else:
+            print("用法: client.py [--socket PATH] [-c 命令 | -f 脚本 | --stop]")
+            return 2
+
+    try:
+        client = DaemonClient(socket_path)
+    except OSError as e:
+        print(f"❌ 无法连接守护进程 {socket_path}: {e}", file=sys.stderr)
+        print("请先运行: python main.py --daemon", file=sys.stderr)
+        return 1
+
+    try:
+        if stop:
+            return client.request({'op': 'shutdown'})['status']
+        if script is not None:
+            with open(script, 'r', encoding='utf-8') as f:
+                commands = f.read().splitlines()
+        elif commands is None and not sys.stdin.isatty():
+            commands = sys.stdin
+
+        if commands is not None:
+            exit_code = 0
+            for line in commands:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                status, running = client.execute(line)
+                exit_code = status or exit_code
+                if not running:
+                    break
+            return exit_code
+
+        # 交互模式: 会话保持连接, cd 只影响本会话
+        while True:
+            try:
+                line = input(f"{client.cwd} >>> ").strip()
+            except EOFError:
+                return 0
+            except KeyboardInterrupt:
+                print("\n使用 'exit' 或 'quit' 退出")
+                continue
+            if line:
+                status, running = client.execute(line)
+                if not running:
+                    return 0
+    except (OSError, ConnectionError) as e:
+        print(f"❌ 与守护进程通信失败: {e}", file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,34 +9,3267 @@ import os
 import sys
 import shutil
 import platform
-import psutil
 import datetime
 import json
-import hashlib
-import zipfile
-import tarfile
-import subprocess
 import threading
 import time
 import random
 import string
-import urllib.request
-import urllib.parse
-import webbrowser
-try:
-    import requests
-    REQUESTS_AVAILABLE = True
-except ImportError:
-    REQUESTS_AVAILABLE = False
+import functools
+import errno
+import stat
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
+# 用户数据文件 (相对于启动时的工作目录)
+USER_DATA_FILE = 'user_data.json'
+
+# 历史记录数据库 (位于状态目录)
+HISTORY_FILE = 'history.db'
+
+# tree/size 并发扫描目录的线程数 (也是 tree 每层预取的子目录数)
+SCAN_WORKERS = 8
+
+# size 命令的目录缓存 (位于状态目录)
+SIZE_CACHE_FILE = 'size_cache.db'
+
+# 文件系统元数据索引 (位于状态目录, 由 index build 建立)
+INDEX_FILE = 'fs_index.db'
+
+# type 命令的大文件行索引 (位于状态目录)
+LINE_INDEX_FILE = 'line_index.db'
+
+# grep 的文件内容 trigram 索引目录 (位于状态目录, 由 index grep 建立)
+GREP_INDEX_DIR = 'grep_index'
+
+# 守护进程的 Unix 套接字 (位于状态目录, 可用 $SUPERSIM_SOCKET 覆盖)
+DAEMON_SOCKET = 'daemon.sock'
+
+# 守护进程一行请求的长度上限, 超过时返回错误并关闭连接
+DAEMON_LINE_LIMIT = 1 << 20
+
+# 插件目录: 其中的命令模块在命令首次被调用时才加载
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plugins')
+
+# 已加载的插件模块 (按文件路径缓存, 多个实例共享)
+_PLUGIN_MODULES: Dict[str, Any] = {}
+
+# 启动预算: 导入 main 模块允许的最长耗时 (毫秒)
+STARTUP_BUDGET_MS = 60
+
+# 这些依赖只允许在使用它们的命令中导入, 不应出现在启动路径上
+HEAVY_MODULES = ('psutil', 'requests', 'webbrowser', 'tarfile', 'zipfile',
+                 'urllib.request', 'subprocess', 'hashlib')
+
+
+def state_path(name: str) -> str:
+    """返回状态文件路径: 目录为 $SUPERSIM_HOME 或 ~/.supersim (写入前由调用方创建)"""
+    base = os.environ.get('SUPERSIM_HOME') or os.path.join(os.path.expanduser('~'), '.supersim')
+    return os.path.join(base, name)
+
+def module_available(name: str) -> bool:
+    """检查依赖包是否已安装 (只查找, 不导入)"""
+    import importlib.util
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+def _split_chain(line: str):
+    """按 ``;``、``&&``、``||`` 拆分命令行 (引号内的分隔符不拆分)
+
+    返回 [(前置运算符, 命令), ...], 第一条命令的运算符为 None。
+    """
+    segments = []
+    operator = None
+    current = []
+    quote = None
+    i = 0
+    n = len(line)
+    while i < n:
+        ch = line[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ('"', "'"):
+            quote = ch
+        elif ch == ';' or line.startswith('&&', i) or line.startswith('||', i):
+            token = ';' if ch == ';' else line[i:i + 2]
+            command = ''.join(current).strip()
+            if command:
+                segments.append((operator, command))
+            operator = token
+            current = []
+            i += len(token)
+            continue
+        current.append(ch)
+        i += 1
+    command = ''.join(current).strip()
+    if command:
+        segments.append((operator, command))
+    return segments
+
+def _split_pipeline(command: str):
+    """拆分管道与输出重定向 (引号内的 ``|`` 和 ``>`` 不拆分)
+
+    返回 (阶段列表, 重定向), 重定向为 None 或 (模式, 路径),
+    模式为 'w' (``>``) 或 'a' (``>>``)。
+    """
+    stages = []
+    redirect = None
+    current = []
+    quote = None
+    i = 0
+    n = len(command)
+    while i < n:
+        ch = command[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ('"', "'"):
+            quote = ch
+        elif ch == '|':
+            stages.append(''.join(current).strip())
+            current = []
+            i += 1
+            continue
+        elif ch == '>':
+            mode = 'a' if command.startswith('>>', i) else 'w'
+            stages.append(''.join(current).strip())
+            target = command[i + (2 if mode == 'a' else 1):].strip()
+            redirect = (mode, target.strip('"\''))
+            current = None
+            break
+        current.append(ch)
+        i += 1
+    if current is not None:
+        stages.append(''.join(current).strip())
+    return stages, redirect
+
+def _write_lines(out, lines, chunk_size: int = 65536):
+    """把行写入输出流: 攒成大块再写, 终端上则逐行刷新"""
+    if out.isatty():
+        for line in lines:
+            out.write(line + '\n')
+            out.flush()
+        return
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line) + 1
+        if size >= chunk_size:
+            buffer.append('')
+            out.write('\n'.join(buffer))
+            buffer = []
+            size = 0
+    if buffer:
+        buffer.append('')
+        out.write('\n'.join(buffer))
+
+class _OutputRouter:
+    """标准输出代理: 设置了捕获目标的线程写入各自的目标, 其余线程写入原始输出"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def _target(self):
+        return getattr(self._local, 'target', None) or self._stream
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def writelines(self, lines):
+        return self._target().writelines(lines)
+
+    def flush(self):
+        return self._target().flush()
+
+    def isatty(self):
+        return self._target().isatty()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class capture_output:
+    """把当前线程的 print 输出重定向到 target (不影响其他线程)"""
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        if not isinstance(sys.stdout, _OutputRouter):
+            sys.stdout = _OutputRouter(sys.stdout)
+        self._router = sys.stdout
+        self._previous = getattr(self._router._local, 'target', None)
+        self._router._local.target = self.target
+        return self.target
+
+    def __exit__(self, *exc_info):
+        self._router._local.target = self._previous
+        return False
+
+
+class CommandCancelled(BaseException):
+    """后台任务被 kill 时在检查点抛出 (继承 BaseException 以免被命令内的 except Exception 吞掉)"""
+
+
+class UsageError(ValueError):
+    """管道中的流式命令参数错误: 显示用法说明, 状态码 2 (与命令的 _usage 相同)"""
+
+
+class Job:
+    """后台任务: 命令、捕获的输出、耗时和退出码"""
+
+    def __init__(self, job_id: int, command: str):
+        import io
+        self.id = job_id
+        self.command = command
+        self.output = io.StringIO()
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.status = None
+        self.reported = False
+
+    @property
+    def state(self) -> str:
+        if self.future.cancelled():
+            return "已取消"
+        if self.finished is not None:
+            return "完成" if self.status == 0 else f"失败({self.status})"
+        if self.started is not None:
+            return "终止中" if self.cancel_event.is_set() else "运行中"
+        return "等待中"
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+class LatencyHistogram:
+    """对数分桶直方图: 每个 2 的幂区间分 4 个桶 (相对误差约 19%), 内存与样本数无关"""
+
+    SUB_BUCKETS = 4
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value_us: float):
+        import math
+        index = int(math.log2(value_us) * self.SUB_BUCKETS) if value_us >= 1 else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value_us
+        self.min = value_us if self.min is None else min(self.min, value_us)
+        self.max = value_us if self.max is None else max(self.max, value_us)
+
+    def percentile(self, p: float) -> float:
+        """返回第 p 百分位数的估计值 (桶上界, 不超过最大值)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(p / 100 * self.count)))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(2 ** ((index + 1) / self.SUB_BUCKETS), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum_us': round(self.total, 1),
+            'min_us': round(self.min or 0, 1),
+            'max_us': round(self.max or 0, 1),
+            'p50_us': round(self.percentile(50), 1),
+            'p95_us': round(self.percentile(95), 1),
+            'p99_us': round(self.percentile(99), 1),
+            'buckets': {str(k): v for k, v in sorted(self.buckets.items())},
+        }
+
+
+class CommandStats:
+    """单个命令的统计: 耗时/CPU 直方图、失败次数、读写字节数 (approximate 为有其他线程同时运行的次数)"""
+
+    def __init__(self):
+        self.wall = LatencyHistogram()
+        self.cpu = LatencyHistogram()
+        self.failures = 0
+        self.approximate = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'wall': self.wall.to_dict(),
+            'cpu': self.cpu.to_dict(),
+            'failures': self.failures,
+            'approximate': self.approximate,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+        }
+
+
+def _read_io_counters():
+    """读取进程累计读写字节数 (仅 Linux 的 /proc/self/io 可用, 否则返回 None)
+
+    返回 (rchar, wchar, 本次读取 /proc/self/io 的字节数)。
+    """
+    try:
+        with open('/proc/self/io', 'rb') as f:
+            data = f.read()
+        fields = dict(line.split(b':', 1) for line in data.splitlines())
+        return int(fields[b'rchar']), int(fields[b'wchar']), len(data)
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class concurrent_work:
+    """标记当前线程正在执行一段与交互命令并发的工作 (后台任务、守护进程会话中的一行命令)
+
+    ResourceSample 据此判断进程级的 CPU/IO 计数中是否混入了其他工作; 空闲的线程池线程、
+    定时落盘的 Timer 等不算。同一线程中嵌套时只计一次。
+    """
+
+    _lock = threading.Lock()
+    _local = threading.local()
+    running = 0
+    started = 0
+
+    def __enter__(self):
+        depth = getattr(self._local, 'depth', 0)
+        if not depth:
+            with self._lock:
+                concurrent_work.running += 1
+                concurrent_work.started += 1
+        self._local.depth = depth + 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._local.depth -= 1
+        if not self._local.depth:
+            with self._lock:
+                concurrent_work.running -= 1
+        return False
+
+    @classmethod
+    def others(cls) -> int:
+        """其他线程中正在运行的工作数"""
+        return cls.running - (1 if getattr(cls._local, 'depth', 0) else 0)
+
+
+class ResourceSample:
+    """记录开始时刻的耗时/CPU/IO 计数, 用于计算一次命令执行的资源消耗
+
+    process_time 和 /proc/self/io 都按整个进程累计, 没有其他工作同时运行时才完全属于这条命令 (含它自己的工作线程)。
+    开始时已有其他后台任务或会话中的命令在运行时, CPU 改用本线程的 thread_time;
+    期间有其他工作运行时 IO (以及开始后才并发时的 CPU) 含其他工作的部分: shared 为 True, 都只是近似值。
+    """
+
+    def __init__(self):
+        self.started = concurrent_work.started
+        self.shared = concurrent_work.others() > 0
+        self.clock = time.thread_time if self.shared else time.process_time
+        self.io = _read_io_counters()
+        self.cpu = self.clock()
+        self.wall = time.perf_counter()
+
+    def finish(self):
+        """返回 (耗时秒, CPU 秒, 读取字节或 None, 写入字节或 None)"""
+        wall = time.perf_counter() - self.wall
+        cpu = self.clock() - self.cpu
+        self.shared = self.shared or concurrent_work.others() > 0 or concurrent_work.started != self.started
+        io = _read_io_counters() if self.io is not None else None
+        if io is None:
+            return wall, cpu, None, None
+        # 扣除开始时读取 /proc/self/io 本身计入的字节
+        return wall, cpu, io[0] - self.io[0] - self.io[2], io[1] - self.io[1]
+
+class UserDataStore:
+    """用户数据的写后持久化
+
+    修改先追加到日志文件 (user_data.json.journal), 累计 FLUSH_EVERY 条或
+    FLUSH_INTERVAL 秒后批量落盘; 日志超过 COMPACT_BYTES 时写入临时文件并
+    原子重命名为 user_data.json, 再清空日志。快照中的 _journal_seq 记录已合并的
+    日志序号, 因此在重命名与清空日志之间崩溃也不会重复累加。
+    """
+
+    FLUSH_EVERY = 32
+    FLUSH_INTERVAL = 2.0
+    COMPACT_BYTES = 64 * 1024
+
+    _instances: Dict[str, 'UserDataStore'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str, defaults: Optional[Dict[str, Any]] = None):
+        self.path = os.path.abspath(path)
+        self.journal_path = self.path + '.journal'
+        self.data: Dict[str, Any] = dict(defaults or {})
+        self._seq = 0
+        self._pending: List[str] = []
+        self._journal_size = 0
+        self._timer = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(cls, path: str, defaults: Optional[Dict[str, Any]] = None) -> 'UserDataStore':
+        """打开 (或复用) 指定路径的存储, 同一进程内的多个会话共享一个实例"""
+        path = os.path.abspath(path)
+        with cls._instances_lock:
+            store = cls._instances.get(path)
+            if store is None:
+                store = cls._instances[path] = cls(path, defaults)
+                store.load()
+                import atexit
+                atexit.register(store._close_at_exit)
+            else:
+                for key, value in (defaults or {}).items():
+                    store.data.setdefault(key, value)
+            return store
+
+    def load(self):
+        """读取快照并重放日志中尚未合并的记录"""
+        with self._lock:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+                self._seq = snapshot.pop('_journal_seq', 0)
+                self.data.update(snapshot)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                print(f"⚠️  用户数据文件损坏, 已忽略: {e}", file=sys.stderr)
+            try:
+                with open(self.journal_path, 'rb') as f:
+                    raw = f.read()
+            except FileNotFoundError:
+                return
+            self._journal_size = len(raw)
+            for line in raw.splitlines():
+                try:
+                    seq, op, key, value = json.loads(line)
+                except ValueError:
+                    continue  # 崩溃时写了一半的最后一行
+                if seq <= self._seq:
+                    continue
+                self._apply(op, key, value)
+                self._seq = seq
+
+    def _apply(self, op: str, key: str, value):
+        if op == 'incr':
+            self.data[key] = self.data.get(key, 0) + value
+        else:
+            self.data[key] = value
+
+    def _record(self, op: str, key: str, value):
+        with self._lock:
+            self._apply(op, key, value)
+            self._seq += 1
+            self._pending.append(json.dumps([self._seq, op, key, value], ensure_ascii=False))
+            if len(self._pending) >= self.FLUSH_EVERY:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.FLUSH_INTERVAL, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def incr(self, key: str, amount: int = 1):
+        """累加计数器"""
+        self._record('incr', key, amount)
+
+    def __setitem__(self, key: str, value):
+        self._record('set', key, value)
+
+    def __getitem__(self, key: str):
+        return self.data[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+
+    def flush(self):
+        """把待写记录追加到日志; 日志过大时合并为快照"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._pending:
+                chunk = ('\n'.join(self._pending) + '\n').encode('utf-8')
+                with open(self.journal_path, 'ab') as f:
+                    f.write(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._pending = []
+                self._journal_size += len(chunk)
+            if self._journal_size > self.COMPACT_BYTES:
+                self.compact()
+
+    def compact(self):
+        """写临时文件后原子替换快照, 然后清空日志"""
+        with self._lock:
+            snapshot = dict(self.data)
+            snapshot['_journal_seq'] = self._seq
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            try:
+                os.remove(self.journal_path)
+            except FileNotFoundError:
+                pass
+            self._journal_size = 0
+
+    def close(self):
+        """退出时落盘: 有改动时合并为快照"""
+        with self._lock:
+            if self._pending or self._journal_size:
+                self.flush()
+                self.compact()
+
+    def _close_at_exit(self):
+        try:
+            self.close()
+        except OSError as e:
+            print(f"⚠️  保存用户数据失败: {e}", file=sys.stderr)
+
+class HistoryStore:
+    """持久化命令历史 (SQLite)
+
+    history 表按顺序记录每次执行, commands 表对不同的命令去重并维护
+    使用次数和最近一次的编号, commands_fts 为 commands 的 trigram 全文索引,
+    因此子串搜索只需查索引, 不随历史条数线性增长。内存中只保留最近
+    RING_SIZE 条。数据库在首次使用时才打开。
+    """
+
+    RING_SIZE = 1000
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS commands (
+            id INTEGER PRIMARY KEY,
+            command TEXT NOT NULL UNIQUE,
+            count INTEGER NOT NULL DEFAULT 0,
+            last_id INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS commands_count ON commands(count);
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            command_id INTEGER NOT NULL REFERENCES commands(id)
+        );
+    """
+
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS commands_fts
+            USING fts5(command, content='commands', content_rowid='id', tokenize='trigram');
+        CREATE TRIGGER IF NOT EXISTS commands_fts_insert AFTER INSERT ON commands BEGIN
+            INSERT INTO commands_fts(rowid, command) VALUES (new.id, new.command);
+        END;
+    """
+
+    _instances: Dict[str, 'HistoryStore'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        import collections
+        self.path = path
+        self.recent = collections.deque(maxlen=self.RING_SIZE)
+        self._db = None
+        self._fts = False
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(cls, path: str) -> 'HistoryStore':
+        """打开 (或复用) 指定路径的历史记录, 同一进程内的多个会话共享一个实例"""
+        with cls._instances_lock:
+            store = cls._instances.get(path)
+            if store is None:
+                store = cls._instances[path] = cls(path)
+            return store
+
+    def _connect(self):
+        if self._db is not None:
+            return self._db
+        import sqlite3
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️  无法打开历史记录, 本次会话的历史不会保存: {e}", file=sys.stderr)
+            db = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(self.SCHEMA)
+        try:
+            db.executescript(self.FTS_SCHEMA)
+            self._fts = True
+        except sqlite3.OperationalError:
+            self._fts = False  # SQLite 未编译 FTS5 时退回 LIKE 搜索
+        rows = db.execute(
+            "SELECT h.id, c.command FROM history h JOIN commands c ON c.id = h.command_id "
+            "ORDER BY h.id DESC LIMIT ?", (self.RING_SIZE,)).fetchall()
+        self.recent.extend(reversed(rows))
+        self._db = db
+        return db
+
+    def append(self, command: str) -> int:
+        """记录一条命令, 返回其历史编号"""
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN")
+            try:
+                row = db.execute("SELECT id FROM commands WHERE command = ?", (command,)).fetchone()
+                if row is None:
+                    command_id = db.execute("INSERT INTO commands(command) VALUES (?)", (command,)).lastrowid
+                else:
+                    command_id = row[0]
+                entry_id = db.execute("INSERT INTO history(ts, command_id) VALUES (?, ?)",
+                                      (time.time(), command_id)).lastrowid
+                db.execute("UPDATE commands SET count = count + 1, last_id = ? WHERE id = ?",
+                           (entry_id, command_id))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            self.recent.append((entry_id, command))
+            return entry_id
+
+    def last(self, count: int = 20):
+        """最近的 count 条 [(编号, 命令)]"""
+        with self._lock:
+            self._connect()
+            return list(self.recent)[-count:]
+
+    def get(self, entry_id: int) -> Optional[str]:
+        """按编号取命令"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT c.command FROM history h JOIN commands c ON c.id = h.command_id WHERE h.id = ?",
+                (entry_id,)).fetchone()
+            return row[0] if row else None
+
+    def find_prefix(self, prefix: str) -> Optional[str]:
+        """以 prefix 开头的最近一条命令 (利用 command 上的唯一索引做范围查询)"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT command FROM commands WHERE command >= ? AND command < ? "
+                "ORDER BY last_id DESC LIMIT 1", (prefix, prefix + '\U0010ffff')).fetchone()
+            return row[0] if row else None
+
+    def search(self, text: str, limit: int = 20):
+        """子串搜索 (不区分大小写), 按使用次数和最近使用排序, 返回 [(命令, 次数, 最近编号)]"""
+        with self._lock:
+            db = self._connect()
+            if self._fts and len(text) >= 3:
+                query = '"' + text.replace('"', '""') + '"'
+                return db.execute(
+                    "SELECT c.command, c.count, c.last_id FROM commands_fts f "
+                    "JOIN commands c ON c.id = f.rowid WHERE commands_fts MATCH ? "
+                    "ORDER BY c.count DESC, c.last_id DESC LIMIT ?", (query, limit)).fetchall()
+            pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            return db.execute(
+                "SELECT command, count, last_id FROM commands WHERE command LIKE ? ESCAPE '\\' "
+                "ORDER BY count DESC, last_id DESC LIMIT ?", (pattern, limit)).fetchall()
+
+    def top(self, limit: int = 20):
+        """使用次数最多的命令 [(命令, 次数)]"""
+        with self._lock:
+            return self._connect().execute(
+                "SELECT command, count FROM commands ORDER BY count DESC LIMIT ?", (limit,)).fetchall()
+
+    def expand(self, command: str) -> Optional[str]:
+        """展开 !! / !n / !-n / !前缀, 找不到时返回 None"""
+        ref = command[1:]
+        if ref == '!':
+            recent = self.last(1)
+            return recent[0][1] if recent else None
+        if ref.isdigit():
+            return self.get(int(ref))
+        if ref.startswith('-') and ref[1:].isdigit():
+            recent = self.last(int(ref[1:]))
+            return recent[0][1] if len(recent) == int(ref[1:]) else None
+        return self.find_prefix(ref) if ref else None
+
+def _path_range(root: str):
+    """root 及其下所有路径的 SQL 条件和参数 (可利用 path 列上的索引做范围查询)"""
+    prefix = root if root.endswith(os.sep) else root + os.sep
+    return ("(path = ? OR (path >= ? AND path < ?))",
+            (root, prefix, prefix[:-1] + chr(ord(os.sep) + 1)))
+
+
+def _format_age(seconds: float) -> str:
+    """把秒数格式化为 '3 分钟' 这样的时长"""
+    for unit, name in ((86400, '天'), (3600, '小时'), (60, '分钟')):
+        if seconds >= unit:
+            return f"{int(seconds // unit)} {name}"
+    return f"{int(seconds)} 秒"
+
+
+class SizeCache:
+    """size 命令的目录缓存 (SQLite)
+
+    每个目录一行: 目录 mtime、直接包含的文件的表观/占用大小和文件数、子目录名,
+    以及链接数大于 1 的文件 (设备, inode, 大小), 后者汇总时全局去重。
+    目录 mtime 未变时直接复用该行, 只需 stat 目录本身而不必扫描其中的文件。
+    注意文件原地改写不会改变目录 mtime, 需要时用 size --fresh 重新扫描。
+    """
+
+    # mtime 在扫描前 RACY_NS 纳秒内的目录不缓存 (文件系统时间戳精度有限)
+    RACY_NS = 2 * 10 ** 9
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS dirs (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            apparent INTEGER NOT NULL,
+            allocated INTEGER NOT NULL,
+            files INTEGER NOT NULL,
+            subdirs TEXT NOT NULL,
+            links TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    _instances: Dict[str, 'SizeCache'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str) -> 'SizeCache':
+        """打开 (或复用) 指定路径的缓存"""
+        with cls._instances_lock:
+            cache = cls._instances.get(path)
+            if cache is None:
+                cache = cls._instances[path] = cls(path)
+            return cache
+
+    def _connect(self):
+        if self._db is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(self.SCHEMA)
+            self._db = db
+        return self._db
+
+    def load(self, root: str) -> Dict[str, tuple]:
+        """读取 root 下所有目录的缓存记录 {路径: (mtime_ns, 表观, 占用, 文件数, 子目录, 多链接文件)}"""
+        where, params = _path_range(root)
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT path, mtime_ns, apparent, allocated, files, subdirs, links FROM dirs WHERE {where}",
+                params).fetchall()
+        return {path: (mtime_ns, apparent, allocated, files,
+                       subdirs.split('\0') if subdirs else [], [tuple(link) for link in json.loads(links)])
+                for path, mtime_ns, apparent, allocated, files, subdirs, links in rows}
+
+    def save(self, changed: Dict[str, tuple], removed=()):
+        """写入重新扫描过的目录, 删除已不存在的目录"""
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN")
+            try:
+                db.executemany("DELETE FROM dirs WHERE path = ?", ((path,) for path in removed))
+                db.executemany(
+                    "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((path, r[0], r[1], r[2], r[3], '\0'.join(r[4]), json.dumps(r[5]))
+                     for path, r in changed.items()))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+
+def _scan_usage_dir(path: str, cached: Optional[tuple]):
+    """统计单个目录直接包含的文件 (在线程池中运行), 返回 (记录, 是否重新扫描)
+
+    目录 mtime 与缓存一致时直接返回缓存记录。符号链接按链接本身计算, 不跟随。
+    """
+    mtime_ns = os.stat(path).st_mtime_ns
+    if cached is not None and cached[0] == mtime_ns:
+        return cached, False
+    apparent = allocated = files = 0
+    subdirs = []
+    links = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            # Windows 没有 st_blocks, 占用大小按表观大小计算
+            blocks = getattr(st, 'st_blocks', None)
+            used = blocks * 512 if blocks is not None else st.st_size
+            files += 1
+            if st.st_nlink > 1:
+                links.append((st.st_dev, st.st_ino, st.st_size, used))
+            else:
+                apparent += st.st_size
+                allocated += used
+    return (mtime_ns, apparent, allocated, files, subdirs, links), True
+
+
+def disk_usage(root: str, cache: Optional[SizeCache] = None, fresh: bool = False,
+               workers: int = None, check_cancelled=None) -> Dict[str, int]:
+    """并行统计目录树的磁盘用量, 每个 inode 只计一次
+
+    各目录在线程池中并发扫描; 提供 cache 时复用 mtime 未变的目录记录
+    (fresh 为真时忽略已有记录), 并把重新扫描的结果写回缓存。
+    返回 apparent、allocated、files、dirs、scanned (重新扫描的目录数) 和 errors。
+    """
+    import queue
+    from concurrent.futures import ThreadPoolExecutor
+    root = os.path.abspath(root)
+    started = time.time_ns()
+    cached = cache.load(root) if cache is not None else {}
+    lookup = {} if fresh else cached
+    results = queue.Queue()
+    seen = set()
+    changed = {}
+    visited = set()
+    totals = {'apparent': 0, 'allocated': 0, 'files': 0, 'dirs': 0, 'scanned': 0, 'errors': 0}
+
+    pool = ThreadPoolExecutor(max_workers=workers or SCAN_WORKERS, thread_name_prefix='size')
+
+    def submit(path):
+        future = pool.submit(_scan_usage_dir, path, lookup.get(path))
+        future.add_done_callback(lambda f: results.put((path, f)))
+
+    try:
+        submit(root)
+        outstanding = 1
+        while outstanding:
+            path, future = results.get()
+            outstanding -= 1
+            if check_cancelled is not None:
+                check_cancelled()
+            try:
+                record, scanned = future.result()
+            except OSError:
+                totals['errors'] += 1
+                continue
+            visited.add(path)
+            if scanned:
+                totals['scanned'] += 1
+                # mtime 距扫描开始太近的目录可能在同一时钟粒度内再次被修改, 不写入缓存
+                if record[0] < started - SizeCache.RACY_NS:
+                    changed[path] = record
+            _, apparent, allocated, files, subdirs, links = record
+            totals['dirs'] += 1
+            totals['files'] += files
+            totals['apparent'] += apparent
+            totals['allocated'] += allocated
+            for dev, ino, size, used in links:
+                if (dev, ino) not in seen:
+                    seen.add((dev, ino))
+                    totals['apparent'] += size
+                    totals['allocated'] += used
+            for name in subdirs:
+                submit(os.path.join(path, name))
+                outstanding += 1
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    totals['dirs'] = max(0, totals['dirs'] - 1)  # 不计根目录本身
+    if cache is not None and (changed or len(cached) > len(visited)):
+        cache.save(changed, [path for path in cached if path not in visited])
+    return totals
+
+class FsIndex:
+    """文件系统元数据索引 (SQLite, 由 index build 手动建立)
+
+    entries 表记录每个文件和目录的路径、大小、占用、mtime 和 inode;
+    文件行的 files 为 1, 目录行的 size/allocated/files/dirs 为整个子树的汇总,
+    因此统计目录大小只需读一行。entries_fts 为文件名的 trigram 索引, 在每次建立或
+    刷新结束时批量写入新行 (逐行触发器写入要慢一个数量级)。
+    刷新时只重新扫描 mtime 变化的目录, 与 SizeCache 一样不检测文件的原地改写,
+    也不对硬链接去重。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL UNIQUE,
+            parent TEXT NOT NULL,
+            name TEXT NOT NULL,
+            is_dir INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            allocated INTEGER NOT NULL,
+            files INTEGER NOT NULL,
+            dirs INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_parent ON entries(parent, name);
+        CREATE TABLE IF NOT EXISTS roots (
+            path TEXT PRIMARY KEY,
+            built REAL NOT NULL,
+            refreshed REAL NOT NULL
+        );
+    """
+
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts
+            USING fts5(name, content='entries', content_rowid='id', tokenize='trigram');
+    """
+
+    INSERT = ("INSERT INTO entries(path, parent, name, is_dir, size, allocated, files, dirs, mtime_ns, inode) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+    _instances: Dict[str, 'FsIndex'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._fts = False
+        self._fts_mark = 0
+        self._skipped = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(cls, path: str) -> 'FsIndex':
+        """打开 (或复用) 指定路径的索引"""
+        with cls._instances_lock:
+            index = cls._instances.get(path)
+            if index is None:
+                index = cls._instances[path] = cls(path)
+            return index
+
+    def _connect(self):
+        if self._db is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(self.SCHEMA)
+            try:
+                db.executescript(self.FTS_SCHEMA)
+                self._fts = True
+            except sqlite3.OperationalError:
+                self._fts = False  # 未编译 FTS5 时 find 退回 LIKE 查询
+            self._db = db
+        return self._db
+
+    # ---------- 查询 ----------
+
+    def roots(self):
+        """已建立索引的根目录 [(路径, 建立时间, 刷新时间)]; 索引文件不存在时不创建"""
+        with self._lock:
+            if self._db is None and not os.path.exists(self.path):
+                return []
+            return self._connect().execute("SELECT path, built, refreshed FROM roots ORDER BY path").fetchall()
+
+    def root_for(self, path: str):
+        """包含 path 的索引根目录 (路径, 建立时间, 刷新时间), 没有时返回 None"""
+        for root in self.roots():
+            prefix = root[0] if root[0].endswith(os.sep) else root[0] + os.sep
+            if path == root[0] or path.startswith(prefix):
+                return root
+        return None
+
+    def lookup(self, path: str):
+        """(是否目录, 大小, 占用, 文件数, 目录数), 未收录时返回 None"""
+        with self._lock:
+            return self._connect().execute(
+                "SELECT is_dir, size, allocated, files, dirs FROM entries WHERE path = ?", (path,)).fetchone()
+
+    def children(self, path: str, dirs_only: bool = False, sizes: bool = False):
+        """按名称排序的子项, 格式与 SuperCommandLineSystem._scan_tree_dir 相同"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT name, is_dir, size FROM entries WHERE parent = ?"
+                + (" AND is_dir = 1" if dirs_only else "") + " ORDER BY name", (path,)).fetchall()
+        return [(name, bool(is_dir), bool(is_dir), size if sizes and not is_dir else None)
+                for name, is_dir, size in rows], False
+
+    def find(self, directory: str, pattern: str):
+        """directory 下文件名包含 pattern (不区分大小写) 的文件路径, 按路径排序"""
+        where, params = _path_range(directory)
+        with self._lock:
+            db = self._connect()
+            if self._fts and len(pattern) >= 3:
+                query = '"' + pattern.replace('"', '""') + '"'
+                return [row[0] for row in db.execute(
+                    f"SELECT path FROM entries_fts JOIN entries ON entries.id = entries_fts.rowid "
+                    f"WHERE entries_fts MATCH ? AND is_dir = 0 AND {where} ORDER BY path",
+                    (query, *params))]
+            like = '%' + pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            return [row[0] for row in db.execute(
+                f"SELECT path FROM entries WHERE name LIKE ? ESCAPE '\\' AND is_dir = 0 AND {where} "
+                f"ORDER BY path", (like, *params))]
+
+    def changed_dirs(self, root: str) -> int:
+        """root 下 mtime 与索引不一致 (或已删除) 的目录数"""
+        where, params = _path_range(root)
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT path, mtime_ns FROM entries WHERE is_dir = 1 AND {where}", params).fetchall()
+        changed = 0
+        for path, mtime_ns in rows:
+            try:
+                changed += os.stat(path).st_mtime_ns != mtime_ns
+            except OSError:
+                changed += 1
+        return changed
+
+    # ---------- 建立和刷新 ----------
+
+    @staticmethod
+    def _row(path, parent, name, st, is_dir, started):
+        """构造 entries 行; 路径无法以 UTF-8 存储时返回 None"""
+        try:
+            path.encode('utf-8')
+        except UnicodeEncodeError:
+            return None
+        if is_dir:
+            # mtime 距扫描开始太近的目录记为 0, 下次刷新时一定重新扫描
+            mtime_ns = st.st_mtime_ns if st.st_mtime_ns < started - SizeCache.RACY_NS else 0
+            return (path, parent, name, 1, 0, 0, 0, 0, mtime_ns, st.st_ino)
+        blocks = getattr(st, 'st_blocks', None)
+        used = blocks * 512 if blocks is not None else st.st_size
+        return (path, parent, name, 0, st.st_size, used, 1, 0, st.st_mtime_ns, st.st_ino)
+
+    def _scan_into(self, db, path, started):
+        """插入 path 的直接子项, 返回 (子目录路径列表, 直接文件的 [大小, 占用, 文件数, 目录数])"""
+        rows = []
+        subdirs = []
+        totals = [0, 0, 0, 0]
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    row = self._row(entry.path, path, entry.name, st, is_dir, started)
+                    if row is None:
+                        self._skipped += 1
+                        continue
+                    rows.append(row)
+                    if is_dir:
+                        subdirs.append(entry.path)
+                    else:
+                        totals[0] += row[4]
+                        totals[1] += row[5]
+                        totals[2] += 1
+        except OSError:
+            pass
+        db.executemany(self.INSERT, rows)
+        return subdirs, totals
+
+    def _insert_subtree(self, db, top, started, check_cancelled=None):
+        """扫描并插入 top 以下的整个子树 (top 本身的行已存在), 自底向上写入各目录的汇总"""
+        stack = [[top, *self._scan_into(db, top, started)]]
+        visited = 0
+        while True:
+            frame = stack[-1]
+            if frame[1]:
+                child = frame[1].pop()
+                visited += 1
+                if check_cancelled is not None and not visited & 255:
+                    check_cancelled()
+                stack.append([child, *self._scan_into(db, child, started)])
+                continue
+            stack.pop()
+            db.execute("UPDATE entries SET size = ?, allocated = ?, files = ?, dirs = ? WHERE path = ?",
+                       (*frame[2], frame[0]))
+            if not stack:
+                return frame[2]
+            parent = stack[-1][2]
+            for i in range(4):
+                parent[i] += frame[2][i]
+            parent[3] += 1
+
+    def _delete_subtree(self, db, path):
+        where, params = _path_range(path)
+        if self._fts:
+            # 本次事务中新插入的行 (id 大于标记) 尚未写入全文索引
+            db.execute(f"INSERT INTO entries_fts(entries_fts, rowid, name) SELECT 'delete', id, name "
+                       f"FROM entries WHERE id <= ? AND {where}", (self._fts_mark, *params))
+        db.execute(f"DELETE FROM entries WHERE {where}", params)
+
+    def _begin(self, db):
+        """开始写事务, 记下当前最大 id (AUTOINCREMENT 保证新行的 id 更大)"""
+        db.execute("BEGIN")
+        self._fts_mark = db.execute("SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0]
+
+    def _commit(self, db):
+        """把本次事务新插入的行批量写入全文索引后提交"""
+        if self._fts:
+            db.execute("INSERT INTO entries_fts(rowid, name) SELECT id, name FROM entries WHERE id > ?",
+                       (self._fts_mark,))
+        db.execute("COMMIT")
+
+    def _rescan_dir(self, db, path, st, started):
+        """重新扫描 mtime 变化的目录: 增删子项, 更新文件元数据, 新目录整棵插入"""
+        existing = dict(db.execute("SELECT name, is_dir FROM entries WHERE parent = ?", (path,)))
+        seen = set()
+        rows = []
+        updates = []
+        new_dirs = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        entry_st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    row = self._row(entry.path, path, entry.name, entry_st, is_dir, started)
+                    if row is None:
+                        self._skipped += 1
+                        continue
+                    seen.add(entry.name)
+                    old = existing.get(entry.name)
+                    if old is not None and bool(old) == is_dir:
+                        if not is_dir:
+                            updates.append((row[4], row[5], row[8], row[9], entry.path))
+                        continue
+                    if old is not None:
+                        self._delete_subtree(db, entry.path)
+                    rows.append(row)
+                    if is_dir:
+                        new_dirs.append(entry.path)
+        except OSError:
+            return
+        for name in existing.keys() - seen:
+            self._delete_subtree(db, os.path.join(path, name))
+        db.executemany(self.INSERT, rows)
+        db.executemany("UPDATE entries SET size = ?, allocated = ?, mtime_ns = ?, inode = ? WHERE path = ?",
+                       updates)
+        for new_dir in new_dirs:
+            self._insert_subtree(db, new_dir, started)
+        mtime_ns = st.st_mtime_ns if st.st_mtime_ns < started - SizeCache.RACY_NS else 0
+        db.execute("UPDATE entries SET mtime_ns = ? WHERE path = ?", (mtime_ns, path))
+
+    def _update_totals(self, db, root, affected):
+        """重新汇总受影响目录及其祖先 (由深到浅) 的子树大小"""
+        pending = set()
+        for path in affected:
+            while path not in pending:
+                pending.add(path)
+                if path == root or not path.startswith(root):
+                    break
+                path = os.path.dirname(path)
+        for path in sorted(pending, key=lambda p: -p.count(os.sep)):
+            db.execute(
+                "UPDATE entries SET (size, allocated, files, dirs) = "
+                "(SELECT COALESCE(SUM(size), 0), COALESCE(SUM(allocated), 0), COALESCE(SUM(files), 0), "
+                "COALESCE(SUM(dirs) + SUM(is_dir), 0) FROM entries WHERE parent = ?) WHERE path = ?",
+                (path, path))
+
+    def build(self, root: str, check_cancelled=None, stats: Optional[Dict[str, int]] = None):
+        """(重新) 建立 root 的索引, 返回 [大小, 占用, 文件数, 目录数]
+
+        stats['skipped'] 为路径无法以 UTF-8 存储而未加入索引的项数 (跳过的目录不再向下扫描)。
+        """
+        started = time.time_ns()
+        with self._lock:
+            self._skipped = 0
+            db = self._connect()
+            self._begin(db)
+            try:
+                where, params = _path_range(root)
+                self._delete_subtree(db, root)
+                db.execute(f"DELETE FROM roots WHERE {where}", params)
+                db.execute(self.INSERT, self._row(root, os.path.dirname(root), os.path.basename(root),
+                                                  os.stat(root), True, started))
+                totals = self._insert_subtree(db, root, started, check_cancelled)
+                now = time.time()
+                db.execute("INSERT INTO roots VALUES (?, ?, ?)", (root, now, now))
+                self._commit(db)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            if stats is not None:
+                stats['skipped'] = self._skipped
+        return totals
+
+    def refresh(self, root: str, check_cancelled=None) -> Dict[str, int]:
+        """增量刷新 root: 只重新扫描 mtime 变化的目录, 返回检查、重新扫描和删除的目录数及跳过的项数"""
+        started = time.time_ns()
+        result = {'checked': 0, 'rescanned': 0, 'removed': 0, 'skipped': 0}
+        with self._lock:
+            self._skipped = 0
+            db = self._connect()
+            where, params = _path_range(root)
+            dirs = db.execute(f"SELECT path, mtime_ns FROM entries WHERE is_dir = 1 AND {where} ORDER BY path",
+                              params).fetchall()
+            self._begin(db)
+            try:
+                affected = set()
+                # 已删除的目录: 按路径排序时子目录不一定紧跟在父目录之后 (a/b、a/b-x、a/b/x),
+                # 因此逐级检查祖先是否已删除, 而不是只记住最近删除的一个
+                gone = set()
+
+                def removed_ancestor(path):
+                    while len(path) > len(root):
+                        path = os.path.dirname(path)
+                        if path in gone:
+                            return True
+                    return False
+
+                for path, mtime_ns in dirs:
+                    if gone and removed_ancestor(path):
+                        continue
+                    result['checked'] += 1
+                    if check_cancelled is not None and not result['checked'] & 255:
+                        check_cancelled()
+                    try:
+                        st = os.stat(path)
+                        exists = os.path.isdir(path)
+                    except OSError:
+                        exists = False
+                    if not exists:
+                        self._delete_subtree(db, path)
+                        result['removed'] += 1
+                        if path == root:
+                            db.execute("DELETE FROM roots WHERE path = ?", (root,))
+                            break
+                        affected.add(os.path.dirname(path))
+                        gone.add(path)
+                        continue
+                    if st.st_mtime_ns != mtime_ns:
+                        self._rescan_dir(db, path, st, started)
+                        affected.add(path)
+                        result['rescanned'] += 1
+                else:
+                    self._update_totals(db, root, affected)
+                    db.execute("UPDATE roots SET refreshed = ? WHERE path = ?", (time.time(), root))
+                self._commit(db)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            result['skipped'] = self._skipped
+        return result
+
+    def drop(self, root: str):
+        """删除 root 的索引"""
+        with self._lock:
+            db = self._connect()
+            self._begin(db)
+            self._delete_subtree(db, root)
+            db.execute("DELETE FROM roots WHERE path = ?", (root,))
+            self._commit(db)
+
+# 每次 copy_file_range/sendfile/读写调用的最大字节数, 也是复制时取消检查和进度更新的粒度
+COPY_CHUNK = 8 * 1024 * 1024
+
+# 这些错误表示当前零拷贝方式不可用 (跨文件系统、内核或文件系统不支持), 换下一种方式重试
+_COPY_FALLBACK_ERRNOS = frozenset(
+    getattr(errno, name) for name in ('EXDEV', 'ENOSYS', 'EINVAL', 'EOPNOTSUPP', 'ENOTSUP',
+                                      'ENOTSOCK', 'EBADF', 'EPERM') if hasattr(errno, name))
+
+_O_BINARY = getattr(os, 'O_BINARY', 0)
+
+
+def _copy_data(fsrc: int, fdst: int, offset: int, length: int, advance, checkpoint=None) -> int:
+    """把 fsrc 中从 offset 开始的 length 字节写到 fdst 的相同位置, 返回实际复制的字节数
+
+    依次尝试 os.copy_file_range (在内核中复制, 部分文件系统直接共享数据块)、
+    os.sendfile 和普通读写; 某种方式失败或提前返回 0 时退回下一种。
+    """
+    methods = [name for name in ('copy_file_range', 'sendfile') if hasattr(os, name)]
+    pos = offset
+    end = offset + length
+    while pos < end:
+        if checkpoint is not None:
+            checkpoint()
+        count = min(COPY_CHUNK, end - pos)
+        method = methods[0] if methods else None
+        try:
+            if method == 'copy_file_range':
+                sent = os.copy_file_range(fsrc, fdst, count, pos, pos)
+            elif method == 'sendfile':
+                os.lseek(fdst, pos, os.SEEK_SET)
+                sent = os.sendfile(fdst, fsrc, pos, count)
+            else:
+                os.lseek(fsrc, pos, os.SEEK_SET)
+                data = os.read(fsrc, count)
+                os.lseek(fdst, pos, os.SEEK_SET)
+                sent = os.write(fdst, data) if data else 0
+        except OSError as e:
+            if method is None or e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+            methods.pop(0)
+            continue
+        if not sent:
+            if method is None:
+                break  # 源文件在复制过程中变短
+            methods.pop(0)
+            continue
+        pos += sent
+        advance(sent)
+    return pos - offset
+
+
+def _file_digest(path: str) -> bytes:
+    """文件内容的 BLAKE2b 摘要 (copy --hash 判断文件是否相同)"""
+    import hashlib
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def _resumable(fsrc: int, part: str, part_st, st) -> bool:
+    """中断复制留下的 .part 文件能否接着写: 不比源文件长、写于源文件最后修改之后, 且末尾内容一致"""
+    if not 0 < part_st.st_size <= st.st_size or part_st.st_mtime_ns < st.st_mtime_ns:
+        return False
+    tail = min(part_st.st_size, 64 * 1024)
+    with open(part, 'rb') as f:
+        f.seek(part_st.st_size - tail)
+        written = f.read(tail)
+    os.lseek(fsrc, part_st.st_size - tail, os.SEEK_SET)
+    return os.read(fsrc, tail) == written
+
+
+def _copy_file(src: str, dst: str, st, mode: str, advance, checkpoint=None) -> str:
+    """复制单个文件 (在线程池中运行), 返回 'copied'、'resumed' 或 'skipped'
+
+    mode 为 'mtime' 时目标大小和修改时间 (精确到秒) 都与源文件相同则跳过, 为 'hash' 时
+    大小相同再比较内容摘要, 为 'force' 时总是复制。数据先写入 目标.part, 完成后复制
+    权限和时间戳再原子地改名为目标; 中断后留下的 .part 仍与源文件吻合时从断点继续。
+    """
+    if mode != 'force':
+        try:
+            dst_st = os.stat(dst)
+        except FileNotFoundError:
+            dst_st = None
+        if dst_st is not None and dst_st.st_size == st.st_size:
+            if mode == 'hash':
+                same = _file_digest(src) == _file_digest(dst)
+                if same and dst_st.st_mtime_ns != st.st_mtime_ns:
+                    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+            else:
+                same = int(dst_st.st_mtime) == int(st.st_mtime)
+            if same:
+                advance(st.st_size, False)
+                return 'skipped'
+
+    part = dst + '.part'
+    fsrc = os.open(src, os.O_RDONLY | _O_BINARY)
+    try:
+        offset = 0
+        try:
+            part_st = os.stat(part)
+        except FileNotFoundError:
+            part_st = None
+        if part_st is not None and mode != 'force' and _resumable(fsrc, part, part_st, st):
+            offset = part_st.st_size
+        flags = os.O_WRONLY | os.O_CREAT | _O_BINARY | (0 if offset else os.O_TRUNC)
+        fdst = os.open(part, flags, 0o666)
+        try:
+            advance(offset, False)
+            _copy_data(fsrc, fdst, offset, st.st_size - offset, advance, checkpoint)
+        finally:
+            os.close(fdst)
+    finally:
+        os.close(fsrc)
+    shutil.copystat(src, part)
+    os.replace(part, dst)
+    return 'resumed' if offset else 'copied'
+
+
+def _copy_link(src: str, dst: str, force: bool = False) -> str:
+    """复制符号链接本身 (不跟随), 目标已是指向相同位置的链接时跳过"""
+    target = os.readlink(src)
+    if os.path.islink(dst):
+        if not force and os.readlink(dst) == target:
+            return 'skipped'
+        os.remove(dst)
+    os.symlink(target, dst)
+    return 'copied'
+
+
+def copy_tree(src: str, dst: str, mode: str = 'mtime', workers: int = None,
+              progress=None, check_cancelled=None) -> Dict[str, Any]:
+    """把文件或目录树 src 复制到 dst (目录时复制其内容), 未变化的文件跳过
+
+    先遍历源目录创建目标目录并统计总量 (用于估算剩余时间), 再把文件分发到线程池并发复制;
+    排队的文件数有上限, 几十万个文件时内存也不会随之增长。progress(stats) 约每半秒在调用线程中
+    被调用一次。符号链接按链接本身复制, 目录时间戳在全部文件完成后自底向上复制。
+    返回 files、bytes (总量)、done (已处理字节)、written (实际写入字节)、copied、skipped、
+    resumed、failed 和 errors (前几条错误信息)。
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    stats = {'files': 0, 'bytes': 0, 'done': 0, 'written': 0,
+             'copied': 0, 'skipped': 0, 'resumed': 0, 'failed': 0, 'errors': []}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def fail(path, error):
+        stats['failed'] += 1
+        if len(stats['errors']) < 5:
+            stats['errors'].append(f"{path}: {getattr(error, 'strerror', None) or error}")
+
+    def advance(count, written=True):
+        with lock:
+            stats['done'] += count
+            if written:
+                stats['written'] += count
+
+    def checkpoint():
+        if stop.is_set():
+            raise CommandCancelled()
+
+    # 遍历源目录树: 创建目标目录, 收集 (源, 目标, stat) 三元组
+    tasks = []
+    copied_dirs = []
+    root_st = os.stat(src)
+    if not os.path.isdir(src):
+        tasks.append((src, dst, root_st))
+    else:
+        stack = [(src, dst)]
+        while stack:
+            if check_cancelled is not None:
+                check_cancelled()
+            sdir, ddir = stack.pop()
+            try:
+                os.makedirs(ddir, exist_ok=True)
+                with os.scandir(sdir) as it:
+                    for entry in it:
+                        target = os.path.join(ddir, entry.name)
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, target))
+                        else:
+                            tasks.append((entry.path, target, entry.stat(follow_symlinks=False)))
+            except OSError as e:
+                fail(sdir, e)
+                continue
+            copied_dirs.append((sdir, ddir))
+    stats['files'] = len(tasks)
+    stats['bytes'] = sum(st.st_size for _, _, st in tasks if not stat.S_ISLNK(st.st_mode))
+
+    def run(task):
+        path, target, st = task
+        if stat.S_ISLNK(st.st_mode):
+            return _copy_link(path, target, mode == 'force')
+        return _copy_file(path, target, st, mode, advance, checkpoint)
+
+    workers = workers or SCAN_WORKERS
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='copy')
+    pending = {}
+    queued = iter(tasks)
+    last_report = time.monotonic()
+    try:
+        while True:
+            while len(pending) < workers * 16:
+                task = next(queued, None)
+                if task is None:
+                    break
+                pending[pool.submit(run, task)] = task[0]
+            if not pending:
+                break
+            done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            if check_cancelled is not None:
+                check_cancelled()
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    stats[future.result()] += 1
+                except OSError as e:
+                    fail(path, e)
+            if progress is not None and time.monotonic() - last_report >= 0.5:
+                last_report = time.monotonic()
+                progress(stats)
+    finally:
+        # 出错或被取消时让工作线程在下一个数据块前停下, 未完成的文件留下 .part 供下次续传
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    for sdir, ddir in reversed(copied_dirs):
+        try:
+            shutil.copystat(sdir, ddir)
+        except OSError:
+            pass
+    return stats
+
+# 支持目录文件描述符时按 dir_fd 删除文件, 省去每个文件的完整路径解析 (Windows 上退回按路径删除)
+_DELETE_BY_FD = os.scandir in os.supports_fd and os.unlink in os.supports_dir_fd
+
+# 每个删除任务处理的文件数: 单个大目录中的文件也会分给多个线程并发删除
+DELETE_BATCH = 512
+
+
+class _DeleteNode:
+    """delete_tree 中的一个目录: 所有子任务 (文件批次和子目录) 完成后才能删除它"""
+
+    __slots__ = ('path', 'parent', 'pending', 'batches', 'fd', 'failed')
+
+    def __init__(self, path: str, parent: Optional['_DeleteNode']):
+        self.path = path
+        self.parent = parent
+        self.pending = 0
+        self.batches = 0
+        self.fd = None
+        self.failed = False
+
+
+def _scan_delete_dir(path: str, dry_run: bool):
+    """读取待删除目录的内容 (在线程池中运行), 返回 (目录描述符, 文件名列表, 子目录名列表, 文件总字节)
+
+    指向目录的符号链接按文件处理, 只删除链接本身; 只有 dry_run 时才 stat 文件以统计字节数。
+    """
+    fd = None
+    if _DELETE_BY_FD and not dry_run:
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | getattr(os, 'O_NOFOLLOW', 0))
+    files = []
+    subdirs = []
+    size = 0
+    try:
+        with os.scandir(path if fd is None else fd) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if dry_run and not is_dir:
+                        size += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    is_dir = False
+                (subdirs if is_dir else files).append(entry.name)
+    except BaseException:
+        if fd is not None:
+            os.close(fd)
+        raise
+    return fd, files, subdirs, size
+
+
+def _unlink_batch(fd: Optional[int], path: str, names: List[str]):
+    """删除目录中的一批文件 (在线程池中运行), 返回 (删除数, 失败列表)"""
+    removed = 0
+    failed = []
+    for name in names:
+        try:
+            if fd is not None:
+                os.unlink(name, dir_fd=fd)
+            else:
+                os.unlink(os.path.join(path, name))
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            failed.append((os.path.join(path, name), e))
+    return removed, failed
+
+
+def delete_tree(root: str, dry_run: bool = False, workers: int = None,
+                progress=None, check_cancelled=None) -> Dict[str, Any]:
+    """并行删除目录树 root (包括 root 本身)
+
+    目录在线程池中扫描, 其中的文件按 DELETE_BATCH 个一批并发删除 (相对目录描述符),
+    目录在其全部内容删除后自底向上删除。正在执行的任务数有上限, 且优先删除已扫描到的文件,
+    打开的目录描述符数量因此有界。dry_run 时只统计将要删除的文件数和字节数。
+    progress(stats) 约每半秒在调用线程中被调用一次。
+    返回 files、dirs、bytes (仅 dry_run)、removed (已删除的文件和目录数)、failed 和 errors (前几条错误信息)。
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    stats = {'files': 0, 'dirs': 0, 'bytes': 0, 'removed': 0, 'failed': 0, 'errors': []}
+
+    def fail(node, path, error):
+        node.failed = True
+        stats['failed'] += 1
+        if len(stats['errors']) < 5:
+            stats['errors'].append(f"{path}: {getattr(error, 'strerror', None) or error}")
+
+    def close(node):
+        if node.fd is not None:
+            os.close(node.fd)
+            node.fd = None
+
+    def finish(node):
+        # 目录的所有内容都已处理: 删除它并通知上级目录
+        while node is not None:
+            close(node)
+            if node.failed:
+                if node.parent is not None:
+                    node.parent.failed = True
+            elif not dry_run:
+                try:
+                    os.rmdir(node.path)
+                    stats['removed'] += 1
+                except OSError as e:
+                    fail(node, node.path, e)
+            node = node.parent
+            if node is None:
+                break
+            node.pending -= 1
+            if node.pending:
+                break
+
+    workers = workers or SCAN_WORKERS
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='delete')
+    scans = deque([_DeleteNode(root, None)])
+    batches = deque()
+    running = {}
+    last_report = time.monotonic()
+    try:
+        while scans or batches or running:
+            while len(running) < workers * 2 and (scans or batches):
+                if batches:
+                    node, names = batches.popleft()
+                    running[pool.submit(_unlink_batch, node.fd, node.path, names)] = (node, True)
+                else:
+                    node = scans.popleft()
+                    running[pool.submit(_scan_delete_dir, node.path, dry_run)] = (node, False)
+            done, _ = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+            if check_cancelled is not None:
+                check_cancelled()
+            for future in done:
+                node, is_batch = running.pop(future)
+                if is_batch:
+                    removed, failed = future.result()
+                    stats['removed'] += removed
+                    for path, error in failed:
+                        fail(node, path, error)
+                    node.batches -= 1
+                    if not node.batches:
+                        close(node)
+                    node.pending -= 1
+                else:
+                    try:
+                        node.fd, files, subdirs, size = future.result()
+                    except OSError as e:
+                        fail(node, node.path, e)
+                        files = subdirs = ()
+                    stats['files'] += len(files)
+                    stats['dirs'] += len(subdirs)
+                    stats['bytes'] += size
+                    if not dry_run:
+                        for start in range(0, len(files), DELETE_BATCH):
+                            batches.append((node, files[start:start + DELETE_BATCH]))
+                            node.batches += 1
+                    if not node.batches:
+                        close(node)
+                    for name in subdirs:
+                        scans.append(_DeleteNode(os.path.join(node.path, name), node))
+                    node.pending += node.batches + len(subdirs)
+                if not node.pending:
+                    finish(node)
+            if progress is not None and time.monotonic() - last_report >= 0.5:
+                last_report = time.monotonic()
+                progress(stats)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        for future, (node, is_batch) in running.items():
+            if not is_batch and not future.cancelled() and future.exception() is None:
+                node.fd = future.result()[0]
+            close(node)
+        for node, _ in batches:
+            close(node)
+    return stats
+
+
+class LineIndex:
+    """大文件的稀疏行索引 (type --line 和分页器跳转用)
+
+    每 STEP 字节记录一个检查点: 该偏移之前的换行符数。索引按需构建, 只扫描到查询位置为止;
+    定位某一行时从最近的检查点向后最多读取 STEP 字节。扫描过的索引按 (路径, 大小, mtime)
+    保存在状态目录的 line_index.db 中, 再次打开同一文件时直接复用。
+    """
+
+    STEP = 64 * 1024
+
+    # 扫描超过这么多字节才写入磁盘, 小文件重新扫描比读写数据库更快
+    SAVE_MIN = 4 * 1024 * 1024
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            tail INTEGER,
+            counts BLOB NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    # 本进程最近使用的索引 {路径: LineIndex}
+    _recent: Dict[str, 'LineIndex'] = {}
+    _recent_lock = threading.Lock()
+
+    def __init__(self, path: str, size: int, mtime_ns: int):
+        from array import array
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.counts = array('q', [0])  # counts[k]: 偏移 k*STEP 之前的换行符数
+        self.tail = None               # 扫描到文件末尾后: 最后一个检查点之后的换行符数
+        self._saved = 1
+
+    @classmethod
+    def open(cls, path: str) -> 'LineIndex':
+        """取得 path 的索引: 文件大小和 mtime 未变时复用内存或磁盘中的记录"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with cls._recent_lock:
+            index = cls._recent.get(path)
+        if index is not None and (index.size, index.mtime_ns) == (st.st_size, st.st_mtime_ns):
+            return index
+        index = cls(path, st.st_size, st.st_mtime_ns)
+        if st.st_size >= cls.SAVE_MIN:
+            import sqlite3
+            try:
+                row = cls._connect().execute(
+                    "SELECT tail, counts FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                    (path, st.st_size, st.st_mtime_ns)).fetchone()
+            except (OSError, sqlite3.Error):
+                row = None
+            if row is not None:
+                index.tail = row[0]
+                index.counts = index.counts.__class__('q')
+                index.counts.frombytes(row[1])
+                index._saved = len(index.counts)
+        with cls._recent_lock:
+            if len(cls._recent) >= 16:
+                cls._recent.clear()
+            cls._recent[path] = index
+        return index
+
+    @classmethod
+    def _connect(cls):
+        import sqlite3
+        path = state_path(LINE_INDEX_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = sqlite3.connect(path)
+        db.executescript(cls.SCHEMA)
+        return db
+
+    def save(self):
+        """把新扫描的部分写入磁盘 (失败时忽略, 索引只是缓存)"""
+        if len(self.counts) == self._saved or len(self.counts) * self.STEP < self.SAVE_MIN:
+            return
+        import sqlite3
+        try:
+            db = self._connect()
+            with db:
+                db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                           (self.path, self.size, self.mtime_ns, self.tail, self.counts.tobytes()))
+            db.close()
+            self._saved = len(self.counts)
+        except (OSError, sqlite3.Error):
+            pass
+
+    def _extend(self, f, done):
+        """从已扫描位置继续向后扫描, 直到 done() 为真或到达文件末尾"""
+        step = self.STEP
+        while self.tail is None and not done():
+            f.seek((len(self.counts) - 1) * step)
+            chunk = f.read(step * 16)
+            lines = self.counts[-1]
+            for start in range(0, len(chunk), step):
+                if start + step > len(chunk):
+                    self.tail = chunk.count(b'\n', start)
+                    break
+                lines += chunk.count(b'\n', start, start + step)
+                self.counts.append(lines)
+            if not chunk:
+                self.tail = 0
+
+    def line_count(self, f) -> int:
+        """文件总行数 (最后一行没有换行符时也计入)"""
+        self._extend(f, lambda: False)
+        total = self.counts[-1] + self.tail
+        if self.size:
+            f.seek(self.size - 1)
+            total += f.read(1) != b'\n'
+        return total
+
+    def seek_line(self, f, line: int) -> Optional[int]:
+        """第 line 行 (从 1 开始) 的起始偏移, 超出文件末尾时返回 None"""
+        import bisect
+        target = line - 1
+        if target <= 0:
+            return 0
+        self._extend(f, lambda: self.counts[-1] >= target)
+        k = bisect.bisect_left(self.counts, target) - 1
+        f.seek(k * self.STEP)
+        data = f.read(self.STEP)
+        pos = 0
+        for _ in range(target - self.counts[k]):
+            pos = data.find(b'\n', pos) + 1
+            if not pos:
+                return None
+        offset = k * self.STEP + pos
+        return offset if offset < self.size else None
+
+    def line_at(self, f, offset: int) -> int:
+        """偏移 offset 所在的行号 (从 1 开始)"""
+        offset = max(0, min(offset, self.size))
+        k = offset // self.STEP
+        self._extend(f, lambda: len(self.counts) > k)
+        k = min(k, len(self.counts) - 1)
+        f.seek(k * self.STEP)
+        return self.counts[k] + f.read(offset - k * self.STEP).count(b'\n') + 1
+
+
+def _hex_lines(f, offset: int, rows: Optional[int] = None):
+    """从 offset 开始逐行生成十六进制转储 (每行 16 字节: 偏移、十六进制、可打印字符)"""
+    printable = bytes(b if 32 <= b < 127 else 46 for b in range(256))
+    f.seek(offset - offset % 16)
+    offset -= offset % 16
+    while rows is None or rows > 0:
+        chunk = f.read(65536 if rows is None else min(65536, rows * 16))
+        if not chunk:
+            return
+        for start in range(0, len(chunk), 16):
+            row = chunk[start:start + 16]
+            text = row.hex(' ')
+            yield f"{offset + start:08x}  {text[:23]:<23}  {text[24:]:<23}  |{row.translate(printable).decode('ascii')}|"
+            if rows is not None:
+                rows -= 1
+                if not rows:
+                    return
+        offset += len(chunk)
+
+
+def _tail_offset(f, count: int, block: int = 65536) -> int:
+    """从文件末尾按块向前读, 返回最后 count 行的起始偏移 (只读取这些行所在的块)
+
+    文件末尾的换行符不算作新的一行。
+    """
+    end = f.seek(0, os.SEEK_END)
+    if not end or count <= 0:
+        return end
+    f.seek(end - 1)
+    pos = end - 1 if f.read(1) == b'\n' else end
+    remaining = count
+    while pos > 0:
+        start = max(0, pos - block)
+        f.seek(start)
+        data = f.read(pos - start)
+        found = data.count(b'\n')
+        if found < remaining:
+            remaining -= found
+        else:
+            idx = len(data)
+            for _ in range(remaining):
+                idx = data.rfind(b'\n', 0, idx)
+            return start + idx + 1
+        pos = start
+    return 0
+
+
+class _Inotify:
+    """Linux inotify 的最小封装 (ctypes): 监视若干目录, 等待其中任一文件发生变化
+
+    监视的是文件所在的目录而不是文件本身, 文件被轮转 (改名后重新创建) 时无需重新添加监视。
+    """
+
+    IN_MODIFY = 0x002
+    IN_ATTRIB = 0x004
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self, libc, fd: int):
+        self._libc = libc
+        self.fd = fd
+        self._watched = set()
+
+    @classmethod
+    def create(cls) -> Optional['_Inotify']:
+        """创建 inotify 实例; 非 Linux 或不可用时返回 None (调用方改用轮询)"""
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(cls.IN_NONBLOCK | cls.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+
+    def watch(self, directory: str) -> bool:
+        """监视目录中文件的修改、创建、删除和改名"""
+        if directory in self._watched:
+            return True
+        mask = (self.IN_MODIFY | self.IN_ATTRIB | self.IN_MOVED_FROM | self.IN_MOVED_TO
+                | self.IN_CREATE | self.IN_DELETE)
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            return False
+        self._watched.add(directory)
+        return True
+
+    def wait(self, timeout: float) -> bool:
+        """等待事件 (最多 timeout 秒), 读空事件队列; 有事件时返回 True"""
+        import select
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class TailFollower:
+    """tail -f: 跟踪一组文件的新增内容
+
+    每次 poll() 检查各文件: 变长则读出新内容, 变短视为截断并从头读取, 路径指向的
+    inode 改变视为轮转 (先读完旧文件剩余的内容, 再从头跟踪新文件)。Linux 上用 inotify
+    等待变化, 其他平台或 inotify 不可用时每 POLL_INTERVAL 秒轮询一次。
+    """
+
+    POLL_INTERVAL = 0.5
+
+    # inotify 可用时也定期检查一次, 以防事件丢失 (如网络文件系统上的修改)
+    INOTIFY_TIMEOUT = 2.0
+
+    def __init__(self, paths: List[str], offsets: Optional[List[int]] = None):
+        import codecs
+        self._new_decoder = codecs.getincrementaldecoder('utf-8')
+        self.entries = []
+        for i, path in enumerate(paths):
+            entry = {'path': path, 'file': None, 'ident': None, 'missing': False}
+            self._open(entry, offsets[i] if offsets else None)
+            self.entries.append(entry)
+        self._inotify = _Inotify.create()
+        if self._inotify is not None:
+            for path in paths:
+                if not self._inotify.watch(os.path.dirname(os.path.abspath(path)) or '.'):
+                    self._inotify.close()
+                    self._inotify = None
+                    break
+
+    def _open(self, entry, offset=None):
+        """打开 (或重新打开) 文件; offset 为 None 时从末尾开始"""
+        f = open(entry['path'], 'rb')
+        st = os.fstat(f.fileno())
+        f.seek(st.st_size if offset is None else offset)
+        entry.update(file=f, ident=(st.st_dev, st.st_ino), missing=False,
+                     decoder=self._new_decoder('replace'))
+
+    def _drain(self, entry):
+        for data in iter(lambda: entry['file'].read(1024 * 1024), b''):
+            yield entry['path'], entry['decoder'].decode(data), False
+
+    def poll(self):
+        """逐块生成所有文件的新内容: (路径, 文本, 是否为提示信息)"""
+        for entry in self.entries:
+            try:
+                st = os.stat(entry['path'])
+            except FileNotFoundError:
+                st = None
+            f = entry['file']
+            if f is not None:
+                if st is not None and (st.st_dev, st.st_ino) == entry['ident'] and st.st_size < f.tell():
+                    yield entry['path'], "文件被截断, 从头读取", True
+                    f.seek(0)
+                    entry['decoder'].reset()
+                yield from self._drain(entry)
+            if st is None:
+                if f is not None and not entry['missing']:
+                    entry['missing'] = True
+                    yield entry['path'], "文件已被移走或删除, 等待重新创建", True
+            elif f is None or (st.st_dev, st.st_ino) != entry['ident']:
+                if f is not None:
+                    f.close()
+                yield entry['path'], "文件已被轮转, 跟踪新文件" if f is not None else "文件已出现", True
+                try:
+                    self._open(entry, 0)
+                except OSError:
+                    entry['file'] = None
+                    continue
+                yield from self._drain(entry)
+
+    def wait(self, timeout: Optional[float] = None):
+        """等待文件可能发生变化 (inotify 事件或轮询间隔)"""
+        if self._inotify is not None:
+            self._inotify.wait(self.INOTIFY_TIMEOUT if timeout is None else timeout)
+        else:
+            time.sleep(self.POLL_INTERVAL if timeout is None else min(timeout, self.POLL_INTERVAL))
+
+    def close(self):
+        for entry in self.entries:
+            if entry['file'] is not None:
+                entry['file'].close()
+        if self._inotify is not None:
+            self._inotify.close()
+
+
+# 小于该大小的文件整体读入 (读取时释放 GIL, 多个线程的 I/O 可以重叠), 更大的文件用 mmap 搜索
+GREP_MMAP_MIN = 16 * 1024 * 1024
+
+# grep 每个线程池任务搜索的文件数
+GREP_BATCH = 64
+
+# 递归搜索时默认跳过的版本控制目录
+GREP_SKIP_DIRS = ('.git', '.hg', '.svn')
+
+
+class _GrepMatcher:
+    """grep 的匹配器: searcher(data) 返回在该缓冲区中查找的函数 (起始偏移 -> 匹配位置或 -1)
+
+    不含正则元字符的 ASCII 模式不经过正则引擎: 区分大小写时直接 bytes.find, 不区分时在
+    小写化的数据上查找 (比 IGNORECASE 正则快数倍; mmap 按块小写化, 内存占用有界)。
+    正则在整个缓冲区上查找, 跨过行尾的匹配只在其开始的那一行内重新查找, 结果与逐行匹配相同。
+    字节串正则的 IGNORECASE 只对 ASCII 生效, 固定字符串中的非 ASCII 字母因此展开成大小写两种写法;
+    含非 ASCII 字符的正则编译为字符串正则 (大小写折叠、字符类和 \\b 都按 Unicode), 逐行解码后匹配。
+    """
+
+    # mmap 上不区分大小写查找时每次小写化的块大小
+    BLOCK = 8 * 1024 * 1024
+
+    def __init__(self, pattern: str, fixed: bool = False, ignore_case: bool = True, word: bool = False):
+        import re
+        self.literal = None
+        self.text = False
+        self.ignore_case = ignore_case
+        if (fixed or re.escape(pattern) == pattern) and not word and pattern and pattern.isascii():
+            needle = pattern.encode('ascii')
+            self.literal = needle.lower() if ignore_case else needle
+            return
+        if fixed:
+            parts = []
+            for char in pattern:
+                variants = {char, char.lower(), char.upper()} if ignore_case and not char.isascii() else {char}
+                escaped = [re.escape(v.encode('utf-8')) for v in sorted(variants)]
+                parts.append(escaped[0] if len(escaped) == 1 else b'(?:' + b'|'.join(escaped) + b')')
+            source = b''.join(parts)
+        elif pattern.isascii():
+            source = pattern.encode('utf-8')
+        else:
+            source = pattern
+            self.text = True
+        if word:
+            source = (r'\b(?:' + source + r')\b') if self.text else (rb'\b(?:' + source + rb')\b')
+        self.regex = re.compile(source, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+
+    def searcher(self, data):
+        """返回在 data (bytes 或 mmap) 中查找的函数"""
+        if self.text:
+            search = self.regex.search
+            size = len(data)
+
+            def find_text(pos):
+                while pos <= size:
+                    end = data.find(b'\n', pos)
+                    end = size if end < 0 else end
+                    if search(data[pos:end].decode('utf-8', 'surrogateescape')):
+                        return pos
+                    pos = end + 1
+                return -1
+            return find_text
+        if self.literal is None:
+            search = self.regex.search
+
+            def find(pos):
+                while True:
+                    match = search(data, pos)
+                    if match is None:
+                        return -1
+                    start = match.start()
+                    line_end = data.find(b'\n', start)
+                    line_end = len(data) if line_end < 0 else line_end
+                    if match.end() <= line_end:
+                        return start
+                    # \s、[^x] 等可以匹配换行符, 匹配跨过了行尾: 只在开始的那一行内重新查找
+                    match = search(data, max(pos, data.rfind(b'\n', 0, start) + 1), line_end)
+                    if match is not None:
+                        return match.start()
+                    pos = line_end + 1
+            return find
+        needle = self.literal
+        if not self.ignore_case:
+            return lambda pos: data.find(needle, pos)
+        if isinstance(data, bytes):
+            lowered = data.lower()
+            return lambda pos: lowered.find(needle, pos)
+        window = [0, b'']
+        overlap = len(needle) - 1
+
+        def find_caseless(pos):
+            while pos < len(data):
+                start, block = window
+                if not start <= pos <= start + len(block) - len(needle):
+                    start, block = pos, data[pos:pos + self.BLOCK + overlap].lower()
+                    window[:] = start, block
+                found = block.find(needle, pos - start)
+                if found >= 0:
+                    return start + found
+                if start + len(block) >= len(data):
+                    break
+                pos = start + len(block) - overlap
+            return -1
+        return find_caseless
+
+
+def _count_newlines(data, start: int, end: int) -> int:
+    """data[start:end] 中的换行符数 (mmap 没有 count 方法, 分块复制后计数)"""
+    if isinstance(data, bytes):
+        return data.count(b'\n', start, end)
+    total = 0
+    for pos in range(start, end, 1024 * 1024):
+        total += data[pos:min(end, pos + 1024 * 1024)].count(b'\n')
+    return total
+
+
+def _grep_buffer(data, matcher, before: int = 0, after: int = 0, count_only: bool = False):
+    """在字节缓冲区 (bytes 或 mmap) 中按行搜索, 返回 (匹配行数, 输出行)
+
+    输出行为 (行号, 是否匹配行, 文本), 上下文不连续处插入 None (显示为 --)。
+    整个缓冲区交给匹配器搜索, 只有匹配行和上下文行才会被解码。
+    """
+    find = matcher.searcher(data)
+    size = len(data)
+    count = 0
+    out = []
+    pos = 0
+    line_no = 1          # counted_to 处那一行的行号
+    counted_to = 0
+    printed_end = 0      # 最后输出的一行之后的偏移
+    printed_no = 0       # 最后输出的行号
+    pending_after = 0
+
+    def line_at(start):
+        end = data.find(b'\n', start)
+        end = size if end < 0 else end
+        return end, data[start:end].rstrip(b'\r').decode('utf-8', 'replace')
+
+    def emit_after(limit):
+        nonlocal printed_end, printed_no, pending_after
+        while pending_after and printed_end < limit:
+            end, text = line_at(printed_end)
+            printed_no += 1
+            out.append((printed_no, False, text))
+            printed_end = end + 1
+            pending_after -= 1
+
+    while pos <= size:
+        found = find(pos)
+        if found < 0 or (found == size and data[size - 1:size] in (b'\n', b'')):
+            break  # 末尾换行符之后不再有一行
+        start = data.rfind(b'\n', 0, found) + 1
+        end = data.find(b'\n', found)
+        end = size if end < 0 else end
+        pos = end + 1
+        count += 1
+        if count_only:
+            continue
+        line_no += _count_newlines(data, counted_to, start)
+        counted_to = start
+        emit_after(start)
+        context = []
+        ctx_start = start
+        while len(context) < before and ctx_start > printed_end:
+            ctx_start = data.rfind(b'\n', 0, ctx_start - 1) + 1
+            context.append(ctx_start)
+        if (before or after) and out and (context[-1] if context else start) > printed_end:
+            out.append(None)
+        for i, ctx in enumerate(reversed(context)):
+            out.append((line_no - len(context) + i, False, line_at(ctx)[1]))
+        out.append((line_no, True, data[start:end].rstrip(b'\r').decode('utf-8', 'replace')))
+        printed_end = pos
+        printed_no = line_no
+        pending_after = after
+    emit_after(size)
+    return count, out
+
+
+def grep_file(path: str, matcher, before: int = 0, after: int = 0, count_only: bool = False):
+    """搜索单个文件 (在线程池中运行), 返回 (匹配行数, 输出行), 二进制文件返回 None
+
+    开头 8 KiB 含 NUL 字节的文件视为二进制文件。
+    """
+    import mmap
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < GREP_MMAP_MIN:
+            data = f.read()
+            if b'\0' in data[:8192]:
+                return None
+            return _grep_buffer(data, matcher, before, after, count_only)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data.find(b'\0', 0, 8192) >= 0:
+                return None
+            return _grep_buffer(data, matcher, before, after, count_only)
+
+
+def _grep_walk(paths, includes=(), excludes=(), errors=None):
+    """按名称顺序生成要搜索的文件: 目录递归展开, 应用 --include/--exclude, 跳过版本控制目录
+
+    模式与文件名或相对于起始目录的路径匹配; 无法读取的目录记入 errors。
+    """
+    import fnmatch
+
+    def matches(patterns, name, rel):
+        return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel, p) for p in patterns)
+
+    for top in paths:
+        if not os.path.isdir(top):
+            yield top
+            continue
+        stack = [(top, '')]
+        while stack:
+            path, rel = stack.pop()
+            try:
+                with os.scandir(path) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                if errors is not None:
+                    errors.append(f"{path}: {e.strerror}")
+                continue
+            subdirs = []
+            for entry in entries:
+                entry_rel = rel + entry.name
+                if matches(excludes, entry.name, entry_rel):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in GREP_SKIP_DIRS:
+                            subdirs.append((entry.path, entry_rel + '/'))
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                if not includes or matches(includes, entry.name, entry_rel):
+                    yield entry.path
+            stack.extend(reversed(subdirs))
+
+
+# index grep 建立内容索引时每次读入的块大小 (按最后一个换行符切分, 行不会被截断)
+GREP_INDEX_CHUNK = 16 * 1024 * 1024
+
+
+def _content_trigrams(path: str):
+    """文件内容的 trigram 集合 (ASCII 小写化, 按行去重, 不跨行), 返回排序后的 array('I') 字节串
+
+    二进制文件 (开头 8 KiB 含 NUL) 返回 b''; trigram 编码为 (b0 << 16) | (b1 << 8) | b2。
+    """
+    from array import array
+    grams = set()
+    rest = b''
+    with open(path, 'rb') as f:
+        first = True
+        while True:
+            chunk = f.read(GREP_INDEX_CHUNK)
+            if first and b'\0' in chunk[:8192]:
+                return b''
+            first = False
+            data = rest + chunk
+            cut = data.rfind(b'\n') + 1 if chunk else len(data)
+            if chunk and not cut:
+                rest = data
+                continue
+            for line in set(data[:cut].lower().split(b'\n')):
+                grams.update(zip(line, line[1:], line[2:]))
+            rest = data[cut:]
+            if not chunk:
+                break
+    return array('I', sorted((a << 16) | (b << 8) | c for a, b, c in grams)).tobytes()
+
+
+def _content_trigram_batch(paths):
+    """在子进程中提取一批文件的 trigram (进程池要求顶层函数), 无法读取的文件返回 None"""
+    results = []
+    for path in paths:
+        try:
+            results.append(_content_trigrams(path))
+        except OSError:
+            results.append(None)
+    return results
+
+
+def _process_pool(workers: int):
+    """创建进程池, 子进程由 forkserver (不支持时用 spawn) 启动, 不 fork 本进程
+
+    本进程中可能有守护进程会话和后台任务的线程, fork 会把其他线程持有的锁原样复制到子进程, 子进程可能因此死锁。
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+
+def _encode_postings(ids) -> bytes:
+    """文件编号列表 (升序) -> 差值 varint 编码; 差值都小于 128 时 (常见 trigram) 直接 bytes()"""
+    import itertools
+    import operator
+    deltas = list(map(operator.sub, ids, itertools.chain((0,), ids)))
+    if max(deltas) < 0x80:
+        return bytes(deltas)
+    out = bytearray()
+    for delta in deltas:
+        while delta >= 0x80:
+            out.append(delta & 0x7f | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def _decode_postings(blob) -> List[int]:
+    """_encode_postings 的逆过程"""
+    import itertools
+    if max(blob) < 0x80:
+        return list(itertools.accumulate(blob))
+    deltas = []
+    value = shift = 0
+    for byte in blob:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        deltas.append(value)
+        value = shift = 0
+    return list(itertools.accumulate(deltas))
+
+
+def _pattern_trigrams(pattern: str, fixed: bool = False, ignore_case: bool = True):
+    """grep 模式的每个匹配都必须包含的 trigram 集合 (与 _content_trigrams 的编码相同)
+
+    从正则的顶层找出必然连续出现的字面量片段 (分组展开, 至少出现一次的重复取其内容),
+    分支、字符类、任意字符等处断开。片段中的换行符处断开 (索引不跨行);
+    不区分大小写时非 ASCII 字符也断开 (索引只对 ASCII 小写化)。返回空集合表示无法缩小范围。
+    """
+    try:
+        from re import _parser as sre_parse
+    except ImportError:  # Python < 3.11
+        import sre_parse
+    runs = [bytearray()]
+
+    def add(char):
+        if char == '\n' or (ignore_case and not char.isascii()):
+            runs.append(bytearray())
+        else:
+            runs[-1] += char.encode('utf-8').lower()
+
+    def walk(items):
+        for op, av in items:
+            if op is sre_parse.LITERAL:
+                add(chr(av))
+            elif op is sre_parse.SUBPATTERN:
+                walk(av[-1])
+            elif op is sre_parse.AT:
+                continue  # 零宽断言不消耗字符
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+                runs.append(bytearray())
+                walk(av[2])
+                runs.append(bytearray())
+            else:
+                runs.append(bytearray())
+
+    if fixed:
+        for char in pattern:
+            add(char)
+    else:
+        try:
+            walk(sre_parse.parse(pattern))
+        except Exception:
+            return set()
+    return {(a << 16) | (b << 8) | c for run in runs for a, b, c in zip(run, run[1:], run[2:])}
+
+
+class GrepIndex:
+    """grep --indexed 使用的文件内容 trigram 倒排索引 (由 index grep 建立)
+
+    每个目录一个索引文件 (状态目录 grep_index/<路径哈希>.idx), 格式 (小端):
+      头部         '<4sIIIdQQ': 魔数, 文件数, trigram 数, 根目录长度, 更新时间, 倒排表偏移, trigram 表偏移
+      根目录       UTF-8 路径
+      文件表       每个文件 '<qQH' (mtime_ns, 大小, 路径长度) + 相对路径, 按路径排序, 序号即文件编号
+      倒排表       各 trigram 的文件编号 (差值 varint 编码) 依次相接
+      trigram 表   每项 '<IIQ' (trigram, 文件数, 在倒排表中的偏移), 按 trigram 排序
+    加载时整个文件 mmap, 查询在 trigram 表上二分查找, 只解码用到的倒排列表。
+    更新时只读取大小或 mtime 变化的文件, 其余文件的倒排列表从旧索引逐项映射到新编号后合并写出。
+    """
+
+    MAGIC = b'SGI1'
+    HEADER = '<4sIIIdQQ'
+    FILE = '<qQH'
+    ENTRY = '<IIQ'
+
+    def __init__(self, root: str, path: Optional[str] = None):
+        self.root = root
+        self.path = path or self.path_for(root)
+        self.updated = 0.0
+        self.files: List[tuple] = []   # (相对路径, 大小, mtime_ns)
+        self.trigrams = 0
+        self.size = 0
+        self._file = None
+        self._map = None
+        self._table = 0
+        self._postings = 0
+
+    @staticmethod
+    def path_for(root: str) -> str:
+        import hashlib
+        key = hashlib.sha1(root.encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+        return state_path(os.path.join(GREP_INDEX_DIR, key + '.idx'))
+
+    @classmethod
+    def load(cls, path: str) -> Optional['GrepIndex']:
+        """mmap 打开索引文件, 格式不符时返回 None"""
+        import mmap
+        import struct
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return None
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            f.close()
+            return None
+        header = struct.calcsize(cls.HEADER)
+        magic, count, trigrams, root_len, updated, postings, table = struct.unpack_from(cls.HEADER, data) \
+            if len(data) >= header else (b'',) + (0,) * 6
+        if magic != cls.MAGIC:
+            data.close()
+            f.close()
+            return None
+        index = cls(data[header:header + root_len].decode('utf-8', 'surrogateescape'), path)
+        index.updated, index.trigrams, index.size = updated, trigrams, len(data)
+        index._file, index._map, index._table, index._postings = f, data, table, postings
+        pos = header + root_len
+        file_size = struct.calcsize(cls.FILE)
+        unpack = struct.Struct(cls.FILE).unpack_from
+        for _ in range(count):
+            mtime, size, name_len = unpack(data, pos)
+            pos += file_size
+            index.files.append((data[pos:pos + name_len].decode('utf-8', 'surrogateescape'), size, mtime))
+            pos += name_len
+        return index
+
+    @classmethod
+    def locate(cls, path: str) -> Optional['GrepIndex']:
+        """查找覆盖 path 的索引 (path 本身或最近的上级目录)"""
+        while True:
+            index = cls.load(cls.path_for(path))
+            if index is not None:
+                return index
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+    @classmethod
+    def all(cls) -> List['GrepIndex']:
+        directory = state_path(GREP_INDEX_DIR)
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            return []
+        indexes = (cls.load(os.path.join(directory, name)) for name in names if name.endswith('.idx'))
+        return [index for index in indexes if index is not None]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+    def _entries(self):
+        """按 trigram 顺序生成 (trigram, 倒排列表字节串)"""
+        import struct
+        unpack = struct.Struct(self.ENTRY).unpack_from
+        end = self._table - self._postings
+        previous = None
+        for i in range(self.trigrams + 1):
+            if i < self.trigrams:
+                trigram, _, offset = unpack(self._map, self._table + 16 * i)
+            else:
+                trigram, offset = None, end
+            if previous is not None:
+                yield previous[0], self._map[self._postings + previous[1]:self._postings + offset]
+            previous = trigram, offset
+
+    def _lookup(self, trigram: int):
+        """二分查找 trigram, 返回 (文件数, 倒排列表字节串) 或 None"""
+        import struct
+        unpack = struct.Struct(self.ENTRY).unpack_from
+        lo, hi = 0, self.trigrams
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if unpack(self._map, self._table + 16 * mid)[0] < trigram:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.trigrams:
+            return None
+        found, count, offset = unpack(self._map, self._table + 16 * lo)
+        if found != trigram:
+            return None
+        end = unpack(self._map, self._table + 16 * lo + 16)[2] if lo + 1 < self.trigrams \
+            else self._table - self._postings
+        return count, self._map[self._postings + offset:self._postings + end]
+
+    def candidates(self, trigrams) -> List[int]:
+        """包含全部 trigram 的文件编号 (升序); 从文件数最少的列表开始求交集"""
+        if not trigrams:
+            return list(range(len(self.files)))
+        found = [self._lookup(trigram) for trigram in trigrams]
+        if any(entry is None for entry in found):
+            return []
+        result = None
+        for _, blob in sorted(found, key=lambda entry: entry[0]):
+            ids = _decode_postings(blob)
+            result = set(ids) if result is None else result.intersection(ids)
+            if not result:
+                break
+        return sorted(result)
+
+    def update(self, progress=None, check_cancelled=None) -> Dict[str, int]:
+        """建立或增量更新索引: 只读取新增或大小/mtime 变化的文件, 写入临时文件后原子替换
+
+        需要读取的数据较多且有多个 CPU 时, trigram 在进程池中提取 (纯 Python 提取受 GIL 限制)。
+        """
+        import bisect
+        import itertools
+        import struct
+        from array import array
+        from collections import defaultdict
+        old = {name: (i, size, mtime) for i, (name, size, mtime) in enumerate(self.files)}
+        kept, to_read = {}, []
+        prefix = len(os.path.join(self.root, ''))
+        for path in _grep_walk([self.root]):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            name = path[prefix:]
+            previous = old.get(name)
+            if previous and previous[1:] == (st.st_size, st.st_mtime_ns):
+                kept[name] = previous
+            else:
+                to_read.append((name, path, st.st_size, st.st_mtime_ns))
+
+        stats = {'files': 0, 'read': len(to_read), 'bytes': sum(item[2] for item in to_read),
+                 'removed': len(old) - len(kept) - sum(1 for item in to_read if item[0] in old),
+                 'failed': 0}
+        extracted = {}
+        batches = [to_read[i:i + GREP_BATCH] for i in range(0, len(to_read), GREP_BATCH)]
+        pool = None
+        if len(batches) > 1 and (os.cpu_count() or 1) > 1 and stats['bytes'] > GREP_INDEX_CHUNK:
+            pool = _process_pool(os.cpu_count())
+            results = pool.map(_content_trigram_batch, [[item[1] for item in batch] for batch in batches])
+        else:
+            results = (_content_trigram_batch([item[1] for item in batch]) for batch in batches)
+        try:
+            done = 0
+            for batch, grams in zip(batches, results):
+                if check_cancelled:
+                    check_cancelled()
+                for item, data in zip(batch, grams):
+                    if data is None:
+                        stats['failed'] += 1
+                    else:
+                        extracted[item[0]] = (item[2], item[3], data)
+                done += len(batch)
+                if progress:
+                    progress(done, len(to_read))
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        names = sorted(itertools.chain(kept, extracted))
+        remap = array('i', [-1]) * len(self.files)
+        added = defaultdict(lambda: array('I'))
+        files = []
+        for new_id, name in enumerate(names):
+            if name in kept:
+                old_id, size, mtime = kept[name]
+                remap[old_id] = new_id
+            else:
+                size, mtime, data = extracted[name]
+                for trigram in array('I', data):
+                    added[trigram].append(new_id)
+            files.append((name, size, mtime))
+        stats['files'] = len(files)
+
+        if self._map is not None and not to_read and not stats['removed']:
+            # 没有变化: 只更新头部的时间
+            self.updated = time.time()
+            self.close()
+            with open(self.path, 'r+b') as f:
+                f.seek(struct.calcsize('<4sIII'))
+                f.write(struct.pack('<d', self.updated))
+            self._reload()
+            stats['trigrams'], stats['size'] = self.trigrams, self.size
+            return stats
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        # 文件列表不变 (只有内容变化) 时编号不变, 旧倒排列表只需删去变化文件的编号
+        same_names = len(files) == len(self.files) and all(
+            new[0] == previous[0] for new, previous in zip(files, self.files))
+        stale = [old_id for old_id, new_id in enumerate(remap) if new_id < 0] if same_names else []
+        root = self.root.encode('utf-8', 'surrogateescape')
+        table = array('I')   # 每项三个 uint32: trigram, 文件数, 偏移 (写出时转换为 <IIQ)
+        offsets = []
+        with open(tmp, 'wb') as out:
+            out.write(b'\0' * struct.calcsize(self.HEADER) + root)
+            pack_file = struct.Struct(self.FILE).pack
+            for name, size, mtime in files:
+                encoded = name.encode('utf-8', 'surrogateescape')
+                out.write(pack_file(mtime, size, len(encoded)) + encoded)
+            postings = out.tell()
+            written = 0
+            old_entries = self._entries() if self._map is not None else iter(())
+            new_keys = iter(sorted(added))
+            old_entry = next(old_entries, None)
+            new_key = next(new_keys, None)
+            while old_entry is not None or new_key is not None:
+                if check_cancelled:
+                    check_cancelled()
+                if new_key is None or (old_entry is not None and old_entry[0] <= new_key):
+                    trigram = old_entry[0]
+                    ids = _decode_postings(old_entry[1])
+                    if not same_names:
+                        ids = list(filter((-1).__ne__, map(remap.__getitem__, ids)))
+                    for old_id in stale:
+                        pos = bisect.bisect_left(ids, old_id)
+                        if pos < len(ids) and ids[pos] == old_id:
+                            del ids[pos]
+                    old_entry = next(old_entries, None)
+                    if trigram == new_key:
+                        ids = sorted(ids + added[trigram].tolist())
+                        new_key = next(new_keys, None)
+                else:
+                    trigram = new_key
+                    ids = added[trigram].tolist()
+                    new_key = next(new_keys, None)
+                if not ids:
+                    continue
+                blob = _encode_postings(ids)
+                out.write(blob)
+                table.extend((trigram, len(ids)))
+                offsets.append(written)
+                written += len(blob)
+            table_offset = out.tell()
+            pack_entry = struct.Struct(self.ENTRY).pack
+            out.write(b''.join(pack_entry(table[2 * i], table[2 * i + 1], offset)
+                               for i, offset in enumerate(offsets)))
+            out.seek(0)
+            out.write(struct.pack(self.HEADER, self.MAGIC, len(files), len(offsets), len(root),
+                                  time.time(), postings, table_offset))
+        self.close()
+        os.replace(tmp, self.path)
+        self._reload()
+        stats['trigrams'], stats['size'] = self.trigrams, self.size
+        return stats
+
+    def _reload(self):
+        index = self.load(self.path)
+        self.__dict__.update(index.__dict__)
+
+    def drop(self):
+        self.close()
+        os.remove(self.path)
+
+
+# sort 默认的内存预算 (-S 可覆盖): 输入超过预算时切成有序段写入临时文件, 再多路归并
+SORT_MEMORY = 256 * 1024 * 1024
+
+# 归并时同时打开的有序段数上限, 段更多时先逐组归并成较大的段
+SORT_FANIN = 64
+
+
+def _parse_size(text: str) -> int:
+    """解析 '512K'、'64M'、'2G' 形式的大小 (无后缀为字节), 格式错误时抛出 ValueError"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper()
+    scale = units.get(text[-1:], 1)
+    value = float(text[:-1] if scale > 1 else text)
+    if value < 0:
+        raise ValueError(text)
+    return int(value * scale)
+
+
+def _sort_keys(options):
+    """由 sort 选项构造 (排序键, 比较相等用的键), 键为 None 表示整行
+
+    -k 取第 N 个字段 (-t 指定分隔符, 默认按空白分隔), -n 取开头的数值 (没有数值视为 0)。
+    未指定 -s 时, 键相同的行再按整行比较, 结果与输入顺序无关; -s 保持键相同的行的输入顺序。
+    闭包不能传给子进程, 各工作进程由选项自行构造。
+    """
+    import re
+    field, separator = options['field'], options['separator']
+    numeric = options['numeric']
+    number = re.compile(rb'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+    if not field and not numeric:
+        return None, None
+
+    def primary(line):
+        if field:
+            parts = line.split(separator, field) if separator else line.split(None, field)
+            line = parts[field - 1] if len(parts) >= field else b''
+        if numeric:
+            match = number.match(line)
+            return float(match.group(1)) if match else 0.0
+        return line
+
+    if options['stable']:
+        return primary, primary
+    return (lambda line: (primary(line), line)), primary
+
+
+def _unique_lines(lines, key):
+    """有序行中键相同的连续行只保留第一行"""
+    previous = marker = object()
+    for line in lines:
+        current = line if key is None else key(line)
+        if previous is marker or current != previous:
+            previous = current
+            yield line
+
+
+def _sort_run(source, options, path: Optional[str] = None):
+    """排序一段输入 (在进程池中运行): source 为 (文件, 偏移, 长度) 或字节串
+
+    给出 path 时把结果写入该临时文件并返回行数, 否则返回排序后的行。
+    """
+    if isinstance(source, tuple):
+        name, offset, length = source
+        with open(name, 'rb') as f:
+            f.seek(offset)
+            source = f.read(length)
+    lines = source.split(b'\n')
+    if lines and not lines[-1]:
+        lines.pop()
+    del source
+    key, equal = _sort_keys(options)
+    lines.sort(key=key, reverse=options['reverse'])
+    if options['unique']:
+        lines = list(_unique_lines(lines, equal))
+    if path is None:
+        return lines
+    with open(path, 'wb') as out:
+        if lines:
+            out.write(b'\n'.join(lines))
+            out.write(b'\n')
+    return len(lines)
+
+
+def _sort_chunks(paths, size: int):
+    """把文件切成约 size 字节、在换行处结束的 (文件, 偏移, 长度) 段"""
+    for path in paths:
+        with open(path, 'rb') as f:
+            total = os.fstat(f.fileno()).st_size
+            offset = 0
+            while offset < total:
+                f.seek(min(offset + size, total))
+                f.readline()
+                end = min(f.tell(), total)
+                yield path, offset, end - offset
+                offset = end
+
+
+def external_sort(paths, options, lines=None, memory: int = SORT_MEMORY, workers: Optional[int] = None,
+                  check_cancelled=None, stats: Optional[Dict[str, int]] = None):
+    """外部归并排序, 逐行生成结果 (bytes, 不含换行符)
+
+    输入为 paths 中的文件, 或 lines (管道输入, 逐行的 bytes)。能放进内存预算的输入直接在内存中排序;
+    否则切成有序段: 每段在进程池中排序后写入临时文件 (文件输入只把偏移传给子进程, 数据不经过进程间通信),
+    最后用 heapq.merge 多路归并 (段数超过 SORT_FANIN 时先分组归并)。
+    每段的原始大小为 预算 / (4 × 进程数): Python 中一行的开销约为其字节数的数倍, 各进程同时持有一段。
+    """
+    import heapq
+    import itertools
+    import operator
+    import shutil
+    import tempfile
+    workers = max(1, workers or os.cpu_count() or 1)
+    run_size = max(64 * 1024, memory // (4 * workers))
+    stats = stats if stats is not None else {}
+    stats['runs'] = 0
+    key, equal = _sort_keys(options)
+
+    if lines is None:
+        total = sum(os.path.getsize(path) for path in paths)
+        if total <= memory // 4:
+            data = []
+            for path in paths:
+                with open(path, 'rb') as f:
+                    data.append(f.read())
+                if data[-1] and not data[-1].endswith(b'\n'):
+                    data.append(b'\n')
+            yield from _sort_run(b''.join(data), options)
+            return
+        chunks = _sort_chunks(paths, run_size)
+    else:
+        def batches():
+            batch, size = [], 0
+            for line in lines:
+                batch.append(line)
+                size += len(line) + 1
+                if size >= run_size:
+                    yield b'\n'.join(batch) + b'\n'
+                    batch, size = [], 0
+            if batch:
+                yield b'\n'.join(batch) + b'\n'
+
+        chunks = batches()
+        first = next(chunks, None)
+        second = next(chunks, None)
+        if second is None:
+            yield from (_sort_run(first, options) if first else ())
+            return
+        chunks = itertools.chain((first, second), chunks)
+
+    tmpdir = tempfile.mkdtemp(prefix='supersim-sort-')
+    counter = itertools.count()
+    pool = None
+    try:
+        runs = []
+        if workers > 1:
+            pool = _process_pool(workers)
+            pending = []
+            for chunk in chunks:
+                if check_cancelled:
+                    check_cancelled()
+                runs.append(os.path.join(tmpdir, f'run-{next(counter)}'))
+                pending.append(pool.submit(_sort_run, chunk, options, runs[-1]))
+                if len(pending) >= workers:
+                    pending.pop(0).result()
+            for future in pending:
+                future.result()
+        else:
+            for chunk in chunks:
+                if check_cancelled:
+                    check_cancelled()
+                runs.append(os.path.join(tmpdir, f'run-{next(counter)}'))
+                _sort_run(chunk, options, runs[-1])
+        stats['runs'] = len(runs)
+
+        chomp = operator.itemgetter(slice(None, -1))
+
+        def merged(group):
+            files = [open(path, 'rb') for path in group]
+            try:
+                result = heapq.merge(*(map(chomp, f) for f in files), key=key, reverse=options['reverse'])
+                yield from _unique_lines(result, equal) if options['unique'] else result
+            finally:
+                for f in files:
+                    f.close()
+
+        while len(runs) > SORT_FANIN:
+            # 相邻的段合并在一起, 保持 -s 需要的输入顺序
+            merged_runs = []
+            for start in range(0, len(runs), SORT_FANIN):
+                group = runs[start:start + SORT_FANIN]
+                target = os.path.join(tmpdir, f'run-{next(counter)}')
+                with open(target, 'wb') as out:
+                    for line in merged(group):
+                        out.write(line + b'\n')
+                for path in group:
+                    os.remove(path)
+                merged_runs.append(target)
+            runs = merged_runs
+        yield from merged(runs)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+# uniq 默认的内存预算 (-S 可覆盖): 去重表超过预算后, 新出现的行按哈希分区写入临时文件
+UNIQ_MEMORY = 256 * 1024 * 1024
+
+# 溢出时的分区数 (每个分区单独去重)
+UNIQ_PARTITIONS = 64
+
+
+def uniq_adjacent(lines):
+    """相邻的相同行合并为一组, 生成 (行, 次数); 只保留当前一组, 内存占用与输入大小无关"""
+    previous, count = None, 0
+    for line in lines:
+        if count and line == previous:
+            count += 1
+            continue
+        if count:
+            yield previous, count
+        previous, count = line, 1
+    if count:
+        yield previous, count
+
+
+def unique_lines(open_lines, counts: bool = False, rereadable: bool = True, memory: int = UNIQ_MEMORY,
+                 stats: Optional[Dict[str, int]] = None, check_cancelled=None):
+    """全局去重, 按首次出现的顺序生成 (行, 次数); 不需要计数时次数为 None, 行在首次出现时立即生成
+
+    open_lines() 返回逐行的 bytes 迭代器。去重表的键是定长摘要 (16 字节 BLAKE2b, 短行直接用本身),
+    不保存整行: 需要计数时, 能重新读取的输入 (文件) 在第二遍读取时按行号输出首次出现的行,
+    管道输入只能把行保存在表中。去重表超过内存预算后不再增长 (已有的键继续计数),
+    之后新出现的行以 (摘要, 行号) 定长记录按摘要分区写入临时文件 (管道输入另把行写入一个文件)。
+    最后逐个分区去重: 分区的不同摘要数超过预算时, 按摘要的下一段字节重新分区 (相当于换一个哈希种子), 递归处理。
+    各分区得到 (首次行号, 次数), 按行号归并后再读一遍输入 (或保存的行) 取出这些行;
+    它们首次出现的位置都在表冻结之后, 输出顺序因此与全部在内存中去重相同。
+    """
+    import hashlib
+    import heapq
+    import shutil
+    import struct
+    import tempfile
+    blake2b = hashlib.blake2b
+    record = struct.Struct('<16sQ')
+    result = struct.Struct('<QQ')
+    # 每项的估计开销: 键对象、字典槽位和计数列表
+    entry_cost = 120 + 16
+
+    def key_of(line):
+        return line if len(line) <= 32 else blake2b(line, digest_size=16).digest()
+
+    stats = stats if stats is not None else {}
+    stats.update(lines=0, spilled=0, repartitioned=0)
+    keep_lines = counts and not rereadable
+    table = {}
+    used = 0
+    frozen_at = None
+    tmpdir = None
+    parts = []
+    spilled_lines = None
+    seq = -1
+    try:
+        for seq, line in enumerate(open_lines()):
+            if check_cancelled and not seq & 0xFFFF:
+                check_cancelled()
+            key = key_of(line)
+            entry = table.get(key)
+            if entry is not None:
+                if counts:
+                    entry[1] += 1
+                continue
+            if frozen_at is not None:
+                digest = key if len(line) > 32 else blake2b(line, digest_size=16).digest()
+                parts[digest[0] % UNIQ_PARTITIONS].write(record.pack(digest, seq))
+                if spilled_lines is not None:
+                    spilled_lines.write(b'%d\t' % seq + line + b'\n')
+                stats['spilled'] += 1
+                continue
+            used += 120 + len(key)
+            if counts:
+                table[key] = [seq, 1, line if keep_lines else None]
+                used += len(line) if keep_lines else 0
+            else:
+                table[key] = True
+                yield line, None
+            if used > memory:
+                frozen_at = seq + 1
+                tmpdir = tempfile.mkdtemp(prefix='supersim-uniq-')
+                parts = [open(os.path.join(tmpdir, f'part-{i}'), 'w+b') for i in range(UNIQ_PARTITIONS)]
+                if not rereadable:
+                    spilled_lines = open(os.path.join(tmpdir, 'lines'), 'w+b')
+        stats['lines'] = seq + 1
+
+        if counts and keep_lines:
+            for first, count, line in sorted(table.values()):
+                yield line, count
+        elif counts:
+            remaining = len(table)
+            for seq, line in enumerate(open_lines()):
+                if not remaining or (frozen_at is not None and seq >= frozen_at):
+                    break
+                entry = table.get(key_of(line))
+                if entry is not None and entry[0] == seq:
+                    remaining -= 1
+                    yield line, entry[1]
+        table.clear()
+        if not parts:
+            return
+
+        def records(f):
+            f.seek(0)
+            while True:
+                block = f.read(record.size * 8192)
+                if not block:
+                    break
+                yield from record.iter_unpack(block)
+
+        outputs = []
+
+        def reduce(part, depth):
+            """分区去重, 写出按行号排序的 (首次行号, 次数); 不同摘要过多时按摘要的第 depth + 1 个字节重新分区"""
+            if check_cancelled:
+                check_cancelled()
+            groups = {}
+            limit = max(1, memory // entry_cost)
+            overflow = False
+            for digest, first in records(part):
+                entry = groups.get(digest)
+                if entry is not None:
+                    entry[1] += 1
+                elif len(groups) >= limit and depth + 1 < len(digest):
+                    overflow = True
+                    break
+                else:
+                    groups[digest] = [first, 1]
+            if overflow:
+                groups.clear()
+                stats['repartitioned'] += 1
+                # 记录数是不同摘要数的上限, 据此确定子分区数, 避免打开大量几乎为空的文件
+                fanout = min(UNIQ_PARTITIONS, max(2, 2 * -(-os.fstat(part.fileno()).st_size // record.size // limit)))
+                subparts = [open(f'{part.name}.{i}', 'w+b') for i in range(fanout)]
+                try:
+                    for digest, first in records(part):
+                        subparts[digest[depth + 1] % fanout].write(record.pack(digest, first))
+                    part.close()
+                    os.remove(part.name)
+                    for subpart in subparts:
+                        reduce(subpart, depth + 1)
+                finally:
+                    for subpart in subparts:
+                        subpart.close()
+                return
+            part.close()
+            os.remove(part.name)
+            path = part.name + '.out'
+            with open(path, 'wb') as out:
+                for first, count in sorted(groups.values()):
+                    out.write(result.pack(first, count))
+            outputs.append(path)
+
+        for part in parts:
+            reduce(part, 0)
+
+        def results(path):
+            with open(path, 'rb') as f:
+                while True:
+                    block = f.read(result.size * 8192)
+                    if not block:
+                        break
+                    yield from result.iter_unpack(block)
+
+        if spilled_lines is not None:
+            spilled_lines.seek(0)
+            source = ((int(seq), line) for seq, line in
+                      (entry[:-1].split(b'\t', 1) for entry in spilled_lines))
+        else:
+            source = enumerate(open_lines())
+        for first, count in heapq.merge(*(results(path) for path in outputs)):
+            for seq, line in source:
+                if seq == first:
+                    yield line, count if counts else None
+                    break
+    finally:
+        for part in parts:
+            part.close()
+        if spilled_lines is not None:
+            spilled_lines.close()
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+# freq 每批计数的行数 (先在批内用 Counter 精确计数, 再并入摘要)
+FREQ_BATCH = 65536
+
+
+class SpaceSaving:
+    """Space-Saving 高频值摘要: 最多跟踪 2 × capacity 个值, 内存占用固定
+
+    计数是上界: 不在表中的值的真实次数不超过 floor, 新加入的值从 floor 开始计数并记下误差;
+    表满时只保留计数最大的 capacity 个值 (批量淘汰, 摊薄每次淘汰的开销)。
+    次数超过 总数 / capacity 的值一定在表中, 计数 - 误差 <= 真实次数 <= 计数。
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.counts: Dict[Any, int] = {}
+        self.errors: Dict[Any, int] = {}
+        self.floor = 0
+        self.total = 0
+
+    def update(self, batch):
+        """并入一批 {值: 次数}"""
+        counts, errors, floor = self.counts, self.errors, self.floor
+        for value, count in batch.items():
+            current = counts.get(value)
+            if current is None:
+                counts[value] = floor + count
+                if floor:
+                    errors[value] = floor
+            else:
+                counts[value] = current + count
+            self.total += count
+        if len(counts) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        if len(ranked) > self.capacity:
+            self.floor = max(self.floor, ranked[self.capacity][1])
+        self.counts = dict(ranked[:self.capacity])
+        self.errors = {value: self.errors[value] for value in self.counts if value in self.errors}
+
+    def merge(self, other: 'SpaceSaving'):
+        """合并另一份摘要: 一方没有的值按该方的 floor 计 (仍是上界)"""
+        counts, errors = {}, {}
+        for value in self.counts.keys() | other.counts.keys():
+            counts[value] = self.counts.get(value, self.floor) + other.counts.get(value, other.floor)
+            error = self.errors.get(value, 0 if value in self.counts else self.floor) + \
+                other.errors.get(value, 0 if value in other.counts else other.floor)
+            if error:
+                errors[value] = error
+        self.counts, self.errors = counts, errors
+        self.floor += other.floor
+        self.total += other.total
+        self.capacity = max(self.capacity, other.capacity)
+        if len(counts) > self.capacity:
+            self._prune()
+
+    def top(self, k: int):
+        """计数最大的 k 个值: [(值, 计数, 误差)]"""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(value, count, self.errors.get(value, 0)) for value, count in ranked]
+
+
+class HyperLogLog:
+    """HyperLogLog 基数估计: 2^precision 个寄存器 (默认 16 KiB), 相对误差约 1.04 / sqrt(2^precision)
+
+    哈希为 64 位 BLAKE2b, 与进程无关, 不同次运行保存的状态可以合并 (寄存器逐个取最大值)。
+    """
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def update(self, values):
+        import hashlib
+        blake2b = hashlib.blake2b
+        registers = self.registers
+        shift = 64 - self.precision
+        mask = (1 << shift) - 1
+        for value in values:
+            h = int.from_bytes(blake2b(value, digest_size=8).digest(), 'little')
+            index = h >> shift
+            rank = shift - (h & mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog'):
+        if other.precision != self.precision:
+            raise ValueError("HyperLogLog 精度不同, 无法合并")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def error(self) -> float:
+        return 1.04 / (len(self.registers) ** 0.5)
+
+    def count(self) -> int:
+        import math
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # 小基数时改用线性计数
+        return round(estimate)
+
+
+def freq_state(summary: SpaceSaving, distinct: HyperLogLog) -> Dict[str, Any]:
+    """把 freq 的摘要转换为可保存为 JSON 的状态 (值按 UTF-8 解码, 无法解码的字节用代理字符保留)"""
+    import base64
+    return {
+        'version': 1,
+        'capacity': summary.capacity,
+        'total': summary.total,
+        'floor': summary.floor,
+        'counters': [[value.decode('utf-8', 'surrogateescape'), count, summary.errors.get(value, 0)]
+                     for value, count in summary.counts.items()],
+        'precision': distinct.precision,
+        'registers': base64.b64encode(bytes(distinct.registers)).decode('ascii'),
+    }
+
+
+def load_freq_state(state: Dict[str, Any]):
+    """freq_state 的逆过程, 返回 (SpaceSaving, HyperLogLog); 格式不符时抛出 ValueError"""
+    import base64
+    try:
+        summary = SpaceSaving(int(state['capacity']))
+        summary.total, summary.floor = int(state['total']), int(state['floor'])
+        for value, count, error in state['counters']:
+            value = value.encode('utf-8', 'surrogateescape')
+            summary.counts[value] = int(count)
+            if error:
+                summary.errors[value] = int(error)
+        distinct = HyperLogLog(int(state['precision']))
+        registers = base64.b64decode(state['registers'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"无效的 freq 状态: {e}")
+    if len(registers) != len(distinct.registers):
+        raise ValueError("无效的 freq 状态: 寄存器数与精度不符")
+    distinct.registers = bytearray(registers)
+    return summary, distinct
+
+
+# wc 每次读入的块大小 (读入同一个缓冲区, 不为每块分配内存)
+WC_CHUNK = 8 * 1024 * 1024
+
+# UTF-8 中续字节 (0x80-0xBF) 以外的字节: 从块中删去它们, 剩下的字节数就是续字节数
+_UTF8_NON_CONTINUATION = bytes(range(0x80)) + bytes(range(0xc0, 0x100))
+
+# 把 ASCII 空白映射为空格、其余字节映射为 'x' 的转换表: 单词数即 ' x' 出现的次数 (加上块开头的单词)
+_WC_WORD_TABLE = bytes(0x20 if c in b' \t\n\r\x0b\x0c' else 0x78 for c in range(256))
+
+
+def wc_file(path: str, lines_only: bool = False) -> Dict[str, int]:
+    """按块统计一个文件, 返回 {'lines', 'words', 'chars', 'bytes'}
+
+    行数为换行符数 (末尾没有换行符的最后一行也计入); 单词按 ASCII 空白分隔, 只数单词的开头,
+    上一块以单词结尾时跨越边界的单词不重复计数; 字符数为 UTF-8 字符数 (不是续字节的字节数)。
+    只统计行数时每块只做一次 bytes.count, 接近磁盘读取速度。
+    """
+    result = {'lines': 0, 'words': 0, 'chars': 0, 'bytes': 0}
+    buffer = bytearray(WC_CHUNK)
+    in_word = False
+    last = 0
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            chunk = buffer if size == len(buffer) else buffer[:size]
+            result['bytes'] += size
+            result['lines'] += chunk.count(b'\n')
+            last = chunk[-1]
+            if lines_only:
+                continue
+            marks = chunk.translate(_WC_WORD_TABLE)
+            result['words'] += marks.count(b' x') + (marks[0] == 0x78 and not in_word)
+            in_word = marks[-1] == 0x78
+            result['chars'] += size - len(chunk.translate(None, _UTF8_NON_CONTINUATION))
+    if result['bytes'] and last != ord('\n'):
+        result['lines'] += 1
+    return result
+
+
 # ==================== PartA: 基础框架和核心功能 ====================
 
 class SuperCommandLineSystem:
-    def __init__(self):
-        self.current_dir = os.getcwd()
-        self.history = []
+    def __init__(self, max_jobs: Optional[int] = None, current_dir: Optional[str] = None):
+        self._state = threading.local()
+        self.current_dir = os.path.abspath(current_dir or os.getcwd())
+        self.history = HistoryStore.open(state_path(HISTORY_FILE))
         self.aliases = {
             'ls': 'dir',
             'll': 'dir -l',
@@ -48,7 +3281,20 @@ class SuperCommandLineSystem:
         }
         self.running = True
         self.prompt = ">>> "
-        self.user_data = {
+        self.last_status = 0
+        
+        # 后台任务 (线程池在首次提交任务时创建)
+        self.max_jobs = max_jobs or 4
+        self.jobs: Dict[int, Job] = {}
+        self._job_seq = 0
+        self._executor = None
+        
+        # 命令统计 (关闭时只有一次属性检查的开销)
+        self.stats_enabled = False
+        self.command_stats: Dict[str, CommandStats] = {}
+        self._stats_lock = threading.Lock()
+        
+        self.user_data_defaults = {
             'username': 'User',
             'level': 1,
             'experience': 0,
@@ -58,22 +3304,32 @@ class SuperCommandLineSystem:
         }
         self.load_user_data()
         
+        # 命令表只构建一次, 别名预先展开到分派表中
+        self.plugin_dir = PLUGIN_DIR
+        self._plugin_index = None
+        self.commands = self._build_command_table()
+        self.stream_commands = self._build_stream_table()
+        self._rebuild_dispatch()
+        
+    @property
+    def last_status(self) -> int:
+        """当前线程最近一条命令的状态码 (后台任务各自独立)"""
+        return getattr(self._state, 'status', 0)
+    
+    @last_status.setter
+    def last_status(self, value: int):
+        self._state.status = value
+    
     def load_user_data(self):
-        """加载用户数据"""
-        try:
-            if os.path.exists('user_data.json'):
-                with open('user_data.json', 'r', encoding='utf-8') as f:
-                    self.user_data.update(json.load(f))
-        except Exception:
-            pass
+        """加载用户数据 (快照 + 日志重放)"""
+        self.user_data = UserDataStore.open(USER_DATA_FILE, self.user_data_defaults)
     
     def save_user_data(self):
         """保存用户数据"""
         try:
-            with open('user_data.json', 'w', encoding='utf-8') as f:
-                json.dump(self.user_data, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
+            self.user_data.close()
+        except OSError as e:
+            print(f"⚠️  保存用户数据失败: {e}", file=sys.stderr)
         
     def run(self):
         """启动命令行系统"""
@@ -81,11 +3337,19 @@ class SuperCommandLineSystem:
         
         while self.running:
             try:
+                self._report_finished_jobs()
                 command = input(f"{self.current_dir} {self.prompt}").strip()
+                if command.startswith('!') and len(command) > 1:
+                    expanded = self.history.expand(command)
+                    if expanded is None:
+                        print(f"❌ 历史中没有匹配的命令: {command}")
+                        continue
+                    print(expanded)
+                    command = expanded
                 if command:
                     self.history.append(command)
-                    self.user_data['commands_used'] += 1
-                    self.execute_command(command)
+                    self.user_data.incr('commands_used')
+                    self.run_line(command)
             except KeyboardInterrupt:
                 print("\n使用 'exit' 或 'quit' 退出系统")
             except EOFError:
@@ -93,8 +3357,54 @@ class SuperCommandLineSystem:
             except Exception as e:
                 print(f"错误: {e}")
         
+        self._drain_jobs()
         self.save_user_data()
     
+    def run_batch(self, lines, errexit: bool = False, trace: bool = False) -> int:
+        """非交互批处理: 逐行执行命令, 不显示横幅和提示符
+
+        空行和 ``#`` 开头的注释行被忽略。返回进程退出码:
+        全部成功为 0, 否则为最后一个失败命令的状态码。
+        """
+        exit_code = 0
+        try:
+            for line in lines:
+                command = line.strip()
+                if not command or command.startswith('#'):
+                    continue
+                self.user_data.incr('commands_used')
+                status = self.run_line(command, trace=trace)
+                if status != 0:
+                    exit_code = status
+                    if errexit:
+                        break
+                if not self.running:
+                    break
+        except KeyboardInterrupt:
+            exit_code = 130
+        finally:
+            if self._drain_jobs() and exit_code == 0:
+                exit_code = 1
+            self.save_user_data()
+        return exit_code
+    
+    def run_line(self, line: str, trace: bool = False) -> int:
+        """执行一行命令, 支持 ``;``、``&&`` 和 ``||`` 串联, 返回最后执行命令的状态码"""
+        status = 0
+        for operator, command in _split_chain(line):
+            if operator == '&&' and status != 0:
+                continue
+            if operator == '||' and status == 0:
+                continue
+            if trace:
+                print(f"+ {command}", file=sys.stderr)
+            status = self.execute_command(command)
+            if trace:
+                print(f"[退出码 {status}] {command}", file=sys.stderr)
+            if not self.running:
+                break
+        return status
+    
     def print_banner(self):
         """打印系统横幅"""
         banner = """
@@ -122,27 +3432,9 @@ class SuperCommandLineSystem:
         )
         print(banner)
     
-    def execute_command(self, command: str):
-        """执行命令"""
-        parts = command.split()
-        if not parts:
-            return
-            
-        cmd = parts[0].lower()
-        args = parts[1:] if len(parts) > 1 else []
-        
-        # 检查别名
-        if cmd in self.aliases:
-            alias_cmd = self.aliases[cmd]
-            if ' ' in alias_cmd:
-                alias_parts = alias_cmd.split()
-                cmd = alias_parts[0]
-                args = alias_parts[1:] + args
-            else:
-                cmd = alias_cmd
-        
-        # 命令映射
-        commands = {
+    def _build_command_table(self) -> Dict[str, Any]:
+        """构建命令表 (仅在初始化时调用一次)"""
+        return {
             # 文件操作
             'dir': self.cmd_dir,
             'ls': self.cmd_dir,
@@ -162,6 +3454,8 @@ class SuperCommandLineSystem:
             'clear': self.cmd_clear,
             'tree': self.cmd_tree,
             'size': self.cmd_size,
+            'largest': self.cmd_largest,
+            'index': self.cmd_index,
             'touch': self.cmd_touch,
             
             # 系统信息
@@ -184,6 +3478,7 @@ class SuperCommandLineSystem:
             'grep': self.cmd_grep,
             'sort': self.cmd_sort,
             'uniq': self.cmd_uniq,
+            'freq': self.cmd_freq,
             'head': self.cmd_head,
             'tail': self.cmd_tail,
             'wc': self.cmd_wc,
@@ -219,101 +3514,527 @@ class SuperCommandLineSystem:
             'games': self.cmd_games,
             'level': self.cmd_level,
             
-            # 游戏命令
-            'snake': self.cmd_snake,
-            'tetris': self.cmd_tetris,
-            'guess': self.cmd_guess,
-            'tictactoe': self.cmd_tictactoe,
-            'hangman': self.cmd_hangman
-        }
+            # 性能统计
+            'stats': self.cmd_stats,
+            'bench': self.cmd_bench,
+            
+            # 后台任务
+            'jobs': self.cmd_jobs,
+            'wait': self.cmd_wait,
+            'fg': self.cmd_fg,
+            'kill': self.cmd_kill,
+            
+            # 游戏命令
+            'snake': self.cmd_snake,
+            'tetris': self.cmd_tetris,
+            'guess': self.cmd_guess,
+            'tictactoe': self.cmd_tictactoe,
+            'hangman': self.cmd_hangman
+        }
+
+    def _build_stream_table(self) -> Dict[str, Any]:
+        """构建可流式处理的命令表: 命令名 -> 生成器函数 (args, 上游行) -> 行迭代器"""
+        return {
+            'type': self.stream_type,
+            'echo': self.stream_echo,
+            'grep': self.stream_grep,
+            'sort': self.stream_sort,
+            'uniq': self.stream_uniq,
+            'freq': self.stream_freq,
+            'head': self.stream_head,
+            'tail': self.stream_tail,
+            'wc': self.stream_wc
+        }
+    
+    def register_command(self, name: str, handler, aliases=()):
+        """注册命令 (插件或扩展模块使用)"""
+        self.commands[name] = handler
+        for alias in aliases:
+            self.commands[alias] = handler
+        self._rebuild_dispatch()
+
+    def _rebuild_dispatch(self):
+        """重建分派表: 命令名/别名 -> (处理函数, 预置参数)"""
+        dispatch = {name: (handler, ()) for name, handler in self.commands.items()}
+        for alias, target in self.aliases.items():
+            target_parts = target.split()
+            if not target_parts:
+                continue
+            entry = self.commands.get(target_parts[0].lower())
+            if entry is not None:
+                dispatch[alias] = (entry, tuple(target_parts[1:]))
+            else:
+                # 目标可能是尚未加载的插件命令, 首次调用时再解析
+                dispatch.pop(alias, None)
+        self._dispatch = dispatch
+
+    def _resolve_command(self, cmd: str):
+        """解析不在分派表中的命令 (别名指向插件命令, 或插件命令本身)"""
+        target = self.aliases.get(cmd)
+        if target:
+            target_parts = target.split()
+            if target_parts and self._load_plugin_command(target_parts[0].lower()):
+                return self._dispatch.get(cmd)
+            return None
+        if self._load_plugin_command(cmd):
+            return self._dispatch.get(cmd)
+        return None
+
+    def _scan_plugins(self) -> Dict[str, str]:
+        """扫描插件目录, 只读取文件头, 不导入模块
+
+        插件文件可在开头用 ``# commands: a, b`` 声明提供的命令,
+        未声明时以文件名作为命令名。
+        """
+        index = {}
+        try:
+            names = sorted(os.listdir(self.plugin_dir))
+        except OSError:
+            return index
+        for name in names:
+            if not name.endswith('.py') or name.startswith('_'):
+                continue
+            path = os.path.join(self.plugin_dir, name)
+            provided = []
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line.startswith('#'):
+                            if line:
+                                break
+                            continue
+                        if line[1:].strip().lower().startswith('commands:'):
+                            provided = [c.strip().lower() for c in line.split(':', 1)[1].split(',') if c.strip()]
+                            break
+            except OSError:
+                continue
+            for command in provided or [name[:-3].lower()]:
+                index.setdefault(command, path)
+        return index
+
+    def _load_plugin_command(self, cmd: str) -> bool:
+        """首次调用插件命令时加载其模块并注册模块提供的全部命令"""
+        if self._plugin_index is None:
+            self._plugin_index = self._scan_plugins()
+        path = self._plugin_index.get(cmd)
+        if path is None:
+            return False
+
+        module = _PLUGIN_MODULES.get(path)
+        if module is None:
+            import importlib.util
+            module_name = "supersim_plugin_" + os.path.splitext(os.path.basename(path))[0]
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _PLUGIN_MODULES[path] = module
+
+        provided = getattr(module, 'COMMANDS', {})
+        for name, func in provided.items():
+            self.commands[name.lower()] = functools.partial(func, self)
+            self._plugin_index.pop(name.lower(), None)
+        self._rebuild_dispatch()
+        return cmd in self.commands
+
+    def execute_command(self, command: str) -> int:
+        """执行命令, 返回状态码 (0 表示成功)"""
+        stripped = command.rstrip()
+        if stripped.endswith('&') and not stripped.endswith('&&'):
+            return self._submit_job(stripped[:-1].strip())
+        
+        if '|' in command or '>' in command:
+            stages, redirect = _split_pipeline(command)
+            if len(stages) > 1 or redirect:
+                if self.stats_enabled:
+                    sample = ResourceSample()
+                    status = self._execute_pipeline(stages, redirect)
+                    self._record_stats('pipeline', sample, status)
+                    return status
+                return self._execute_pipeline(stages, redirect)
+        
+        parts = command.split()
+        if not parts:
+            return 0
+            
+        cmd = parts[0].lower()
+        args = parts[1:]
+        self.last_status = 0
+        
+        entry = self._dispatch.get(cmd)
+        if entry is None:
+            try:
+                entry = self._resolve_command(cmd)
+            except Exception as e:
+                self._fail(f"❌ 加载插件失败: {e}")
+                return self.last_status
         
-        if cmd in commands:
+        if entry is not None:
+            handler, preset_args = entry
+            if preset_args:
+                args = list(preset_args) + args
+            sample = ResourceSample() if self.stats_enabled else None
             try:
-                commands[cmd](args)
+                handler(args)
+            except CommandCancelled:
+                self._fail("⏹️  命令已终止", 130)
             except Exception as e:
-                print(f"命令执行错误: {e}")
+                self._fail(f"命令执行错误: {e}")
+            if sample is not None:
+                name = getattr(handler, '__name__', '')
+                self._record_stats(name[4:] if name.startswith('cmd_') else cmd, sample, self.last_status)
         else:
-            print(f"未知命令: {cmd}")
+            self._fail(f"未知命令: {cmd}", 127)
             print("输入 'help' 查看可用命令")
+        return self.last_status
+    
+    def _execute_pipeline(self, stages, redirect) -> int:
+        """执行管道: 各阶段之间通过生成器逐行传递, 末尾可重定向到文件"""
+        self.last_status = 0
+        if any(not stage for stage in stages) or (redirect and not redirect[1]):
+            self._fail("❌ 管道语法错误")
+            return self.last_status
+        
+        out = None
+        iterators = []
+        try:
+            if redirect:
+                mode, target = redirect
+                out = open(os.path.join(self.current_dir, target), mode,
+                           encoding='utf-8', buffering=1 << 16)
+            
+            lines = None
+            for index, stage in enumerate(stages):
+                cmd, args = self._resolve_stage(stage)
+                stream = self.stream_commands.get(cmd)
+                if stream is not None:
+                    lines = stream(args, lines)
+                    iterators.append(lines)
+                elif index == len(stages) - 1:
+                    # 非流式命令作为最后一个阶段: 直接输出 (或重定向到文件)
+                    for _ in lines or ():
+                        pass
+                    if out is not None:
+                        with capture_output(out):
+                            self.execute_command(stage)
+                    else:
+                        self.execute_command(stage)
+                    return self.last_status
+                else:
+                    lines = self._captured_lines(stage)
+                    iterators.append(lines)
+            
+            _write_lines(out if out is not None else sys.stdout, lines)
+        except CommandCancelled:
+            self._fail("⏹️  命令已终止", 130)
+        except UsageError as e:
+            self._usage(str(e))
+        except Exception as e:
+            self._fail(f"❌ 管道执行失败: {e}")
+        finally:
+            # 提前结束时 (如 head) 关闭上游生成器, 以便及时关闭文件
+            for iterator in iterators:
+                close = getattr(iterator, 'close', None)
+                if close is not None:
+                    close()
+            if out is not None:
+                out.close()
+        return self.last_status
+    
+    def _resolve_stage(self, stage: str):
+        """解析管道阶段的命令名和参数 (展开别名)"""
+        parts = stage.split()
+        cmd = parts[0].lower()
+        args = parts[1:]
+        target = self.aliases.get(cmd)
+        if target:
+            target_parts = target.split()
+            cmd = target_parts[0].lower()
+            args = target_parts[1:] + args
+        return cmd, args
+    
+    def _captured_lines(self, command: str):
+        """执行非流式命令并捕获其输出, 作为管道的上游行"""
+        import io
+        buffer = io.StringIO()
+        with capture_output(buffer):
+            self.execute_command(command)
+        yield from buffer.getvalue().splitlines()
+    
+    def _fail(self, message: str, status: int = 1):
+        """打印错误信息并将当前命令标记为失败"""
+        print(message)
+        self.last_status = status
+    
+    def _usage(self, message: str):
+        """打印用法说明 (参数错误, 状态码 2)"""
+        self._fail(message, 2)
     
     # ==================== 文件操作命令 ====================
     
+    def _parse_dir_args(self, args):
+        """解析 dir 参数, 返回选项字典; 参数错误时抛出 ValueError"""
+        options = {'sort': 'name', 'reverse': False, 'stream': False,
+                   'limit': None, 'page': None, 'paths': []}
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg in ('--limit', '--page'):
+                if not args or not args[0].isdigit() or int(args[0]) < 1:
+                    raise ValueError(f"{arg} 需要正整数")
+                options[arg[2:]] = int(args.pop(0))
+            elif arg == '--stream':
+                options['stream'] = True
+            elif arg.startswith('-') and len(arg) > 1 and not arg.startswith('--'):
+                for flag in arg[1:]:
+                    if flag == 's':
+                        options['sort'] = 'size'
+                    elif flag == 't':
+                        options['sort'] = 'mtime'
+                    elif flag == 'r':
+                        options['reverse'] = True
+                    elif flag != 'l':
+                        raise ValueError(f"未知选项: -{flag}")
+            elif arg.startswith('--'):
+                raise ValueError(f"未知选项: {arg}")
+            else:
+                options['paths'].append(arg)
+        if len(options['paths']) > 2:
+            raise ValueError("参数过多")
+        if options['stream'] and (options['sort'] != 'name' or options['reverse']):
+            raise ValueError("--stream 按扫描顺序输出, 不能与 -s/-t/-r 同时使用")
+        return options
+    
+    def _dir_entry_line(self, name, st):
+        """格式化 dir 的一行文件信息"""
+        if st is None:
+            return f"  📄 {name:<35} {'?':>10}  {'?':>19}"
+        mtime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(st.st_mtime))
+        return f"  📄 {name:<35} {self._format_size(st.st_size):>10}  {mtime}"
+    
+    def _scan_dir(self, full_path, pattern):
+        """用 scandir 扫描目录, 逐个产生 (名称, 是否目录, DirEntry)"""
+        import fnmatch
+        with os.scandir(full_path) as it:
+            for count, entry in enumerate(it):
+                if not count & 4095:
+                    self._check_cancelled()
+                if pattern and not fnmatch.fnmatch(entry.name, pattern):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                yield entry.name, is_dir, entry
+    
+    @staticmethod
+    def _entry_stat(entry):
+        """DirEntry 的 stat 结果 (结果由 DirEntry 缓存; 失效的符号链接返回链接本身, 否则为 None)"""
+        try:
+            return entry.stat()
+        except OSError:
+            try:
+                return entry.stat(follow_symlinks=False)
+            except OSError:
+                return None
+    
     def cmd_dir(self, args):
-        """列出目录内容"""
-        path = args[0] if args else "."
+        """列出目录内容: dir [路径] [模式] [-s|-t] [-r] [--limit N] [--page P] [--stream]"""
+        try:
+            options = self._parse_dir_args(args)
+        except ValueError as e:
+            self._usage(f"❌ {e}\n用法: dir [路径] [通配符] [-s 按大小] [-t 按时间] [-r 逆序] "
+                        f"[--limit N] [--page P] [--stream]")
+            return
+        
+        paths = options['paths']
+        path = paths[0] if paths else "."
+        pattern = paths[1] if len(paths) > 1 else None
         full_path = os.path.join(self.current_dir, path)
+        # dir *.log / dir logs/*.log: 最后一段含通配符时作为过滤模式
+        if pattern is None and not os.path.exists(full_path) and any(c in path for c in '*?['):
+            path, pattern = os.path.split(path)
+            path = path or "."
+            full_path = os.path.join(self.current_dir, path)
         
         if not os.path.exists(full_path):
-            print(f"路径不存在: {path}")
+            self._fail(f"路径不存在: {path}")
             return
         
         if os.path.isfile(full_path):
             self._print_file_info(full_path)
             return
         
+        limit = options['limit']
+        if options['page'] is not None and limit is None:
+            limit = 100
+        start = (options['page'] - 1) * limit if options['page'] else 0
+        
         try:
-            items = os.listdir(full_path)
-            files = []
-            dirs = []
-            
-            for item in items:
-                item_path = os.path.join(full_path, item)
-                if os.path.isdir(item_path):
-                    dirs.append(item)
-                else:
-                    files.append(item)
-            
-            # 排序
-            dirs.sort()
-            files.sort()
-            
             print(f"\n📁 目录: {os.path.abspath(full_path)}")
             print("=" * 70)
-            
-            if dirs:
-                print("\n📁 [目录]")
-                for d in dirs:
-                    print(f"  📁 {d}/")
-            
-            if files:
-                print("\n📄 [文件]")
-                for f in files:
-                    file_path = os.path.join(full_path, f)
-                    size = os.path.getsize(file_path)
-                    mtime = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
-                    size_str = self._format_size(size)
-                    print(f"  📄 {f:<35} {size_str:>10}  {mtime.strftime('%Y-%m-%d %H:%M:%S')}")
-            
-            print(f"\n📊 总计: {len(dirs)} 个目录, {len(files)} 个文件")
-            
+            if options['stream']:
+                self._dir_stream(full_path, pattern, start, limit)
+            else:
+                self._dir_sorted(full_path, pattern, options['sort'], options['reverse'], start, limit)
         except PermissionError:
-            print(f"❌ 权限不足: {path}")
+            self._fail(f"❌ 权限不足: {path}")
         except Exception as e:
-            print(f"❌ 错误: {e}")
+            self._fail(f"❌ 错误: {e}")
+    
+    def _dir_stream(self, full_path, pattern, start, limit):
+        """边扫描边输出 (扫描顺序), 取够 limit 项后停止扫描"""
+        counts = [0, 0]
+        
+        def lines():
+            index = 0
+            for name, is_dir, entry in self._scan_dir(full_path, pattern):
+                if index >= start:
+                    counts[not is_dir] += 1
+                    yield f"  📁 {name}/" if is_dir else self._dir_entry_line(name, self._entry_stat(entry))
+                index += 1
+                if limit is not None and index >= start + limit:
+                    return
+        
+        _write_lines(sys.stdout, lines())
+        print(f"\n📊 已显示: {counts[0]} 个目录, {counts[1]} 个文件")
+    
+    def _dir_sorted(self, full_path, pattern, sort, reverse, start, limit):
+        """扫描完成后排序输出: 目录在前、文件在后; 有 limit 时只对需要的前若干项排序"""
+        import heapq
+        dirs = []
+        files = []
+        for name, is_dir, entry in self._scan_dir(full_path, pattern):
+            (dirs if is_dir else files).append((name, entry))
+        dir_count, file_count = len(dirs), len(files)
+        want = None if limit is None else start + limit
+        
+        def top(items, count, key):
+            # 只需要前 count 项时用堆选择, 避免对几十万项完整排序
+            if count is None or count >= len(items):
+                return sorted(items, key=key)
+            return heapq.nsmallest(count, items, key=key)
+        
+        # 目录按名称排序; 文件按名称、大小 (大在前) 或修改时间 (新在前) 排序
+        sign = -1 if reverse else 1
+        if reverse:
+            dirs = sorted(dirs, reverse=True) if want is None else heapq.nlargest(want, dirs)
+        else:
+            dirs = top(dirs, want, None)
+        file_want = None if want is None else max(0, want - dir_count)
+        if sort == 'name':
+            if reverse:
+                files = sorted(files, reverse=True) if file_want is None else heapq.nlargest(file_want, files)
+            else:
+                files = top(files, file_want, None)
+            files = [(name, self._entry_stat(entry)) for name, entry in files[max(0, start - dir_count):]]
+        else:
+            # 按大小/时间排序需要每个文件的 stat; DirEntry 缓存结果, 输出时不再重复调用
+            field = 'st_size' if sort == 'size' else 'st_mtime'
+            keyed = []
+            for count, (name, entry) in enumerate(files):
+                if not count & 4095:
+                    self._check_cancelled()
+                st = self._entry_stat(entry)
+                keyed.append((-sign * (getattr(st, field) if st else 0), name, st))
+            keyed = top(keyed, file_want, lambda k: (k[0], k[1]))
+            files = [(name, st) for _, name, st in keyed[max(0, start - dir_count):]]
+        shown_dirs = dirs[start:want]
+        
+        if shown_dirs:
+            print("\n📁 [目录]")
+            _write_lines(sys.stdout, (f"  📁 {name}/" for name, _ in shown_dirs))
+        if files:
+            print("\n📄 [文件]")
+            _write_lines(sys.stdout, (self._dir_entry_line(name, st) for name, st in files))
+        
+        summary = f"\n📊 总计: {dir_count} 个目录, {file_count} 个文件"
+        if limit is not None:
+            shown = len(shown_dirs) + len(files)
+            summary += f" (显示第 {start + 1}-{start + shown} 项)" if shown else " (本页无内容)"
+        print(summary)
     
     def cmd_copy(self, args):
-        """复制文件或目录"""
-        if len(args) < 2:
-            print("用法: copy <源> <目标>")
+        """复制文件或目录: copy [-j N] [--hash|--force] <源> <目标>
+
+        文件在线程池中并发复制, 数据用 copy_file_range/sendfile 在内核中传输; 终端上显示速率和剩余时间。
+        大小和修改时间与源文件相同的目标文件跳过 (--hash 改为比较内容, --force 全部重新复制),
+        中断后再次执行同一命令会从 .part 文件续传。
+        """
+        usage = "用法: copy [-j 线程数] [--hash|--force] <源> <目标>"
+        mode = 'mtime'
+        workers = None
+        paths = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg == '-j':
+                if not args or not args[0].isdigit() or int(args[0]) < 1:
+                    self._usage(usage)
+                    return
+                workers = int(args.pop(0))
+            elif arg in ('--hash', '--force'):
+                mode = arg[2:]
+            elif arg.startswith('-') and len(arg) > 1:
+                self._usage(f"❌ 未知选项: {arg}\n{usage}")
+                return
+            else:
+                paths.append(arg)
+        if len(paths) != 2:
+            self._usage(usage)
             return
         
-        src = os.path.join(self.current_dir, args[0])
-        dst = os.path.join(self.current_dir, args[1])
+        src = os.path.join(self.current_dir, paths[0])
+        dst = os.path.join(self.current_dir, paths[1])
+        is_dir = os.path.isdir(src)
+        if not is_dir and os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        if is_dir:
+            real_src = os.path.realpath(src)
+            if os.path.commonpath([real_src, os.path.realpath(dst)]) == real_src:
+                self._fail(f"❌ 复制失败: 不能把目录复制到其自身内部: {dst}")
+                return
+        
+        tty = sys.stdout.isatty()
+        started = time.monotonic()
+        
+        def show(stats):
+            elapsed = time.monotonic() - started
+            rate = stats['written'] / elapsed if elapsed else 0
+            line = f"\r📊 {stats['done'] * 100 / max(stats['bytes'], 1):5.1f}%  " \
+                   f"{self._format_size(stats['done'])}/{self._format_size(stats['bytes'])}  " \
+                   f"{self._format_size(int(rate))}/s"
+            if rate:
+                line += f"  剩余 {_format_age((stats['bytes'] - stats['done']) / rate)}"
+            print(line.ljust(72), end='', flush=True)
         
         try:
-            if os.path.isdir(src):
-                shutil.copytree(src, dst, dirs_exist_ok=True)
-                print(f"✅ 目录已复制: {src} -> {dst}")
-            else:
-                shutil.copy2(src, dst)
-                print(f"✅ 文件已复制: {src} -> {dst}")
-        except Exception as e:
-            print(f"❌ 复制失败: {e}")
+            stats = copy_tree(src, dst, mode, workers, show if tty else None, self._check_cancelled)
+        except OSError as e:
+            self._fail(f"❌ 复制失败: {e}")
+            return
+        elapsed = time.monotonic() - started
+        if tty and elapsed >= 0.5:
+            print("\r" + " " * 72 + "\r", end='')
+        
+        print(f"✅ {'目录' if is_dir else '文件'}已复制: {src} -> {dst}")
+        if is_dir or stats['skipped'] or stats['resumed']:
+            summary = f"📊 {stats['files']} 个文件 ({self._format_size(stats['bytes'])}): 复制 {stats['copied']}"
+            if stats['resumed']:
+                summary += f", 续传 {stats['resumed']}"
+            if stats['skipped']:
+                summary += f", 跳过 {stats['skipped']} 个未变化的文件"
+            if stats['written'] and elapsed >= 0.01:
+                summary += f"; 用时 {elapsed:.2f} 秒, {self._format_size(int(stats['written'] / elapsed))}/s"
+            print(summary)
+        if stats['failed']:
+            self._fail(f"❌ {stats['failed']} 个文件复制失败:\n" +
+                       "\n".join(f"  {error}" for error in stats['errors']))
     
     def cmd_move(self, args):
         """移动文件或目录"""
         if len(args) < 2:
-            print("用法: move <源> <目标>")
+            self._usage("用法: move <源> <目标>")
             return
         
         src = os.path.join(self.current_dir, args[0])
@@ -323,60 +4044,307 @@ class SuperCommandLineSystem:
             shutil.move(src, dst)
             print(f"✅ 已移动: {src} -> {dst}")
         except Exception as e:
-            print(f"❌ 移动失败: {e}")
+            self._fail(f"❌ 移动失败: {e}")
     
     def cmd_delete(self, args):
-        """删除文件或目录"""
-        if not args:
-            print("用法: del <文件或目录>")
+        """删除文件或目录: del [-j N] [--dry-run] <文件或目录>...
+
+        目录树在线程池中并行删除 (文件按批并发删除, 目录自底向上删除), 终端上显示删除速率;
+        --dry-run 只统计将要删除的文件数和字节数, 不做任何修改。
+        """
+        usage = "用法: del [-j 线程数] [--dry-run] <文件或目录>..."
+        dry_run = False
+        workers = None
+        items = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg == '-j':
+                if not args or not args[0].isdigit() or int(args[0]) < 1:
+                    self._usage(usage)
+                    return
+                workers = int(args.pop(0))
+            elif arg in ('-n', '--dry-run'):
+                dry_run = True
+            elif arg.startswith('-') and len(arg) > 1:
+                self._usage(f"❌ 未知选项: {arg}\n{usage}")
+                return
+            else:
+                items.append(arg)
+        if not items:
+            self._usage(usage)
             return
         
-        for item in args:
+        tty = sys.stdout.isatty()
+        for item in items:
             path = os.path.join(self.current_dir, item)
             try:
-                if os.path.isdir(path):
-                    shutil.rmtree(path)
-                    print(f"✅ 目录已删除: {item}")
-                else:
-                    os.remove(path)
-                    print(f"✅ 文件已删除: {item}")
+                if not os.path.isdir(path) or os.path.islink(path):
+                    if dry_run:
+                        size = os.lstat(path).st_size
+                        print(f"🔍 将删除文件 {item} ({self._format_size(size)})")
+                    else:
+                        os.remove(path)
+                        print(f"✅ 文件已删除: {item}")
+                    continue
             except Exception as e:
-                print(f"❌ 删除失败 {item}: {e}")
+                self._fail(f"❌ 删除失败 {item}: {e}")
+                continue
+            
+            started = time.monotonic()
+            
+            def show(stats):
+                elapsed = time.monotonic() - started
+                if dry_run:
+                    line = f"\r🔍 已扫描 {stats['files']} 个文件, {stats['dirs']} 个目录"
+                else:
+                    line = f"\r🗑️  已删除 {stats['removed']}/{stats['files'] + stats['dirs']} 项, " \
+                           f"{stats['removed'] / elapsed:.0f} 个/秒"
+                print(line.ljust(60), end='', flush=True)
+            
+            try:
+                stats = delete_tree(path, dry_run, workers, show if tty else None, self._check_cancelled)
+            except OSError as e:
+                self._fail(f"❌ 删除失败 {item}: {e}")
+                continue
+            elapsed = time.monotonic() - started
+            if tty and elapsed >= 0.5:
+                print("\r" + " " * 60 + "\r", end='')
+            
+            if dry_run:
+                print(f"🔍 将删除目录 {item}: {stats['files']} 个文件, {stats['dirs']} 个子目录, "
+                      f"{self._format_size(stats['bytes'])}")
+            elif not stats['failed']:
+                summary = f"✅ 目录已删除: {item} ({stats['files']} 个文件, {stats['dirs']} 个子目录"
+                if elapsed >= 0.01:
+                    summary += f", 用时 {elapsed:.2f} 秒, {stats['removed'] / elapsed:.0f} 个/秒"
+                print(summary + ")")
+            if stats['failed']:
+                self._fail(f"❌ 删除失败 {item}: {stats['failed']} 项无法删除:\n" +
+                           "\n".join(f"  {error}" for error in stats['errors']))
     
     def cmd_type(self, args):
-        """显示文件内容"""
-        if not args:
-            print("用法: type <文件>")
+        """显示文件内容: type [-x] [-p|-P] [--line N | --offset N] [-n 行数] <文件>
+
+        按块流式读取, 内存占用与文件大小无关; 非 UTF-8 内容以替换字符显示, 二进制文件 (或 -x)
+        以十六进制转储显示。--line 借助按需构建的稀疏行索引直接跳到指定行。
+        终端上内容超过一屏时进入分页器 (-p 强制进入, -P 不进入)。
+        """
+        usage = "用法: type [-x] [-p|-P] [--line N | --offset N] [-n 行数] <文件>"
+        hex_mode = False
+        pager = None
+        line = offset = count = None
+        files = []
+        args = list(args)
+        try:
+            while args:
+                arg = args.pop(0)
+                if arg == '-x':
+                    hex_mode = True
+                elif arg in ('-p', '-P'):
+                    pager = arg == '-p'
+                elif arg in ('--line', '--offset', '-n') and args:
+                    value = args.pop(0)
+                    # 只有 --offset 接受 0x 十六进制 (与 -x 转储的偏移对应), 其余按十进制解析 (010 即 10)
+                    value = int(value, 16) if arg == '--offset' and value[:2].lower() == '0x' else int(value)
+                    if value < (0 if arg == '--offset' else 1):
+                        raise ValueError(arg)
+                    if arg == '--line':
+                        line = value
+                    elif arg == '--offset':
+                        offset = value
+                    else:
+                        count = value
+                elif arg.startswith('-') and len(arg) > 1:
+                    raise ValueError(arg)
+                else:
+                    files.append(arg)
+        except ValueError:
+            self._usage(usage)
+            return
+        if len(files) != 1 or (line is not None and offset is not None):
+            self._usage(usage)
             return
         
-        file_path = os.path.join(self.current_dir, args[0])
+        name = files[0]
+        file_path = os.path.join(self.current_dir, name)
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                print(f"📄 文件内容: {args[0]}")
-                print("=" * 50)
-                print(content)
-        except Exception as e:
-            print(f"❌ 读取文件失败: {e}")
+            with open(file_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if not hex_mode and b'\0' in f.read(8192):
+                    hex_mode = True
+                    print(f"📦 {name} 是二进制文件, 以十六进制显示")
+                index = None
+                if line is not None or (not hex_mode and offset is not None):
+                    index = LineIndex.open(file_path)
+                if line is not None:
+                    offset = index.seek_line(f, line)
+                    if offset is None:
+                        self._fail(f"❌ {name} 只有 {index.line_count(f)} 行")
+                        return
+                elif offset is not None and offset > size:
+                    self._fail(f"❌ 偏移超出文件大小 ({size} 字节)")
+                    return
+                elif offset is not None and index is not None:
+                    # 文本模式从偏移所在行的行首开始显示
+                    line = index.line_at(f, offset)
+                    offset = index.seek_line(f, line) or 0
+                offset = offset or 0
+                
+                rows = shutil.get_terminal_size().lines - 2
+                if pager is None:
+                    pager = (count is None and sys.stdout.isatty() and sys.stdin.isatty()
+                             and size - offset > rows * 16 * (1 if hex_mode else 4))
+                if pager:
+                    self._page_file(name, f, size, hex_mode, offset, line)
+                elif hex_mode:
+                    _write_lines(sys.stdout, _hex_lines(f, offset, count))
+                else:
+                    self._print_text(name, f, offset, line, count)
+                if index is not None:
+                    index.save()
+        except OSError as e:
+            self._fail(f"❌ 读取文件失败: {e}")
+    
+    def _print_text(self, name, f, offset, line, count):
+        """从 offset 开始流式输出文本 (无法解码的字节以替换字符显示), count 为最多输出的行数"""
+        import codecs
+        import itertools
+        print(f"📄 文件内容: {name}" + (f" (从第 {line} 行开始)" if line and line > 1 else ""))
+        print("=" * 50)
+        f.seek(offset)
+        if count is not None:
+            decode = codecs.getincrementaldecoder('utf-8')('replace').decode
+            _write_lines(sys.stdout, (decode(raw, True).rstrip('\r\n') for raw in itertools.islice(f, count)))
+            return
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        last = '\n'
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            self._check_cancelled()
+            text = decoder.decode(chunk)
+            sys.stdout.write(text)
+            last = text[-1:] or last
+        text = decoder.decode(b'', True)
+        sys.stdout.write(text if (text or last).endswith('\n') else text + '\n')
+    
+    def _page_file(self, name, f, size, hex_mode, offset, line):
+        """交互式分页器: 回车下一页, b 上一页, g 行号, o 偏移, /文本 搜索, q 退出"""
+        import mmap
+        columns, rows = shutil.get_terminal_size()
+        rows = max(rows - 2, 5)
+        index = None if hex_mode else LineIndex.open(f.name)
+        if index is not None and line is None:
+            line = index.line_at(f, offset)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        help_text = "回车/空格 下一页  b 上一页  g 行号  G 末页  o 偏移  /文本 搜索  q 退出"
+        try:
+            while True:
+                f.seek(offset)
+                if hex_mode:
+                    shown = list(_hex_lines(f, offset, rows))
+                    next_offset = min(offset + rows * 16, size)
+                    search_from = offset + 16
+                else:
+                    shown = []
+                    search_from = offset + 1
+                    for _ in range(rows):
+                        raw = f.readline(columns * 4)
+                        if not raw:
+                            break
+                        if not raw.endswith(b'\n'):
+                            # 超长行只显示开头, 跳过其余部分
+                            while True:
+                                rest = f.readline(1024 * 1024)
+                                if not rest or rest.endswith(b'\n'):
+                                    break
+                        shown.append(raw.rstrip(b'\r\n').decode('utf-8', 'replace')[:columns])
+                        if len(shown) == 1:
+                            search_from = f.tell()
+                    next_offset = f.tell()
+                _write_lines(sys.stdout, shown)
+                
+                position = f"{offset}/{size} 字节" if hex_mode else f"第 {line} 行, {offset}/{size} 字节"
+                percent = next_offset * 100 // size if size else 100
+                try:
+                    reply = input(f"-- {name} {position} ({percent}%) -- ").strip()
+                except EOFError:
+                    print()
+                    return
+                
+                if reply == 'q':
+                    return
+                elif reply in ('', 'f'):
+                    if next_offset >= size:
+                        return
+                    if index is not None:
+                        line += len(shown)
+                    offset = next_offset
+                elif reply == 'b':
+                    if hex_mode:
+                        offset = max(0, offset - rows * 16)
+                    else:
+                        line = max(1, line - rows)
+                        offset = index.seek_line(f, line)
+                elif reply == 'G':
+                    if hex_mode:
+                        offset = max(0, (size - 1) // 16 - rows + 1) * 16
+                    else:
+                        line = max(1, index.line_count(f) - rows + 1)
+                        offset = index.seek_line(f, line)
+                elif reply[:1] in ('g', 'o') and reply[1:].strip():
+                    try:
+                        value = int(reply[1:].strip(), 0)
+                    except ValueError:
+                        print(help_text)
+                        continue
+                    if reply[0] == 'g' and index is not None:
+                        target = index.seek_line(f, max(1, value))
+                        if target is None:
+                            print(f"⚠️  文件只有 {index.line_count(f)} 行")
+                            continue
+                        line, offset = max(1, value), target
+                    elif 0 <= value < max(size, 1):
+                        offset = value - value % 16
+                        if index is not None:
+                            line = index.line_at(f, value)
+                            offset = index.seek_line(f, line)
+                    else:
+                        print(f"⚠️  偏移超出文件大小 ({size} 字节)")
+                elif reply.startswith('/') and len(reply) > 1 and mapped is not None:
+                    found = mapped.find(reply[1:].encode('utf-8'), search_from)
+                    if found < 0:
+                        print(f"⚠️  未找到: {reply[1:]}")
+                        continue
+                    offset = found - found % 16
+                    if index is not None:
+                        line = index.line_at(f, found)
+                        offset = index.seek_line(f, line)
+                else:
+                    print(help_text)
+        finally:
+            if mapped is not None:
+                mapped.close()
+            if index is not None:
+                index.save()
     
     def cmd_mkdir(self, args):
         """创建目录"""
         if not args:
-            print("用法: mkdir <目录名>")
+            self._usage("用法: mkdir <目录名>")
             return
         
         for dir_name in args:
             try:
                 os.makedirs(os.path.join(self.current_dir, dir_name), exist_ok=True)
                 print(f"✅ 目录已创建: {dir_name}")
-                self.user_data['files_created'] += 1
+                self.user_data.incr('files_created')
             except Exception as e:
-                print(f"❌ 创建目录失败 {dir_name}: {e}")
+                self._fail(f"❌ 创建目录失败 {dir_name}: {e}")
     
     def cmd_rmdir(self, args):
         """删除空目录"""
         if not args:
-            print("用法: rmdir <目录名>")
+            self._usage("用法: rmdir <目录名>")
             return
         
         for dir_name in args:
@@ -384,12 +4352,12 @@ class SuperCommandLineSystem:
                 os.rmdir(os.path.join(self.current_dir, dir_name))
                 print(f"✅ 目录已删除: {dir_name}")
             except Exception as e:
-                print(f"❌ 删除目录失败 {dir_name}: {e}")
+                self._fail(f"❌ 删除目录失败 {dir_name}: {e}")
     
     def cmd_cd(self, args):
         """切换目录"""
         if not args:
-            print("用法: cd <目录>")
+            self._usage("用法: cd <目录>")
             return
         
         path = args[0]
@@ -400,11 +4368,15 @@ class SuperCommandLineSystem:
         else:
             new_dir = os.path.join(self.current_dir, path)
         
-        try:
-            os.chdir(new_dir)
-            self.current_dir = os.getcwd()
-        except Exception as e:
-            print(f"❌ 切换目录失败: {e}")
+        # 只修改本会话的虚拟工作目录 (不调用 os.chdir), 所有文件命令都基于 current_dir 解析路径,
+        # 因此同一进程中的多个会话互不影响
+        new_dir = os.path.normpath(new_dir)
+        if not os.path.isdir(new_dir):
+            self._fail(f"❌ 切换目录失败: 目录不存在: {path}")
+        elif not os.access(new_dir, os.X_OK):
+            self._fail(f"❌ 切换目录失败: 权限不足: {path}")
+        else:
+            self.current_dir = new_dir
     
     def cmd_pwd(self, args):
         """显示当前目录"""
@@ -414,66 +4386,478 @@ class SuperCommandLineSystem:
         """清屏"""
         os.system('cls' if os.name == 'nt' else 'clear')
     
+    @staticmethod
+    def _scan_tree_dir(path, dirs_only=False, sizes=False):
+        """扫描单个目录 (在线程池中运行), 返回 (按名称排序的条目, 是否无法读取)
+
+        条目为 (名称, 是否目录, 是否可展开, 文件大小或 None); 指向目录的符号链接不展开, 避免循环。
+        """
+        entries = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if dirs_only and not is_dir:
+                        continue
+                    size = None
+                    if sizes and not is_dir:
+                        try:
+                            size = entry.stat().st_size
+                        except OSError:
+                            size = 0
+                    entries.append((entry.name, is_dir, is_dir and not entry.is_symlink(), size))
+        except OSError:
+            return [], True
+        entries.sort()
+        return entries, False
+    
+    def _tree_lines(self, pool, root, depth_limit, max_entries, dirs_only, sizes, counts, lister=None):
+        """按确定的先序输出目录树的各行
+
+        进入目录时把其前 SCAN_WORKERS 个子目录提交到线程池并发扫描,
+        每取走一个结果再补交下一个, 输出顺序与单线程遍历相同。
+        lister 默认为 _scan_tree_dir, 也可以是 FsIndex.children。
+        """
+        scan = functools.partial(lister or self._scan_tree_dir, dirs_only=dirs_only, sizes=sizes)
+        
+        def open_frame(path, entries, prefix, depth):
+            pending = [i for i, entry in enumerate(entries) if entry[2]] if depth < depth_limit else []
+            frame = {'path': path, 'entries': entries, 'prefix': prefix, 'depth': depth,
+                     'pos': 0, 'pending': pending, 'futures': {}}
+            prefetch(frame)
+            return frame
+        
+        def prefetch(frame):
+            while frame['pending'] and len(frame['futures']) < SCAN_WORKERS:
+                i = frame['pending'].pop(0)
+                frame['futures'][i] = pool.submit(scan, os.path.join(frame['path'], frame['entries'][i][0]))
+        
+        entries, _ = scan(root)
+        stack = [open_frame(root, entries, "", 1)]
+        shown = 0
+        while stack:
+            frame = stack[-1]
+            entries = frame['entries']
+            if frame['pos'] >= len(entries):
+                stack.pop()
+                continue
+            if max_entries is not None and shown >= max_entries:
+                counts['truncated'] = True
+                return
+            i = frame['pos']
+            frame['pos'] += 1
+            shown += 1
+            if not shown & 1023:
+                self._check_cancelled()
+            name, is_dir, _, size = entries[i]
+            is_last = frame['pos'] == len(entries)
+            line = f"{frame['prefix']}{'└── ' if is_last else '├── '}"
+            if is_dir:
+                counts['dirs'] += 1
+                yield f"{line}📁 {name}/"
+            else:
+                counts['files'] += 1
+                if size is None:
+                    yield f"{line}📄 {name}"
+                else:
+                    counts['size'] += size
+                    yield f"{line}📄 {name} ({self._format_size(size)})"
+            
+            future = frame['futures'].pop(i, None)
+            if future is None:
+                continue
+            prefetch(frame)
+            child_entries, denied = future.result()
+            child_prefix = frame['prefix'] + ("    " if is_last else "│   ")
+            if denied:
+                yield f"{child_prefix}└── ❌ [权限不足]"
+                continue
+            stack.append(open_frame(os.path.join(frame['path'], name), child_entries,
+                                    child_prefix, frame['depth'] + 1))
+    
     def cmd_tree(self, args):
-        """显示目录树"""
-        path = args[0] if args else "."
-        full_path = os.path.join(self.current_dir, path)
+        """显示目录树: tree [路径] [--depth N] [--max-entries N] [--dirs-only] [-s] [--live]"""
+        usage = "用法: tree [路径] [--depth N] [--max-entries N] [--dirs-only|-d] [-s 显示大小] [--live]"
+        path = "."
+        depth_limit = None
+        max_entries = None
+        dirs_only = False
+        sizes = False
+        live = False
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg in ('--depth', '--max-entries', '-L'):
+                if not args or not args[0].isdigit() or int(args[0]) < 1:
+                    self._usage(f"❌ {arg} 需要正整数\n{usage}")
+                    return
+                value = int(args.pop(0))
+                if arg == '--max-entries':
+                    max_entries = value
+                else:
+                    depth_limit = value
+            elif arg in ('--dirs-only', '-d'):
+                dirs_only = True
+            elif arg in ('-s', '--size'):
+                sizes = True
+            elif arg == '--live':
+                live = True
+            elif arg.startswith('-'):
+                self._usage(f"❌ 未知选项: {arg}\n{usage}")
+                return
+            else:
+                path = arg
+        full_path = os.path.abspath(os.path.join(self.current_dir, path))
+        if not os.path.isdir(full_path):
+            self._fail(f"❌ 目录不存在: {path}")
+            return
         
-        def print_tree(dir_path, prefix=""):
-            try:
-                items = os.listdir(dir_path)
-                items.sort()
-                
-                for i, item in enumerate(items):
-                    item_path = os.path.join(dir_path, item)
-                    is_last = i == len(items) - 1
-                    
-                    if os.path.isdir(item_path):
-                        print(f"{prefix}{'└── ' if is_last else '├── '}📁 {item}/")
-                        new_prefix = prefix + ("    " if is_last else "│   ")
-                        print_tree(item_path, new_prefix)
-                    else:
-                        print(f"{prefix}{'└── ' if is_last else '├── '}📄 {item}")
-            except PermissionError:
-                print(f"{prefix}└── ❌ [权限不足]")
+        from concurrent.futures import ThreadPoolExecutor
+        print(f"🌳 目录树: {full_path}")
+        counts = {'dirs': 0, 'files': 0, 'size': 0, 'truncated': False}
+        indexed = self._indexed_root(full_path, live)
+        lister = self._fs_index().children if indexed else None
+        pool = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix='tree')
+        try:
+            _write_lines(sys.stdout, self._tree_lines(pool, full_path, depth_limit or float('inf'),
+                                                      max_entries, dirs_only, sizes, counts, lister))
+        finally:
+            # 提前结束 (达到上限或被取消) 时丢弃尚未开始的扫描
+            pool.shutdown(wait=False, cancel_futures=True)
         
-        print(f"🌳 目录树: {os.path.abspath(full_path)}")
-        print_tree(full_path)
+        summary = f"\n📊 {counts['dirs']} 个目录" + ("" if dirs_only else f", {counts['files']} 个文件")
+        if sizes:
+            summary += f", 文件共 {self._format_size(counts['size'])}"
+        if counts['truncated']:
+            summary += f" (已达到 --max-entries {max_entries} 上限, 其余条目未显示)"
+        print(summary)
+        if indexed:
+            self._index_note(indexed)
     
     def cmd_size(self, args):
-        """显示文件大小"""
-        if not args:
-            print("用法: size <文件或目录>")
+        """显示文件或目录大小: size [--fresh|--live] <文件或目录>...
+
+        目录在线程池中并行统计, 硬链接只计一次, 同时报告表观大小和实际占用;
+        目录 mtime 未变时复用缓存, --fresh 忽略缓存重新扫描。
+        已建立索引的目录直接从索引读取, --live (或 --fresh) 时实时统计。
+        """
+        fresh = '--fresh' in args
+        live = fresh or '--live' in args
+        items = [arg for arg in args if arg not in ('--fresh', '--live')]
+        if not items:
+            self._usage("用法: size [--fresh|--live] <文件或目录>...")
             return
         
-        def get_size(path):
-            total = 0
+        import sqlite3
+        cache = None
+        for item in items:
+            item_path = os.path.join(self.current_dir, item)
             try:
-                if os.path.isfile(path):
-                    return os.path.getsize(path)
-                elif os.path.isdir(path):
-                    for root, dirs, files in os.walk(path):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            try:
-                                total += os.path.getsize(file_path)
-                            except OSError:
-                                continue
-                    return total
+                st = os.stat(item_path)
+            except OSError as e:
+                self._fail(f"❌ 无法访问 {item}: {e.strerror}")
+                continue
+            if not os.path.isdir(item_path):
+                blocks = getattr(st, 'st_blocks', None)
+                used = blocks * 512 if blocks is not None else st.st_size
+                print(f"📊 {item}: {self._format_size(st.st_size)} (占用 {self._format_size(used)})")
+                continue
+            
+            indexed = self._indexed_root(os.path.abspath(item_path), live)
+            row = self._fs_index().lookup(os.path.abspath(item_path)) if indexed else None
+            if row is not None:
+                _, size, allocated, files, dirs = row
+                print(f"📊 {item}: {self._format_size(size)} (占用 {self._format_size(allocated)}), "
+                      f"{files} 个文件, {dirs} 个目录")
+                self._index_note(indexed)
+                continue
+            
+            if cache is None:
+                cache = SizeCache.open(state_path(SIZE_CACHE_FILE))
+            try:
+                usage = disk_usage(item_path, cache, fresh, check_cancelled=self._check_cancelled)
+            except (OSError, sqlite3.Error) as e:
+                print(f"⚠️  大小缓存不可用, 直接扫描: {e}")
+                usage = disk_usage(item_path, check_cancelled=self._check_cancelled)
+            report = (f"📊 {item}: {self._format_size(usage['apparent'])} "
+                      f"(占用 {self._format_size(usage['allocated'])}), "
+                      f"{usage['files']} 个文件, {usage['dirs']} 个目录")
+            if usage['errors']:
+                report += f", {usage['errors']} 个目录无法读取"
+            print(report)
+            total_dirs = usage['dirs'] + 1
+            if usage['scanned'] < total_dirs:
+                print(f"♻️  {total_dirs - usage['scanned']}/{total_dirs} 个目录未变化, 使用缓存")
+    
+    def cmd_largest(self, args):
+        """列出最大的文件和目录: largest <目录> [N] [--exclude 模式]... [-x]
+
+        一次 scandir 遍历, 用大小为 N 的堆保留最大的文件和目录, 目录大小自底向上汇总。
+        栈中每层只保存一个正在读取的 scandir 迭代器 (不预先列出子目录), 内存与 N、目录深度
+        以及硬链接文件数 (按 inode 去重) 有关, 与目录中的条目数无关。-x 不进入其他文件系统。
+        """
+        import fnmatch
+        import heapq
+        usage = "用法: largest <目录> [N] [--exclude 模式]... [-x 不跨文件系统]"
+        positional = []
+        excludes = []
+        one_fs = False
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg == '--exclude':
+                if not args:
+                    self._usage(usage)
+                    return
+                excludes.append(args.pop(0))
+            elif arg in ('-x', '--one-file-system'):
+                one_fs = True
+            elif arg.startswith('-') and not arg[1:].isdigit():
+                self._usage(f"❌ 未知选项: {arg}\n{usage}")
+                return
+            else:
+                positional.append(arg.lstrip('-') if arg[1:].isdigit() else arg)
+        if not positional or len(positional) > 2 or (len(positional) == 2 and not positional[1].isdigit()):
+            self._usage(usage)
+            return
+        count = int(positional[1]) if len(positional) == 2 else 10
+        if count < 1:
+            self._usage(usage)
+            return
+        root = os.path.join(self.current_dir, positional[0])
+        if not os.path.isdir(root):
+            self._fail(f"❌ 目录不存在: {positional[0]}")
+            return
+        
+        root_dev = os.stat(root).st_dev
+        top_files = []
+        top_dirs = []
+        seen_links = set()
+        errors = 0
+        
+        def excluded(name, rel):
+            return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel, p) for p in excludes)
+        
+        def keep(heap, size, path):
+            if len(heap) < count:
+                heapq.heappush(heap, (size, path))
+            elif size > heap[0][0]:
+                heapq.heappushpop(heap, (size, path))
+        
+        def open_dir(path):
+            nonlocal errors
+            try:
+                return os.scandir(path)
             except OSError:
-                return 0
-            return total
+                errors += 1
+                return None
         
-        for item in args:
-            item_path = os.path.join(self.current_dir, item)
-            size = get_size(item_path)
-            size_str = self._format_size(size)
-            print(f"📊 {item}: {size_str}")
+        def next_subdir(frame):
+            # 继续读取该层的目录项: 累计文件大小, 遇到要进入的子目录时返回 (目录项, 相对路径)
+            nonlocal errors
+            it = frame[2]
+            try:
+                for entry in it:
+                    rel = frame[1] + entry.name
+                    if excludes and excluded(entry.name, rel):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not one_fs or entry.stat(follow_symlinks=False).st_dev == root_dev:
+                                return entry, rel
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if st.st_nlink > 1:
+                        if (st.st_dev, st.st_ino) in seen_links:
+                            continue
+                        seen_links.add((st.st_dev, st.st_ino))
+                    frame[3] += st.st_size
+                    keep(top_files, st.st_size, entry.path)
+            except OSError:
+                errors += 1
+            return None
+        
+        # 迭代后序遍历: 栈中每层保存 [路径, 相对路径前缀, scandir 迭代器, 已累计大小]
+        stack = [[root, '', open_dir(root), 0]]
+        visited = 0
+        try:
+            while stack:
+                frame = stack[-1]
+                found = next_subdir(frame) if frame[2] is not None else None
+                if found is not None:
+                    entry, rel = found
+                    visited += 1
+                    if not visited & 255:
+                        self._check_cancelled()
+                    stack.append([entry.path, rel + os.sep, open_dir(entry.path), 0])
+                    continue
+                if frame[2] is not None:
+                    frame[2].close()
+                stack.pop()
+                if stack:
+                    stack[-1][3] += frame[3]
+                    keep(top_dirs, frame[3], frame[0])
+                else:
+                    total = frame[3]
+        finally:
+            for frame in stack:
+                if frame[2] is not None:
+                    frame[2].close()
+        
+        def show(title, heap, suffix=""):
+            print(title)
+            for size, path in sorted(heap, reverse=True):
+                print(f"  {self._format_size(size):>10}  {os.path.relpath(path, root)}{suffix}")
+        
+        print(f"🔎 {os.path.abspath(root)}: 共 {self._format_size(total)}, {visited} 个子目录")
+        show(f"\n📄 最大的 {len(top_files)} 个文件:", top_files)
+        show(f"\n📁 最大的 {len(top_dirs)} 个目录 (含子目录):", top_dirs, "/")
+        if errors:
+            print(f"\n⚠️  {errors} 个目录无法读取")
+    
+    def _fs_index(self) -> FsIndex:
+        """文件系统元数据索引 (多个会话共享)"""
+        return FsIndex.open(state_path(INDEX_FILE))
+    
+    def _indexed_root(self, path, live=False):
+        """path 位于已建立索引的目录中且未要求 --live 时, 返回索引根目录记录"""
+        if live:
+            return None
+        import sqlite3
+        try:
+            return self._fs_index().root_for(path)
+        except (OSError, sqlite3.Error):
+            return None
+    
+    def _index_note(self, root):
+        """提示结果来自索引及索引的新旧程度"""
+        age = _format_age(time.time() - root[2])
+        print(f"ℹ️  结果来自索引 (刷新于 {age}前); --live 实时扫描, index refresh 更新索引")
+    
+    def cmd_index(self, args):
+        """文件系统索引: index build <目录> | refresh [目录] | status | drop <目录> | grep <目录>
+
+        build/refresh 维护元数据索引 (find/size/tree 使用), grep 建立或增量更新内容索引 (grep --indexed 使用)。
+        """
+        usage = ("用法: index build <目录> | index refresh [目录] | index status | index drop <目录> | "
+                 "index grep <目录>")
+        action = args[0].lower() if args else 'status'
+        index = self._fs_index()
+        path = os.path.abspath(os.path.join(self.current_dir, args[1])) if len(args) > 1 else None
+        
+        if action == 'grep' and path:
+            if not os.path.isdir(path):
+                self._fail(f"❌ 目录不存在: {args[1]}")
+                return
+            grep_index = GrepIndex.locate(path)
+            if grep_index is not None and grep_index.root != path:
+                print(f"ℹ️  {path} 已包含在内容索引 {grep_index.root} 中, 改为更新该索引")
+            grep_index = grep_index or GrepIndex(path)
+            print(f"📇 正在{'更新' if grep_index.files else '建立'}内容索引: {grep_index.root}")
+            tty = sys.stdout.isatty()
+            started = time.perf_counter()
+            
+            def show(done, total):
+                print(f"\r📇 已读取 {done}/{total} 个文件".ljust(40), end='', flush=True)
+            
+            try:
+                result = grep_index.update(show if tty else None, self._check_cancelled)
+            finally:
+                grep_index.close()
+                if tty:
+                    print("\r" + " " * 40 + "\r", end='')
+            print(f"✅ 内容索引完成: {result['files']} 个文件, 读取 {result['read']} 个 "
+                  f"({self._format_size(result['bytes'])}), 移除 {result['removed']} 个; "
+                  f"{result['trigrams']} 个 trigram, 索引 {self._format_size(result['size'])}, "
+                  f"用时 {time.perf_counter() - started:.2f}s")
+            if result['failed']:
+                self._fail(f"❌ {result['failed']} 个文件无法读取, 未加入索引")
+            return
+        
+        if action == 'build' and path:
+            if not os.path.isdir(path):
+                self._fail(f"❌ 目录不存在: {args[1]}")
+                return
+            outer = index.root_for(path)
+            if outer and outer[0] != path:
+                print(f"ℹ️  {path} 已包含在索引 {outer[0]} 中, 改为刷新")
+                action, path = 'refresh', outer[0]
+            else:
+                print(f"🗂️  正在建立索引: {path}")
+                started = time.perf_counter()
+                stats = {}
+                size, _, files, dirs = index.build(path, self._check_cancelled, stats)
+                print(f"✅ 索引完成: {files} 个文件, {dirs} 个目录, 共 {self._format_size(size)}, "
+                      f"用时 {time.perf_counter() - started:.2f}s")
+                if stats['skipped']:
+                    print(f"⚠️  {stats['skipped']} 个路径不是有效的 UTF-8, 未加入索引 (跳过的目录不再向下扫描)")
+                return
+        
+        if action == 'refresh':
+            if path:
+                root = index.root_for(path)
+                if root is None:
+                    self._fail(f"❌ 尚未建立索引: {path} (使用 index build)")
+                    return
+                roots = [root[0]]
+            else:
+                roots = [root[0] for root in index.roots()]
+            for root in roots:
+                started = time.perf_counter()
+                result = index.refresh(root, self._check_cancelled)
+                print(f"✅ {root}: 检查 {result['checked']} 个目录, 重新扫描 {result['rescanned']} 个, "
+                      f"删除 {result['removed']} 个, 用时 {time.perf_counter() - started:.2f}s")
+                if result['skipped']:
+                    print(f"⚠️  {result['skipped']} 个路径不是有效的 UTF-8, 未加入索引 (跳过的目录不再向下扫描)")
+            if not roots:
+                print("📭 尚未建立索引 (使用 index build <目录>)")
+            return
+        
+        if action == 'status' and len(args) <= 1:
+            roots = index.roots()
+            grep_indexes = GrepIndex.all()
+            if not roots and not grep_indexes:
+                print("📭 尚未建立索引 (使用 index build <目录> 或 index grep <目录>)")
+                return
+            now = time.time()
+            for grep_index in grep_indexes:
+                print(f"📇 {grep_index.root} (内容索引)")
+                print(f"    {len(grep_index.files)} 个文件, {grep_index.trigrams} 个 trigram, "
+                      f"索引 {self._format_size(grep_index.size)}, 更新于 {_format_age(now - grep_index.updated)}前")
+                grep_index.close()
+            for root, built, refreshed in roots:
+                row = index.lookup(root)
+                size, files, dirs = (row[1], row[3], row[4]) if row else (0, 0, 0)
+                changed = index.changed_dirs(root)
+                print(f"🗂️  {root}")
+                print(f"    {files} 个文件, {dirs} 个目录, 共 {self._format_size(size)}")
+                print(f"    建立于 {_format_age(now - built)}前, 刷新于 {_format_age(now - refreshed)}前")
+                print(f"    {'⚠️  ' + str(changed) + ' 个目录已变化, 建议 index refresh' if changed else '✅ 目录均未变化'}")
+            return
+        
+        if action == 'drop' and path:
+            grep_index = GrepIndex.load(GrepIndex.path_for(path))
+            if grep_index is not None:
+                grep_index.drop()
+                print(f"✅ 已删除内容索引: {path}")
+            if any(root[0] == path for root in index.roots()):
+                index.drop(path)
+                print(f"✅ 已删除索引: {path}")
+            elif grep_index is None:
+                self._fail(f"❌ 没有该目录的索引: {path}")
+            return
+        
+        self._usage(usage)
     
     def cmd_touch(self, args):
         """创建空文件"""
         if not args:
-            print("用法: touch <文件>")
+            self._usage("用法: touch <文件>")
             return
         
         for file_name in args:
@@ -481,9 +4865,9 @@ class SuperCommandLineSystem:
             try:
                 Path(file_path).touch()
                 print(f"✅ 文件已创建: {file_name}")
-                self.user_data['files_created'] += 1
+                self.user_data.incr('files_created')
             except Exception as e:
-                print(f"❌ 创建文件失败 {file_name}: {e}")
+                self._fail(f"❌ 创建文件失败 {file_name}: {e}")
     
     def _format_size(self, size):
         """格式化文件大小"""
@@ -496,6 +4880,16 @@ class SuperCommandLineSystem:
         else:
             return f"{size/1024**3:.1f} GB"
     
+    def _require(self, package: str):
+        """按需导入可选依赖, 未安装时给出提示并返回 None"""
+        import importlib
+        try:
+            return importlib.import_module(package)
+        except ImportError:
+            self._fail(f"❌ 此命令需要安装 {package} 库")
+            print(f"请运行: pip install {package}")
+            return None
+    
     def _print_file_info(self, file_path):
         """打印文件信息"""
         try:
@@ -508,7 +4902,7 @@ class SuperCommandLineSystem:
             print(f"📊 大小: {size_str}")
             print(f"🕒 修改时间: {mtime.strftime('%Y-%m-%d %H:%M:%S')}")
         except Exception as e:
-            print(f"❌ 获取文件信息失败: {e}")
+            self._fail(f"❌ 获取文件信息失败: {e}")
 
 # ==================== PartA 结束 ====================
 
@@ -529,6 +4923,9 @@ class SuperCommandLineSystem:
     
     def cmd_ps(self, args):
         """显示进程列表"""
+        psutil = self._require('psutil')
+        if psutil is None:
+            return
         print("📋 进程列表:")
         print(f"{'PID':<8} {'名称':<20} {'CPU%':<8} {'内存%':<8}")
         print("-" * 50)
@@ -542,6 +4939,9 @@ class SuperCommandLineSystem:
     
     def cmd_top(self, args):
         """实时显示系统资源使用情况"""
+        psutil = self._require('psutil')
+        if psutil is None:
+            return
         print("📊 按 Ctrl+C 停止监控")
         try:
             while True:
@@ -557,6 +4957,9 @@ class SuperCommandLineSystem:
     
     def cmd_disk(self, args):
         """显示磁盘信息"""
+        psutil = self._require('psutil')
+        if psutil is None:
+            return
         print("💿 磁盘信息:")
         for partition in psutil.disk_partitions():
             try:
@@ -574,6 +4977,9 @@ class SuperCommandLineSystem:
     
     def cmd_memory(self, args):
         """显示内存信息"""
+        psutil = self._require('psutil')
+        if psutil is None:
+            return
         memory = psutil.virtual_memory()
         print("💾 内存信息:")
         print(f"📊 总内存: {memory.total // (1024**3)} GB")
@@ -583,6 +4989,9 @@ class SuperCommandLineSystem:
     
     def cmd_network(self, args):
         """显示网络信息"""
+        psutil = self._require('psutil')
+        if psutil is None:
+            return
         print("🌐 网络信息:")
         try:
             # 获取网络接口信息
@@ -599,27 +5008,31 @@ class SuperCommandLineSystem:
                 for addr in addresses:
                     print(f"    📍 {addr.address}")
         except Exception as e:
-            print(f"❌ 获取网络信息失败: {e}")
+            self._fail(f"❌ 获取网络信息失败: {e}")
     
     # ==================== 网络工具命令 ====================
     
     def cmd_ping(self, args):
         """ping主机"""
         if not args:
-            print("用法: ping <主机>")
+            self._usage("用法: ping <主机>")
             return
         
         host = args[0]
         print(f"🏓 Pinging {host}...")
         try:
+            import subprocess
             result = subprocess.run(['ping', '-n', '4', host] if os.name == 'nt' else ['ping', '-c', '4', host], 
                                   capture_output=True, text=True)
             print(result.stdout)
         except Exception as e:
-            print(f"❌ ping失败: {e}")
+            self._fail(f"❌ ping失败: {e}")
     
     def cmd_netstat(self, args):
         """显示网络连接"""
+        psutil = self._require('psutil')
+        if psutil is None:
+            return
         print("🌐 网络连接:")
         print(f"{'协议':<6} {'本地地址':<20} {'远程地址':<20} {'状态':<12}")
         print("-" * 60)
@@ -654,10 +5067,13 @@ class SuperCommandLineSystem:
                     except Exception:
                         continue
         except Exception as e:
-            print(f"❌ 获取网络连接失败: {e}")
+            self._fail(f"❌ 获取网络连接失败: {e}")
     
     def cmd_ipconfig(self, args):
         """显示网络配置"""
+        psutil = self._require('psutil')
+        if psutil is None:
+            return
         print("🌐 网络配置:")
         try:
             for interface, addresses in psutil.net_if_addrs().items():
@@ -668,12 +5084,12 @@ class SuperCommandLineSystem:
                     print(f"  📢 广播地址: {addr.broadcast}")
                 print("-" * 30)
         except Exception as e:
-            print(f"❌ 获取网络配置失败: {e}")
+            self._fail(f"❌ 获取网络配置失败: {e}")
     
     def cmd_browser(self, args):
         """打开浏览器访问网址"""
         if not args:
-            print("用法: browser <网址>")
+            self._usage("用法: browser <网址>")
             print("示例: browser https://www.google.com")
             return
         
@@ -683,20 +5099,21 @@ class SuperCommandLineSystem:
         
         try:
             print(f"🌐 正在打开浏览器访问: {url}")
+            import webbrowser
             webbrowser.open(url)
             print("✅ 浏览器已打开")
         except Exception as e:
-            print(f"❌ 打开浏览器失败: {e}")
+            self._fail(f"❌ 打开浏览器失败: {e}")
     
     def cmd_download(self, args):
         """下载文件"""
-        if not REQUESTS_AVAILABLE:
-            print("❌ 下载功能需要安装 requests 库")
+        if not module_available('requests'):
+            self._fail("❌ 下载功能需要安装 requests 库")
             print("请运行: pip install requests")
             return
         
         if len(args) < 2:
-            print("用法: download <URL> <文件名>")
+            self._usage("用法: download <URL> <文件名>")
             print("示例: download https://example.com/file.txt myfile.txt")
             return
         
@@ -707,14 +5124,16 @@ class SuperCommandLineSystem:
             print(f"📥 正在下载: {url}")
             print(f"📁 保存为: {filename}")
             
+            import requests
             response = requests.get(url, stream=True)
             response.raise_for_status()
             
             total_size = int(response.headers.get('content-length', 0))
             downloaded = 0
             
-            with open(filename, 'wb') as f:
+            with open(os.path.join(self.current_dir, filename), 'wb') as f:
                 for chunk in response.iter_content(chunk_size=8192):
+                    self._check_cancelled()
                     if chunk:
                         f.write(chunk)
                         downloaded += len(chunk)
@@ -726,7 +5145,7 @@ class SuperCommandLineSystem:
             print(f"📊 文件大小: {self._format_size(downloaded)}")
             
         except Exception as e:
-            print(f"❌ 下载失败: {e}")
+            self._fail(f"❌ 下载失败: {e}")
 
 # ==================== PartB 结束 ====================
 
@@ -735,9 +5154,11 @@ class SuperCommandLineSystem:
     # ==================== 文本处理命令 ====================
     
     def cmd_find(self, args):
-        """查找文件"""
+        """查找文件: find <目录> <文件名模式> [--live] (目录已建立索引时从索引查询)"""
+        live = '--live' in args
+        args = [arg for arg in args if arg != '--live']
         if len(args) < 2:
-            print("用法: find <目录> <文件名模式>")
+            self._usage("用法: find <目录> <文件名模式> [--live]")
             return
         
         search_dir = os.path.join(self.current_dir, args[0])
@@ -746,7 +5167,16 @@ class SuperCommandLineSystem:
         print(f"🔍 在 {search_dir} 中查找包含 '{pattern}' 的文件:")
         found_count = 0
         
+        indexed = self._indexed_root(os.path.abspath(search_dir), live)
+        if indexed:
+            paths = self._fs_index().find(os.path.abspath(search_dir), pattern)
+            _write_lines(sys.stdout, (f"  📄 {path}" for path in paths))
+            print(f"📊 找到 {len(paths)} 个文件")
+            self._index_note(indexed)
+            return
+        
         for root, dirs, files in os.walk(search_dir):
+            self._check_cancelled()
             for file in files:
                 if pattern.lower() in file.lower():
                     full_path = os.path.join(root, file)
@@ -755,149 +5185,837 @@ class SuperCommandLineSystem:
         
         print(f"📊 找到 {found_count} 个文件")
     
+    def _parse_grep_args(self, args):
+        """解析 grep 参数, 返回 (选项, 模式, 路径列表); 参数错误时抛出 ValueError"""
+        options = {'fixed': False, 'ignore_case': True, 'word': False, 'count': False, 'indexed': False,
+                   'before': 0, 'after': 0, 'workers': None, 'include': [], 'exclude': []}
+        flags = {'F': 'fixed', 'w': 'word', 'c': 'count'}
+        positional = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg == '--indexed' and not positional:
+                options['indexed'] = True
+            elif arg in ('-A', '-B', '-C', '-j', '--include', '--exclude'):
+                if not args:
+                    raise ValueError(arg)
+                value = args.pop(0)
+                if arg in ('--include', '--exclude'):
+                    options[arg[2:]].append(value)
+                    continue
+                if not value.isdigit():
+                    raise ValueError(arg)
+                if arg == '-j':
+                    options['workers'] = max(1, int(value))
+                if arg in ('-A', '-C'):
+                    options['after'] = int(value)
+                if arg in ('-B', '-C'):
+                    options['before'] = int(value)
+            elif arg.startswith('-') and len(arg) > 1 and not positional and all(c in 'Fwcsir' for c in arg[1:]):
+                for c in arg[1:]:
+                    if c in flags:
+                        options[flags[c]] = True
+                    elif c in 'si':
+                        options['ignore_case'] = c == 'i'
+            elif arg.startswith('-') and len(arg) > 1 and not positional:
+                raise ValueError(arg)
+            else:
+                positional.append(arg)
+        if not positional:
+            raise ValueError("缺少模式")
+        return options, positional[0], positional[1:]
+    
+    def _grep_index_candidates(self, paths, pattern, options):
+        """grep --indexed: 通过内容索引筛出可能匹配的文件; 目录没有索引时返回 None
+
+        模式中必然出现的字面量片段拆成 trigram, 与各目录索引的倒排列表求交集;
+        模式没有 3 个字符以上的字面量时无法缩小范围, 返回索引中的全部文件。
+        """
+        import fnmatch
+        trigrams = _pattern_trigrams(pattern, options['fixed'], options['ignore_case'])
+        
+        def matches(patterns, name, rel):
+            return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel, p) for p in patterns)
+        
+        files = []
+        total = 0
+        updated = time.time()
+        for path in paths:
+            if not os.path.isdir(path):
+                files.append(path)
+                continue
+            path = os.path.normpath(path)
+            index = GrepIndex.locate(path)
+            if index is None:
+                self._fail(f"❌ 尚未建立内容索引: {path} (使用 index grep <目录>)")
+                return None
+            try:
+                top = os.path.relpath(path, index.root)
+                prefix = '' if top == '.' else top + os.sep
+                total += sum(1 for name, _, _ in index.files if name.startswith(prefix))
+                for file_id in index.candidates(trigrams):
+                    name = index.files[file_id][0]
+                    if not name.startswith(prefix):
+                        continue
+                    parts = name[len(prefix):].split(os.sep)
+                    rel = '/'.join(parts)
+                    if options['exclude'] and any(matches(options['exclude'], part, rel) for part in parts):
+                        continue
+                    if not options['include'] or matches(options['include'], parts[-1], rel):
+                        files.append(os.path.join(index.root, name))
+                updated = min(updated, index.updated)
+            finally:
+                index.close()
+        print(f"⚡ 内容索引筛出 {len(files)}/{total} 个文件 (索引更新于 {_format_age(time.time() - updated)}前, "
+              f"之后的改动用 index grep 更新)")
+        return files
+    
     def cmd_grep(self, args):
-        """在文件中搜索文本"""
-        if len(args) < 2:
-            print("用法: grep <模式> <文件>")
+        """搜索文本: grep [选项] <模式> <文件或目录>...
+
+        模式为正则表达式, 默认不区分大小写。目录递归搜索 (跳过版本控制目录和二进制文件),
+        文件在线程池中并行搜索, 结果按文件顺序输出。大文件用 mmap 在字节上搜索, 只解码匹配的行。
+        --indexed 先用 index grep 建立的内容索引筛出可能匹配的文件, 只搜索这些文件。
+        """
+        usage = ("用法: grep [-F 固定字符串] [-s 区分大小写] [-w 整词] [-c 计数] [-A/-B/-C 行数] "
+                 "[--include 模式] [--exclude 模式] [-j 线程数] [--indexed] <模式> <文件或目录>...")
+        import itertools
+        import re
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+        try:
+            options, pattern, targets = self._parse_grep_args(args)
+            matcher = _GrepMatcher(pattern, options['fixed'], options['ignore_case'], options['word'])
+        except re.error as e:
+            self._usage(f"❌ 无效的正则表达式: {e}")
             return
+        except ValueError:
+            self._usage(usage)
+            return
+        if not targets:
+            self._usage(usage)
+            return
+        
+        paths = [os.path.join(self.current_dir, target) for target in targets]
+        single = len(paths) == 1 and not os.path.isdir(paths[0])
+        indexed = None
+        if options['indexed'] and not single:
+            indexed = self._grep_index_candidates(paths, pattern, options)
+            if indexed is None:
+                return
+        if single:
+            print(f"🔍 在 {targets[0]} 中搜索 '{pattern}':")
+            print("=" * 50)
         
-        pattern = args[0]
-        file_path = os.path.join(self.current_dir, args[1])
+        def label(path):
+            return path if os.path.isabs(targets[0]) else os.path.relpath(path, self.current_dir)
         
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                print(f"🔍 在 {args[1]} 中搜索 '{pattern}':")
-                print("=" * 50)
-                found_count = 0
-                for line_num, line in enumerate(f, 1):
-                    if pattern.lower() in line.lower():
-                        print(f"  {line_num:3d}: {line.rstrip()}")
-                        found_count += 1
-                print(f"📊 找到 {found_count} 个匹配")
-        except Exception as e:
-            print(f"❌ 搜索失败: {e}")
+        errors = []
+        total = files_matched = binary = 0
+        workers = options['workers'] or SCAN_WORKERS
+        
+        def search(batch):
+            results = []
+            for path in batch:
+                try:
+                    results.append((path, grep_file(path, matcher, options['before'],
+                                                    options['after'], options['count'])))
+                except OSError as e:
+                    results.append((path, e))
+            return results
+        
+        def results():
+            # 文件按批提交 (小文件很多时摊薄线程池的调度开销), 按提交顺序取结果, 输出顺序与文件顺序一致
+            if single:
+                yield from search(paths)
+                return
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='grep')
+            pending = deque()
+            walker = iter(indexed) if indexed is not None else \
+                _grep_walk(paths, options['include'], options['exclude'], errors)
+            try:
+                while True:
+                    while len(pending) < workers * 4:
+                        batch = list(itertools.islice(walker, GREP_BATCH))
+                        if not batch:
+                            break
+                        pending.append(pool.submit(search, batch))
+                    if not pending:
+                        break
+                    self._check_cancelled()
+                    yield from pending.popleft().result()
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+        
+        for path, result in results():
+            if isinstance(result, FileNotFoundError) and indexed is not None and path not in paths:
+                continue  # 建立索引后被删除
+            if isinstance(result, OSError):
+                errors.append(f"{label(path)}: {result.strerror or result}")
+                continue
+            if result is None:
+                binary += 1
+                continue
+            count, lines = result
+            total += count
+            if not count:
+                continue
+            files_matched += 1
+            if options['count']:
+                print(f"  {count}" if single else f"  {label(path)}: {count}")
+                continue
+            name = label(path)
+            _write_lines(sys.stdout, (
+                "  --" if line is None else
+                f"  {line[0]:3d}{':' if line[1] else '-'} {line[2]}" if single else
+                f"  {name}{':' if line[1] else '-'}{line[0]}{':' if line[1] else '-'} {line[2]}"
+                for line in lines))
+        
+        summary = f"📊 找到 {total} 个匹配"
+        if not single:
+            summary += f", 分布在 {files_matched} 个文件中"
+        if binary:
+            summary += f" (跳过 {binary} 个二进制文件)"
+        print(summary)
+        if errors:
+            self._fail("❌ 以下文件无法读取:\n" + "\n".join(f"  {error}" for error in errors[:5]))
+    
+    def _parse_sort_args(self, args):
+        """解析 sort 参数, 返回 (选项, 文件列表); 参数错误时抛出 ValueError
+
+        选项值可以紧跟在选项后 (-k2、-t,), 无值的选项可以合写 (-nru)。
+        """
+        options = {'numeric': False, 'reverse': False, 'unique': False, 'stable': False,
+                   'field': 0, 'separator': None, 'memory': SORT_MEMORY, 'workers': None, 'output': None}
+        flags = {'n': 'numeric', 'r': 'reverse', 'u': 'unique', 's': 'stable'}
+        files = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg[:2] in ('-k', '-t', '-S', '-j', '-o'):
+                value = arg[2:] or (args.pop(0) if args else '')
+                if not value:
+                    raise ValueError(arg)
+                if arg[:2] == '-k':
+                    options['field'] = int(value.split(',')[0].split('.')[0])
+                    if options['field'] < 1:
+                        raise ValueError(arg)
+                elif arg[:2] == '-t':
+                    options['separator'] = value.encode('utf-8')
+                elif arg[:2] == '-S':
+                    options['memory'] = _parse_size(value)
+                elif arg[:2] == '-j':
+                    options['workers'] = max(1, int(value))
+                else:
+                    options['output'] = os.path.join(self.current_dir, value)
+            elif arg.startswith('-') and len(arg) > 1 and all(c in flags for c in arg[1:]):
+                for c in arg[1:]:
+                    options[flags[c]] = True
+            elif arg.startswith('-') and len(arg) > 1:
+                raise ValueError(arg)
+            else:
+                files.append(arg)
+        return options, files
     
     def cmd_sort(self, args):
-        """排序文件内容"""
-        if not args:
-            print("用法: sort <文件>")
+        """排序文件内容: sort [选项] <文件>...
+
+        超过内存预算的输入做外部归并排序: 有序段在多个进程中并行排序并写入临时文件, 再多路归并,
+        内存占用与文件大小无关。
+        """
+        usage = ("用法: sort [-n 数值] [-r 逆序] [-u 去重] [-s 稳定] [-k 字段] [-t 分隔符] "
+                 "[-S 内存预算] [-j 进程数] [-o 输出文件] <文件>...")
+        try:
+            options, files = self._parse_sort_args(args)
+        except ValueError:
+            self._usage(usage)
+            return
+        if not files:
+            self._usage(usage)
             return
         
-        file_path = os.path.join(self.current_dir, args[0])
+        paths = [os.path.join(self.current_dir, name) for name in files]
+        stats = {}
+        started = time.perf_counter()
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                lines.sort()
+            lines = external_sort(paths, options, memory=options['memory'], workers=options['workers'],
+                                  check_cancelled=self._check_cancelled, stats=stats)
+            if options['output'] is None:
                 print(f"📄 排序后的内容:")
                 print("=" * 30)
-                for line in lines:
-                    print(line.rstrip())
+                _write_lines(sys.stdout, (line.rstrip(b'\r').decode('utf-8', 'replace') for line in lines))
+                return
+            # 先写入临时文件再替换, 输出文件可以是输入文件之一
+            count = 0
+            partial = options['output'] + '.sorting'
+            with open(partial, 'wb') as out:
+                for count, line in enumerate(lines, 1):
+                    out.write(line + b'\n')
+            os.replace(partial, options['output'])
         except Exception as e:
-            print(f"❌ 排序失败: {e}")
+            self._fail(f"❌ 排序失败: {e}")
+            return
+        runs = f", {stats['runs']} 个有序段" if stats.get('runs') else ""
+        print(f"✅ 已排序 {count} 行 -> {os.path.relpath(options['output'], self.current_dir)} "
+              f"(用时 {time.perf_counter() - started:.2f}s{runs})")
+    
+    def _parse_uniq_args(self, args):
+        """解析 uniq 参数, 返回 (选项, 文件列表); 参数错误时抛出 ValueError"""
+        options = {'count': False, 'repeated': False, 'unique': False, 'adjacent': False, 'memory': UNIQ_MEMORY}
+        flags = {'c': 'count', 'd': 'repeated', 'u': 'unique', 'a': 'adjacent'}
+        files = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg[:2] == '-S':
+                options['memory'] = _parse_size(arg[2:] or (args.pop(0) if args else ''))
+            elif arg.startswith('-') and len(arg) > 1 and all(c in flags for c in arg[1:]):
+                for c in arg[1:]:
+                    options[flags[c]] = True
+            elif arg.startswith('-') and len(arg) > 1:
+                raise ValueError(arg)
+            else:
+                files.append(arg)
+        return options, files
+    
+    def _uniq_groups(self, options, open_lines, rereadable, stats=None):
+        """按 uniq 选项生成要输出的 (行, 次数)"""
+        if options['adjacent']:
+            groups = uniq_adjacent(open_lines())
+        else:
+            groups = unique_lines(open_lines, options['count'] or options['repeated'] or options['unique'],
+                                  rereadable, options['memory'], stats, self._check_cancelled)
+        for line, count in groups:
+            if options['repeated'] and count < 2 or options['unique'] and count > 1:
+                continue
+            yield line, count
     
     def cmd_uniq(self, args):
-        """去除重复行"""
-        if not args:
-            print("用法: uniq <文件>")
+        """去除重复行: uniq [选项] <文件>...
+
+        默认全局去重并保持首次出现的顺序, 去重表只保存定长摘要, 超过内存预算时按哈希分区溢出到临时文件;
+        -a 只合并相邻的重复行 (流式处理, 内存占用恒定)。
+        """
+        usage = "用法: uniq [-c 计数] [-d 只输出重复行] [-u 只输出不重复的行] [-a 只合并相邻行] [-S 内存预算] <文件>..."
+        try:
+            options, files = self._parse_uniq_args(args)
+        except ValueError:
+            self._usage(usage)
+            return
+        if not files:
+            self._usage(usage)
             return
         
-        file_path = os.path.join(self.current_dir, args[0])
+        paths = [os.path.join(self.current_dir, name) for name in files]
+        
+        def open_lines():
+            for path in paths:
+                with open(path, 'rb') as f:
+                    for line in f:
+                        yield line.rstrip(b'\r\n')
+        
+        stats = {}
+        output = 0
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                seen = set()
-                unique_lines = []
-                for line in lines:
-                    if line not in seen:
-                        unique_lines.append(line)
-                        seen.add(line)
-                
-                print(f"📄 去重后的内容:")
-                print("=" * 30)
-                for line in unique_lines:
-                    print(line.rstrip())
-                print(f"📊 原始行数: {len(lines)}, 去重后: {len(unique_lines)}")
+            print(f"📄 去重后的内容:")
+            print("=" * 30)
+            groups = self._uniq_groups(options, open_lines, True, stats)
+            
+            def render():
+                nonlocal output
+                for line, count in groups:
+                    output += 1
+                    text = line.decode('utf-8', 'replace')
+                    yield f"{count:7d} {text}" if options['count'] else text
+            
+            _write_lines(sys.stdout, render())
         except Exception as e:
-            print(f"❌ 去重失败: {e}")
+            self._fail(f"❌ 去重失败: {e}")
+            return
+        summary = f"📊 去重后: {output}"
+        if 'lines' in stats:
+            summary = f"📊 原始行数: {stats['lines']}, 去重后: {output}"
+        if stats.get('spilled'):
+            summary += f" (超出内存预算, {stats['spilled']} 行按哈希分区在临时文件中去重)"
+        print(summary)
+    
+    def _parse_freq_args(self, args):
+        """解析 freq 参数, 返回 (选项, 文件列表); 参数错误时抛出 ValueError"""
+        import re
+        options = {'top': 10, 'capacity': 1000, 'field': 0, 'separator': None, 'regex': None,
+                   'load': [], 'save': None}
+        files = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg in ('-k', '-m', '-f', '-t', '-e', '--load', '--save'):
+                if not args:
+                    raise ValueError(arg)
+                value = args.pop(0)
+                if arg in ('-k', '-m', '-f'):
+                    if not value.isdigit() or int(value) < 1:
+                        raise ValueError(arg)
+                    options[{'-k': 'top', '-m': 'capacity', '-f': 'field'}[arg]] = int(value)
+                elif arg == '-t':
+                    options['separator'] = value.encode('utf-8')
+                elif arg == '-e':
+                    try:
+                        options['regex'] = re.compile(value.encode('utf-8'))
+                    except re.error as e:
+                        raise ValueError(f"无效的正则表达式: {e}")
+                elif arg == '--load':
+                    options['load'].append(os.path.join(self.current_dir, value))
+                else:
+                    options['save'] = os.path.join(self.current_dir, value)
+            elif arg.startswith('-') and len(arg) > 1:
+                raise ValueError(arg)
+            else:
+                files.append(arg)
+        options['capacity'] = max(options['capacity'], options['top'])
+        return options, files
+    
+    def _freq_collect(self, options, lines):
+        """统计逐行的 bytes 输入, 并入 --load 的状态, 按需 --save; 返回 (SpaceSaving, HyperLogLog)"""
+        import itertools
+        from collections import Counter
+        field, separator, regex = options['field'], options['separator'], options['regex']
+        
+        def values():
+            for line in lines:
+                if regex is not None:
+                    match = regex.search(line)
+                    if match is None:
+                        continue
+                    line = match.group(1 if regex.groups else 0)
+                    if line is None:
+                        continue
+                if field:
+                    parts = line.split(separator, field) if separator else line.split(None, field)
+                    if len(parts) < field:
+                        continue
+                    line = parts[field - 1]
+                yield line
+        
+        summary, distinct = SpaceSaving(options['capacity']), HyperLogLog()
+        source = values()
+        while True:
+            self._check_cancelled()
+            batch = Counter(itertools.islice(source, FREQ_BATCH))
+            if not batch:
+                break
+            summary.update(batch)
+            distinct.update(batch)
+        for path in options['load']:
+            with open(path, 'r', encoding='utf-8') as f:
+                loaded = load_freq_state(json.load(f))
+            summary.merge(loaded[0])
+            distinct.merge(loaded[1])
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as f:
+                json.dump(freq_state(summary, distinct), f)
+        return summary, distinct
+    
+    def _freq_report(self, options, summary, distinct):
+        """freq 的输出行"""
+        total = summary.total
+        yield (f"📊 共 {total} 个值, 约 {distinct.count()} 个不同值 "
+               f"(HyperLogLog, 误差约 {distinct.error():.1%})")
+        top = summary.top(options['top'])
+        if not top:
+            return
+        exact = "计数精确" if not summary.floor else f"计数为上界, 未列出的值不超过 {summary.floor} 次"
+        yield f"🔝 前 {len(top)} 个高频值 (Space-Saving 跟踪 {summary.capacity} 个值, {exact}):"
+        width = len(str(top[0][1]))
+        for value, count, error in top:
+            row = f"  {count:>{width}}  {count / total:6.1%}  {value.decode('utf-8', 'replace')}"
+            yield row + (f"  (误差 ≤ {error})" if error else "")
+    
+    def cmd_freq(self, args):
+        """近似统计高频值和不同值个数: freq [选项] [文件]...
+
+        Space-Saving 摘要找出高频值, HyperLogLog 估计不同值个数, 内存占用固定, 适合数十亿行的日志。
+        --save 保存摘要状态, --load 并入之前保存的状态 (例如各台机器的日志分别统计后汇总)。
+        """
+        usage = ("用法: freq [-k 前K个] [-m 跟踪值数] [-f 字段] [-t 分隔符] [-e 正则] "
+                 "[--load 状态文件]... [--save 状态文件] [文件]...")
+        try:
+            options, files = self._parse_freq_args(args)
+        except ValueError as e:
+            self._usage(f"❌ {e}\n{usage}" if str(e).startswith("无效") else usage)
+            return
+        if not files and not options['load']:
+            self._usage(usage)
+            return
+        
+        def lines():
+            for name in files:
+                with open(os.path.join(self.current_dir, name), 'rb') as f:
+                    for line in f:
+                        yield line.rstrip(b'\r\n')
+        
+        try:
+            summary, distinct = self._freq_collect(options, lines())
+        except (OSError, ValueError) as e:
+            self._fail(f"❌ 统计失败: {e}")
+            return
+        for row in self._freq_report(options, summary, distinct):
+            print(row)
+        if options['save']:
+            print(f"💾 状态已保存: {os.path.relpath(options['save'], self.current_dir)}")
     
     def cmd_head(self, args):
-        """显示文件开头"""
-        if len(args) < 1:
-            print("用法: head <文件> [行数]")
+        """显示文件开头: head [-n N | -N] <文件> (旧写法 head <文件> [行数] 仍可用)"""
+        try:
+            (name,), lines = self._split_count_args(args, None)
+        except ValueError:
+            self._usage("用法: head [-n 行数] <文件>")
             return
         
-        file_path = os.path.join(self.current_dir, args[0])
-        lines = int(args[1]) if len(args) > 1 else 10
+        file_path = os.path.join(self.current_dir, name)
         
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                print(f"📄 {args[0]} 的前 {lines} 行:")
+                print(f"📄 {name} 的前 {lines} 行:")
                 print("=" * 30)
                 for i, line in enumerate(f):
                     if i >= lines:
                         break
                     print(line.rstrip())
         except Exception as e:
-            print(f"❌ 读取文件失败: {e}")
+            self._fail(f"❌ 读取文件失败: {e}")
     
     def cmd_tail(self, args):
-        """显示文件结尾"""
-        if len(args) < 1:
-            print("用法: tail <文件> [行数]")
+        """显示文件结尾: tail [-n N | -N] [-f] <文件>... (旧写法 tail <文件> [行数] 仍可用)
+
+        从文件末尾按块向前读取, 耗时和内存只与输出的行数有关。-f 持续输出新增内容,
+        可同时跟踪多个文件, 并能发现文件被截断或轮转。
+        """
+        usage = "用法: tail [-n 行数] [-f] <文件>..."
+        count = 10
+        follow = False
+        files = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg in ('-f', '--follow'):
+                follow = True
+            elif arg == '-n' and args and args[0].isdigit():
+                count = int(args.pop(0))
+            elif arg[:1] == '-' and arg[1:].isdigit():
+                count = int(arg[1:])
+            elif arg.startswith('-') and len(arg) > 1:
+                self._usage(f"❌ 未知选项: {arg}\n{usage}")
+                return
+            else:
+                files.append(arg)
+        if len(files) > 1 and files[-1].isdigit() and not os.path.exists(os.path.join(self.current_dir, files[-1])):
+            count = int(files.pop())
+        if not files:
+            self._usage(usage)
             return
         
-        file_path = os.path.join(self.current_dir, args[0])
-        lines = int(args[1]) if len(args) > 1 else 10
+        followed = []
+        offsets = []
+        for name in files:
+            file_path = os.path.join(self.current_dir, name)
+            try:
+                with open(file_path, 'rb') as f:
+                    offset = _tail_offset(f, count)
+                    f.seek(offset)
+                    print(f"📄 {name} 的后 {count} 行:")
+                    print("=" * 30)
+                    text = f.read().decode('utf-8', 'replace')
+                    if text:
+                        sys.stdout.write(text if text.endswith('\n') else text + '\n')
+                    followed.append(file_path)
+                    offsets.append(f.tell())
+            except OSError as e:
+                self._fail(f"❌ 读取文件失败: {e}")
+        if not follow or not followed:
+            return
         
+        follower = TailFollower(followed, offsets)
+        names = {path: os.path.relpath(path, self.current_dir) for path in followed}
+        print(f"👀 正在跟踪 {len(followed)} 个文件, 按 Ctrl+C 停止")
+        current = followed[-1]
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                all_lines = f.readlines()
-                start = max(0, len(all_lines) - lines)
-                print(f"📄 {args[0]} 的后 {lines} 行:")
-                print("=" * 30)
-                for line in all_lines[start:]:
-                    print(line.rstrip())
-        except Exception as e:
-            print(f"❌ 读取文件失败: {e}")
+            while True:
+                self._check_cancelled()
+                for path, text, notice in follower.poll():
+                    if notice:
+                        print(f"\n⚠️  {names[path]}: {text}")
+                        continue
+                    if path != current and len(followed) > 1:
+                        print(f"\n==> {names[path]} <==")
+                    current = path
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+                follower.wait(1.0)
+        except KeyboardInterrupt:
+            print("\n⏹️  已停止跟踪")
+        finally:
+            follower.close()
     
     def cmd_wc(self, args):
-        """统计文件行数、单词数、字符数"""
-        if not args:
-            print("用法: wc <文件>")
+        """统计文件行数、单词数、字符数: wc [-l] [-j 线程数] <文件或通配符>...
+
+        文件按块读入统计, 内存占用与文件大小无关; 多个文件在线程池中并行统计, 最后输出合计行。
+        """
+        usage = "用法: wc [-l 只统计行数] [-j 线程数] <文件或通配符>..."
+        import glob
+        from concurrent.futures import ThreadPoolExecutor
+        lines_only = False
+        unmatched = False
+        workers = SCAN_WORKERS
+        names = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg == '-l':
+                lines_only = True
+            elif arg == '-j' and args and args[0].isdigit():
+                workers = max(1, int(args.pop(0)))
+            elif arg.startswith('-') and len(arg) > 1:
+                self._usage(f"❌ 未知选项: {arg}\n{usage}")
+                return
+            elif any(c in arg for c in '*?['):
+                # 当前目录路径中的 * ? [ 是普通字符, 只有 arg 中的才是通配符
+                pattern = os.path.join(glob.escape(self.current_dir), arg)
+                matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+                if not matches:
+                    self._fail(f"❌ 没有匹配的文件: {arg}")
+                    unmatched = True
+                names.extend(os.path.relpath(path, self.current_dir) if not os.path.isabs(arg) else path
+                             for path in matches)
+            else:
+                names.append(arg)
+        if not names:
+            if not unmatched:
+                self._usage(usage)
             return
         
-        file_path = os.path.join(self.current_dir, args[0])
+        def count(name):
+            try:
+                return wc_file(os.path.join(self.current_dir, name), lines_only)
+            except OSError as e:
+                return e
+        
+        if len(names) == 1:
+            results = [count(names[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(workers, len(names)), thread_name_prefix='wc') as pool:
+                results = list(pool.map(count, names))
+        
+        errors = [f"{name}: {result.strerror or result}" for name, result in zip(names, results)
+                  if isinstance(result, OSError)]
+        counted = [(name, result) for name, result in zip(names, results) if not isinstance(result, OSError)]
+        if len(names) == 1 and counted:
+            name, result = counted[0]
+            if lines_only:
+                print(f"📄 {name}: {result['lines']} 行")
+            else:
+                print(f"📊 文件统计: {name}")
+                print(f"📄 行数: {result['lines']}")
+                print(f"📝 单词数: {result['words']}")
+                print(f"🔤 字符数: {result['chars']}")
+        elif counted:
+            keys = ('lines',) if lines_only else ('lines', 'words', 'chars', 'bytes')
+            totals = {key: sum(result[key] for _, result in counted) for key in keys}
+            headers = {'lines': '行数', 'words': '单词数', 'chars': '字符数', 'bytes': '字节数'}
+            width = max(6, len(str(max(totals.values()))))
+            print("  ".join(" " * (width - 2 * len(headers[key])) + headers[key] for key in keys) + "  文件")
+            for name, result in counted + [("总计", totals)]:
+                print("  ".join(str(result[key]).rjust(width) for key in keys) + f"  {name}")
+        if errors:
+            self._fail("❌ 统计失败:\n" + "\n".join(f"  {error}" for error in errors))
+    
+    # ==================== 流式处理 (管道) ====================
+    
+    def _read_lines(self, file_names):
+        """逐行读取文件 (惰性打开, 不保留换行符)"""
+        for name in file_names:
+            with open(os.path.join(self.current_dir, name), 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    yield line.rstrip('\r\n')
+    
+    def _stream_source(self, file_names, lines):
+        """流式命令的输入: 指定了文件则读文件, 否则读上游管道"""
+        if file_names:
+            return self._read_lines(file_names)
+        if lines is None:
+            raise ValueError("缺少输入文件")
+        return lines
+    
+    def stream_type(self, args, lines):
+        """流式输出文件内容"""
+        return self._stream_source(args, lines)
+    
+    def stream_echo(self, args, lines):
+        """流式输出文本"""
+        yield " ".join(args)
+    
+    def stream_grep(self, args, lines):
+        """流式过滤匹配正则的行 (默认不区分大小写): -F/-w/-s/-i、-c 只输出匹配行数、-A/-B/-C 上下文行
+
+        --include/--exclude、-j、--indexed 只适用于搜索目录, 在管道中是用法错误。
+        """
+        import collections
+        import re
+        usage = "用法: grep [-F] [-w] [-s|-i] [-c] [-A N] [-B N] [-C N] <模式> [文件]"
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                lines = len(content.splitlines())
-                words = len(content.split())
-                chars = len(content)
-                
-                print(f"📊 文件统计: {args[0]}")
-                print(f"📄 行数: {lines}")
-                print(f"📝 单词数: {words}")
-                print(f"🔤 字符数: {chars}")
-        except Exception as e:
-            print(f"❌ 统计失败: {e}")
+            options, pattern, file_names = self._parse_grep_args(args)
+        except ValueError:
+            raise UsageError(usage)
+        for arg in ('--include', '--exclude', '-j', '--indexed'):
+            if arg in args:
+                raise UsageError(f"❌ 管道中的 grep 不支持 {arg} (只适用于搜索文件和目录)\n{usage}")
+        source = re.escape(pattern) if options['fixed'] else pattern
+        if options['word']:
+            source = rf"\b(?:{source})\b"
+        regex = re.compile(source, re.IGNORECASE if options['ignore_case'] else 0)
+        source_lines = self._stream_source(file_names, lines)
+        if options['count']:
+            return iter([str(sum(1 for line in source_lines if regex.search(line)))])
+        before, after = options['before'], options['after']
+        if not before and not after:
+            return (line for line in source_lines if regex.search(line))
+        
+        def with_context():
+            previous = collections.deque(maxlen=before)
+            pending_after = 0
+            last = -1  # 最后输出的行号
+            for number, line in enumerate(source_lines):
+                if regex.search(line):
+                    first = number - len(previous)
+                    if last >= 0 and first > last + 1:
+                        yield "--"
+                    yield from previous
+                    previous.clear()
+                    yield line
+                    last = number
+                    pending_after = after
+                elif pending_after:
+                    yield line
+                    last = number
+                    pending_after -= 1
+                else:
+                    previous.append(line)
+        
+        return with_context()
+    
+    def stream_sort(self, args, lines):
+        """排序 (选项与 sort 命令相同, 需要读取全部输入; 超过内存预算时外部归并排序)"""
+        try:
+            options, file_names = self._parse_sort_args(args)
+        except ValueError:
+            raise ValueError("用法: sort [选项] [文件]")
+        source = (line.encode('utf-8', 'surrogateescape') for line in self._stream_source(file_names, lines))
+        for line in external_sort([], options, source, options['memory'], options['workers'],
+                                  self._check_cancelled):
+            yield line.decode('utf-8', 'surrogateescape')
+    
+    def stream_uniq(self, args, lines):
+        """去除重复行 (选项与 uniq 命令相同): 默认首次出现即输出, -a 只合并相邻行"""
+        try:
+            options, file_names = self._parse_uniq_args(args)
+        except ValueError:
+            raise ValueError("用法: uniq [选项] [文件]")
+        source = self._stream_source(file_names, lines)
+        
+        def open_lines():
+            return (line.encode('utf-8', 'surrogateescape') for line in
+                    (self._read_lines(file_names) if file_names else source))
+        
+        for line, count in self._uniq_groups(options, open_lines, bool(file_names)):
+            text = line.decode('utf-8', 'surrogateescape')
+            yield f"{count:7d} {text}" if options['count'] else text
+    
+    def stream_freq(self, args, lines):
+        """近似统计高频值和不同值个数 (选项与 freq 命令相同)"""
+        try:
+            options, file_names = self._parse_freq_args(args)
+        except ValueError:
+            raise ValueError("用法: freq [选项] [文件]")
+        source = (line.encode('utf-8', 'surrogateescape') for line in self._stream_source(file_names, lines))
+        yield from self._freq_report(options, *self._freq_collect(options, source))
+    
+    def _split_count_args(self, args, lines, default=10):
+        """解析 head/tail 参数: 文件模式为 <文件> [行数], 管道模式为 [行数]
+
+        行数也可写成 -N 或 -n N (与 tail 命令相同), 可放在文件名之前; 参数格式错误时抛出 ValueError。
+        """
+        args = list(args)
+        if '-n' in args:
+            i = args.index('-n')
+            args[i:i + 2] = args[i + 1:i + 2]
+        args = [a[1:] if a[:1] == '-' and a[1:].isdigit() else a for a in args]
+        if args and args[0].isdigit() and (lines is not None or len(args) > 1):
+            args = args[1:] + args[:1]
+        if lines is None:
+            if not args:
+                raise ValueError("缺少输入文件")
+            return args[:1], int(args[1]) if len(args) > 1 else default
+        return [], int(args[0]) if args else default
+    
+    def stream_head(self, args, lines):
+        """流式输出前 N 行, 取够后即停止读取上游"""
+        import itertools
+        file_names, count = self._split_count_args(args, lines)
+        return itertools.islice(self._stream_source(file_names, lines), count)
+    
+    def stream_tail(self, args, lines):
+        """输出最后 N 行: 文件从末尾向前定位, 管道输入只保留 N 行在内存中"""
+        import collections
+        file_names, count = self._split_count_args(args, lines)
+        if not file_names:
+            yield from collections.deque(lines, maxlen=count)
+            return
+        with open(os.path.join(self.current_dir, file_names[0]), 'rb') as f:
+            f.seek(_tail_offset(f, count))
+            for raw in f:
+                yield raw.decode('utf-8', 'replace').rstrip('\r\n')
+    
+    def stream_wc(self, args, lines):
+        """统计行数、单词数、字符数; -l 只输出行数 (-j 只适用于统计文件, 在管道中是用法错误)"""
+        usage = "用法: wc [-l 只统计行数] [文件]..."
+        lines_only = False
+        file_names = []
+        for arg in args:
+            if arg == '-l':
+                lines_only = True
+            elif arg.startswith('-') and len(arg) > 1:
+                raise UsageError(f"❌ 未知选项: {arg}\n{usage}")
+            else:
+                file_names.append(arg)
+        if lines_only:
+            yield str(sum(1 for _ in self._stream_source(file_names, lines)))
+            return
+        line_count = word_count = char_count = 0
+        for line in self._stream_source(file_names, lines):
+            line_count += 1
+            word_count += len(line.split())
+            char_count += len(line) + 1
+        yield f"{line_count} {word_count} {char_count}"
     
     # ==================== 压缩工具命令 ====================
     
     def cmd_zip(self, args):
         """创建ZIP压缩包"""
         if len(args) < 2:
-            print("用法: zip <压缩包名> <文件或目录>")
+            self._usage("用法: zip <压缩包名> <文件或目录>")
             return
         
-        zip_name = args[0]
+        zip_name = os.path.join(self.current_dir, args[0])
         items = args[1:]
         
         try:
+            import zipfile
             with zipfile.ZipFile(zip_name, 'w', zipfile.ZIP_DEFLATED) as zipf:
                 for item in items:
                     item_path = os.path.join(self.current_dir, item)
                     if os.path.isdir(item_path):
                         for root, dirs, files in os.walk(item_path):
+                            self._check_cancelled()
                             for file in files:
                                 file_path = os.path.join(root, file)
                                 arcname = os.path.relpath(file_path, self.current_dir)
@@ -906,58 +6024,61 @@ class SuperCommandLineSystem:
                         zipf.write(item_path, item)
             print(f"✅ ZIP压缩包已创建: {zip_name}")
         except Exception as e:
-            print(f"❌ 创建压缩包失败: {e}")
+            self._fail(f"❌ 创建压缩包失败: {e}")
     
     def cmd_unzip(self, args):
         """解压ZIP文件"""
         if not args:
-            print("用法: unzip <压缩包>")
+            self._usage("用法: unzip <压缩包>")
             return
         
         zip_path = os.path.join(self.current_dir, args[0])
         try:
+            import zipfile
             with zipfile.ZipFile(zip_path, 'r') as zipf:
                 zipf.extractall(self.current_dir)
             print(f"✅ 文件已解压: {args[0]}")
         except Exception as e:
-            print(f"❌ 解压失败: {e}")
+            self._fail(f"❌ 解压失败: {e}")
     
     def cmd_tar(self, args):
         """创建TAR压缩包"""
         if len(args) < 2:
-            print("用法: tar <压缩包名> <文件或目录>")
+            self._usage("用法: tar <压缩包名> <文件或目录>")
             return
         
-        tar_name = args[0]
+        tar_name = os.path.join(self.current_dir, args[0])
         items = args[1:]
         
         try:
+            import tarfile
             with tarfile.open(tar_name, 'w:gz') as tar:
                 for item in items:
                     item_path = os.path.join(self.current_dir, item)
                     tar.add(item_path, arcname=item)
             print(f"✅ TAR压缩包已创建: {tar_name}")
         except Exception as e:
-            print(f"❌ 创建TAR压缩包失败: {e}")
+            self._fail(f"❌ 创建TAR压缩包失败: {e}")
     
     def cmd_untar(self, args):
         """解压TAR文件"""
         if not args:
-            print("用法: untar <压缩包>")
+            self._usage("用法: untar <压缩包>")
             return
         
         tar_path = os.path.join(self.current_dir, args[0])
         try:
+            import tarfile
             with tarfile.open(tar_path, 'r:*') as tar:
                 tar.extractall(self.current_dir)
             print(f"✅ 文件已解压: {args[0]}")
         except Exception as e:
-            print(f"❌ 解压失败: {e}")
+            self._fail(f"❌ 解压失败: {e}")
     
     def cmd_backup(self, args):
         """备份文件"""
         if len(args) < 2:
-            print("用法: backup <源文件> <备份目录>")
+            self._usage("用法: backup <源文件> <备份目录>")
             return
         
         src = os.path.join(self.current_dir, args[0])
@@ -976,7 +6097,7 @@ class SuperCommandLineSystem:
             
             print(f"✅ 备份已创建: {backup_path}")
         except Exception as e:
-            print(f"❌ 备份失败: {e}")
+            self._fail(f"❌ 备份失败: {e}")
 
 # ==================== PartC 结束 ====================
 
@@ -987,11 +6108,12 @@ class SuperCommandLineSystem:
     def cmd_hash(self, args):
         """计算文件哈希值"""
         if not args:
-            print("用法: hash <文件>")
+            self._usage("用法: hash <文件>")
             return
         
         file_path = os.path.join(self.current_dir, args[0])
         try:
+            import hashlib
             with open(file_path, 'rb') as f:
                 content = f.read()
                 md5_hash = hashlib.md5(content).hexdigest()
@@ -1003,57 +6125,60 @@ class SuperCommandLineSystem:
                 print(f"🔐 SHA1: {sha1_hash}")
                 print(f"🔐 SHA256: {sha256_hash}")
         except Exception as e:
-            print(f"❌ 计算哈希值失败: {e}")
+            self._fail(f"❌ 计算哈希值失败: {e}")
     
     def cmd_md5(self, args):
         """计算MD5值"""
         if not args:
-            print("用法: md5 <文件>")
+            self._usage("用法: md5 <文件>")
             return
         
         file_path = os.path.join(self.current_dir, args[0])
         try:
+            import hashlib
             with open(file_path, 'rb') as f:
                 content = f.read()
                 md5_hash = hashlib.md5(content).hexdigest()
                 print(f"🔐 MD5: {md5_hash}")
         except Exception as e:
-            print(f"❌ 计算MD5失败: {e}")
+            self._fail(f"❌ 计算MD5失败: {e}")
     
     def cmd_sha1(self, args):
         """计算SHA1值"""
         if not args:
-            print("用法: sha1 <文件>")
+            self._usage("用法: sha1 <文件>")
             return
         
         file_path = os.path.join(self.current_dir, args[0])
         try:
+            import hashlib
             with open(file_path, 'rb') as f:
                 content = f.read()
                 sha1_hash = hashlib.sha1(content).hexdigest()
                 print(f"🔐 SHA1: {sha1_hash}")
         except Exception as e:
-            print(f"❌ 计算SHA1失败: {e}")
+            self._fail(f"❌ 计算SHA1失败: {e}")
     
     def cmd_sha256(self, args):
         """计算SHA256值"""
         if not args:
-            print("用法: sha256 <文件>")
+            self._usage("用法: sha256 <文件>")
             return
         
         file_path = os.path.join(self.current_dir, args[0])
         try:
+            import hashlib
             with open(file_path, 'rb') as f:
                 content = f.read()
                 sha256_hash = hashlib.sha256(content).hexdigest()
                 print(f"🔐 SHA256: {sha256_hash}")
         except Exception as e:
-            print(f"❌ 计算SHA256失败: {e}")
+            self._fail(f"❌ 计算SHA256失败: {e}")
     
     def cmd_encrypt(self, args):
         """简单加密文件"""
         if len(args) < 2:
-            print("用法: encrypt <文件> <密码>")
+            self._usage("用法: encrypt <文件> <密码>")
             return
         
         file_path = os.path.join(self.current_dir, args[0])
@@ -1072,12 +6197,12 @@ class SuperCommandLineSystem:
             
             print(f"✅ 文件已加密: {encrypted_path}")
         except Exception as e:
-            print(f"❌ 加密失败: {e}")
+            self._fail(f"❌ 加密失败: {e}")
     
     def cmd_decrypt(self, args):
         """解密文件"""
         if len(args) < 2:
-            print("用法: decrypt <加密文件> <密码>")
+            self._usage("用法: decrypt <加密文件> <密码>")
             return
         
         file_path = os.path.join(self.current_dir, args[0])
@@ -1096,7 +6221,7 @@ class SuperCommandLineSystem:
             
             print(f"✅ 文件已解密: {decrypted_path}")
         except Exception as e:
-            print(f"❌ 解密失败: {e}")
+            self._fail(f"❌ 解密失败: {e}")
     
     # ==================== 其他工具命令 ====================
     
@@ -1106,7 +6231,20 @@ class SuperCommandLineSystem:
         print(f"📅 当前日期: {now.strftime('%Y-%m-%d %H:%M:%S')}")
     
     def cmd_time(self, args):
-        """显示当前时间"""
+        """显示当前时间; time <命令> 执行命令并报告耗时"""
+        if args:
+            sample = ResourceSample()
+            status = self.execute_command(" ".join(args))
+            wall, cpu, read, written = sample.finish()
+            mark = "≈" if sample.shared else ""
+            report = f"⏱️  实际: {wall:.3f}s  CPU: {mark}{cpu:.3f}s"
+            if read is not None:
+                report += f"  读取: {mark}{self._format_size(read)}  写入: {mark}{self._format_size(written)}"
+            print(report)
+            if sample.shared:
+                print("   ≈ 有其他任务或会话同时运行: CPU 只计本线程, 读写含其他线程, 均为近似值")
+            self.last_status = status
+            return
         now = datetime.datetime.now()
         print(f"🕒 当前时间: {now.strftime('%H:%M:%S')}")
     
@@ -1115,15 +6253,40 @@ class SuperCommandLineSystem:
         print(" ".join(args))
     
     def cmd_history(self, args):
-        """显示命令历史"""
+        """显示命令历史: history [数量] | history search <文本> | history top [数量]"""
+        action = args[0].lower() if args else ''
+        if action == 'search':
+            if len(args) < 2:
+                self._usage("用法: history search <文本>")
+                return
+            text = " ".join(args[1:])
+            results = self.history.search(text)
+            print(f"🔍 历史中包含 '{text}' 的命令 (按使用次数排序):")
+            for command, count, last_id in results:
+                print(f"{last_id:6d}  {count:5d}次  {command}")
+            print(f"📊 找到 {len(results)} 条")
+            return
+        if action == 'top':
+            if len(args) > 2 or (len(args) == 2 and not args[1].isdigit()):
+                self._usage("用法: history top [数量]")
+                return
+            limit = int(args[1]) if len(args) > 1 else 20
+            print("🏆 最常用的命令:")
+            for rank, (command, count) in enumerate(self.history.top(limit), 1):
+                print(f"{rank:3d}. {count:6d}次  {command}")
+            return
+        if action and not action.isdigit():
+            self._usage("用法: history [数量] | history search <文本> | history top [数量]")
+            return
+        
         print("📜 命令历史:")
-        for i, cmd in enumerate(self.history[-20:], 1):
-            print(f"{i:2d}: {cmd}")
+        for entry_id, cmd in self.history.last(int(action) if action else 20):
+            print(f"{entry_id:6d}: {cmd}")
     
     def cmd_calc(self, args):
         """简单计算器"""
         if not args:
-            print("用法: calc <表达式>")
+            self._usage("用法: calc <表达式>")
             print("示例: calc 2 + 3 * 4")
             return
         
@@ -1132,12 +6295,12 @@ class SuperCommandLineSystem:
             result = eval(expression)
             print(f"🧮 {expression} = {result}")
         except Exception as e:
-            print(f"❌ 计算错误: {e}")
+            self._fail(f"❌ 计算错误: {e}")
     
     def cmd_random(self, args):
         """生成随机数"""
         if len(args) < 2:
-            print("用法: random <最小值> <最大值> [数量]")
+            self._usage("用法: random <最小值> <最大值> [数量]")
             return
         
         try:
@@ -1149,7 +6312,7 @@ class SuperCommandLineSystem:
             for _ in range(count):
                 print(random.randint(min_val, max_val))
         except ValueError:
-            print("❌ 请输入有效的数字")
+            self._fail("❌ 请输入有效的数字")
     
     def cmd_help(self, args):
         """显示帮助信息"""
@@ -1157,18 +6320,20 @@ class SuperCommandLineSystem:
 🎯 超级Python模拟系统 - 帮助信息
 
 📁 文件操作:
-  dir, ls          - 列出目录内容
-  copy, cp         - 复制文件或目录
+  dir, ls          - 列出目录内容 (dir [路径] [*.log] -s/-t/-r --limit N --page P --stream)
+  copy, cp         - 复制文件或目录 (-j N 线程数, --hash 按内容跳过, --force 全部重新复制)
   move, mv         - 移动文件或目录
-  del, rm          - 删除文件或目录
-  type, cat        - 显示文件内容
+  del, rm          - 删除文件或目录 (-j N 线程数, --dry-run 只统计不删除)
+  type, cat        - 显示文件内容 (-x 十六进制, --line N / --offset N 跳转, -n 行数, -p 分页)
   mkdir            - 创建目录
   rmdir            - 删除空目录
   cd               - 切换目录
   pwd              - 显示当前目录
   touch            - 创建空文件
-  tree             - 显示目录树
-  size             - 显示文件大小
+  tree             - 显示目录树 (--depth N --max-entries N --dirs-only -s)
+  size             - 显示文件或目录大小 (--fresh 忽略缓存, --live 不使用索引)
+  largest          - 最大的文件和目录 (largest <目录> [N] --exclude 模式 -x)
+  index            - 文件索引 (index build <目录> / refresh / status / drop; index grep <目录> 内容索引)
 
 💻 系统信息:
   sysinfo          - 显示系统信息
@@ -1187,12 +6352,13 @@ class SuperCommandLineSystem:
 
 📝 文本处理:
   find             - 查找文件
-  grep             - 搜索文本
-  sort             - 排序文件内容
-  uniq             - 去除重复行
-  head             - 显示文件开头
-  tail             - 显示文件结尾
-  wc               - 统计文件行数
+  grep             - 搜索文本 (正则; -F 固定字符串, -s 区分大小写, -w 整词, -c 计数, -A/-B/-C 上下文, 可递归搜索目录, --indexed 使用内容索引)
+  sort             - 排序文件内容 (-n 数值, -r 逆序, -u 去重, -k/-t 字段, -S 内存预算; 大文件外部归并排序)
+  uniq             - 去除重复行 (-c 计数, -d 只输出重复行, -u 只输出不重复的行, -a 只合并相邻行, -S 内存预算)
+  freq             - 近似统计高频值和不同值个数 (Space-Saving + HyperLogLog; -f/-t/-e 取字段, --save/--load 状态)
+  head             - 显示文件开头 (-n 行数 或 -行数)
+  tail             - 显示文件结尾 (-n 行数, -f 跟踪新增内容, 可指定多个文件)
+  wc               - 统计文件行数 (可指定多个文件或通配符, 输出合计; -l 只统计行数)
 
 📦 压缩工具:
   zip              - 创建ZIP压缩包
@@ -1222,10 +6388,16 @@ class SuperCommandLineSystem:
   date             - 显示当前日期
   time             - 显示当前时间
   echo             - 显示文本
-  history          - 显示命令历史
+  history          - 显示命令历史 (history search <文本> / history top)
+  !n, !前缀, !!     - 重新执行历史中的命令
   profile          - 显示用户资料
   level            - 显示等级信息
   games            - 显示游戏列表
+  stats            - 命令耗时统计 (stats on/off/reset/json)
+  time <命令>      - 执行命令并报告耗时
+  bench            - 运行基准测试套件并与基线比较 (bench --list)
+  jobs             - 列出后台任务 (jobs -j N 设置线程数)
+  wait, fg, kill   - 等待 / 取回输出 / 终止后台任务
   alias            - 设置命令别名
   unalias          - 删除命令别名
   cls, clear       - 清屏
@@ -1243,6 +6415,12 @@ class SuperCommandLineSystem:
   download https://example.com/file.txt myfile.txt - 下载文件
   snake            - 开始贪吃蛇游戏
   help             - 显示帮助信息
+
+🔗 管道与重定向:
+  type app.log | grep ERROR | head 20 - 管道 (取够20行即停止读取)
+  dir > list.txt   - 输出写入文件 (>> 为追加)
+  size bigdir &    - 在后台运行命令, 用 jobs / fg 1 查看结果
+  type, echo, grep, sort, uniq, head, tail, wc 可在管道中读取上游输出
         """
         print(help_text)
     
@@ -1254,26 +6432,28 @@ class SuperCommandLineSystem:
     def cmd_alias(self, args):
         """设置命令别名"""
         if len(args) < 2:
-            print("用法: alias <别名> <命令>")
+            self._usage("用法: alias <别名> <命令>")
             return
         
         alias = args[0]
         command = " ".join(args[1:])
         self.aliases[alias] = command
+        self._rebuild_dispatch()
         print(f"✅ 别名已设置: {alias} -> {command}")
     
     def cmd_unalias(self, args):
         """删除命令别名"""
         if not args:
-            print("用法: unalias <别名>")
+            self._usage("用法: unalias <别名>")
             return
         
         alias = args[0]
         if alias in self.aliases:
             del self.aliases[alias]
+            self._rebuild_dispatch()
             print(f"✅ 别名已删除: {alias}")
         else:
-            print(f"❌ 别名不存在: {alias}")
+            self._fail(f"❌ 别名不存在: {alias}")
     
     def cmd_profile(self, args):
         """显示用户资料"""
@@ -1392,14 +6572,14 @@ class SuperCommandLineSystem:
             
             print(f"🎮 游戏结束! 最终得分: {score}")
             if score > 0:
-                self.user_data['games_won'] += 1
-                self.user_data['experience'] += score
+                self.user_data.incr('games_won')
+                self.user_data.incr('experience', score)
                 print(f"🏆 获得 {score} 经验值!")
             
         except ImportError:
-            print("❌ 在Windows系统上才能运行此游戏")
+            self._fail("❌ 在Windows系统上才能运行此游戏")
         except Exception as e:
-            print(f"❌ 游戏运行失败: {e}")
+            self._fail(f"❌ 游戏运行失败: {e}")
     
     def cmd_tetris(self, args):
         """俄罗斯方块游戏"""
@@ -1514,14 +6694,14 @@ class SuperCommandLineSystem:
             
             print(f"🎮 游戏结束! 最终得分: {score}")
             if score > 0:
-                self.user_data['games_won'] += 1
-                self.user_data['experience'] += score // 10
+                self.user_data.incr('games_won')
+                self.user_data.incr('experience', score // 10)
                 print(f"🏆 获得 {score // 10} 经验值!")
             
         except ImportError:
-            print("❌ 在Windows系统上才能运行此游戏")
+            self._fail("❌ 在Windows系统上才能运行此游戏")
         except Exception as e:
-            print(f"❌ 游戏运行失败: {e}")
+            self._fail(f"❌ 游戏运行失败: {e}")
     
     def cmd_guess(self, args):
         """猜数字游戏"""
@@ -1544,8 +6724,8 @@ class SuperCommandLineSystem:
                 else:
                     print(f"🎉 恭喜你猜对了! 数字是 {number}")
                     print(f"📊 你用了 {attempts} 次就猜对了!")
-                    self.user_data['games_won'] += 1
-                    self.user_data['experience'] += (11 - attempts) * 10
+                    self.user_data.incr('games_won')
+                    self.user_data.incr('experience', (11 - attempts) * 10)
                     print(f"🏆 获得 {(11 - attempts) * 10} 经验值!")
                     return
                 
@@ -1632,8 +6812,8 @@ class SuperCommandLineSystem:
             if check_winner(board) == 'X':
                 print_board()
                 print("🎉 恭喜你赢了!")
-                self.user_data['games_won'] += 1
-                self.user_data['experience'] += 50
+                self.user_data.incr('games_won')
+                self.user_data.incr('experience', 50)
                 print("🏆 获得 50 经验值!")
                 break
             
@@ -1685,8 +6865,8 @@ class SuperCommandLineSystem:
             # 检查是否完成
             if '_' not in display:
                 print(f"🎉 恭喜你猜对了! 单词是 '{word}'")
-                self.user_data['games_won'] += 1
-                self.user_data['experience'] += (max_wrong - wrong_guesses) * 10
+                self.user_data.incr('games_won')
+                self.user_data.incr('experience', (max_wrong - wrong_guesses) * 10)
                 print(f"🏆 获得 {(max_wrong - wrong_guesses) * 10} 经验值!")
                 return
             
@@ -1718,20 +6898,522 @@ class SuperCommandLineSystem:
 
 # ==================== PartE 结束 ====================
 
+# ==================== PartG: 后台任务 ====================
+
+    def _check_cancelled(self):
+        """后台任务的取消检查点: 任务被 kill 后抛出 CommandCancelled"""
+        job = getattr(self._state, 'job', None)
+        if job is not None and job.cancel_event.is_set():
+            raise CommandCancelled()
+    
+    def _submit_job(self, command: str) -> int:
+        """把命令提交到后台线程池 (命令 &)"""
+        if not command:
+            self._usage("用法: <命令> &")
+            return self.last_status
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=self.max_jobs,
+                                                thread_name_prefix='job')
+        
+        self._job_seq += 1
+        job = Job(self._job_seq, command)
+        self.jobs[job.id] = job
+        job.future = self._executor.submit(self._run_job, job)
+        print(f"[{job.id}] {command}")
+        self.last_status = 0
+        return 0
+    
+    def _run_job(self, job: Job):
+        """在工作线程中执行后台任务, 输出写入任务自己的缓冲区"""
+        job.started = time.time()
+        self._state.job = job
+        try:
+            with capture_output(job.output), concurrent_work():
+                if job.cancel_event.is_set():
+                    raise CommandCancelled()
+                job.status = self.execute_command(job.command)
+        except CommandCancelled:
+            job.status = 130
+        except Exception as e:
+            job.output.write(f"命令执行错误: {e}\n")
+            job.status = 1
+        finally:
+            self._state.job = None
+            job.finished = time.time()
+        return job.status
+    
+    def _report_finished_jobs(self):
+        """交互模式下, 在提示符前报告已结束的后台任务"""
+        for job in list(self.jobs.values()):
+            if not job.reported and job.future.done():
+                job.reported = True
+                print(f"[{job.id}] {job.state:<8} {job.elapsed:7.2f}s  {job.command}")
+    
+    def _drain_jobs(self) -> bool:
+        """退出前等待所有后台任务并输出尚未查看的结果, 有失败任务时返回 True"""
+        failed = False
+        for job_id in sorted(self.jobs):
+            job = self.jobs[job_id]
+            if not job.future.cancelled():
+                job.future.result()
+            if not job.reported:
+                self._print_job_output(job)
+            failed = failed or bool(job.status)
+        self.jobs.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        return failed
+    
+    def _print_job_output(self, job: Job):
+        """输出任务捕获的内容和摘要"""
+        job.reported = True
+        output = job.output.getvalue()
+        if output:
+            sys.stdout.write(output if output.endswith('\n') else output + '\n')
+        print(f"[{job.id}] {job.state:<8} {job.elapsed:7.2f}s  {job.command}")
+    
+    def _get_job(self, arg: str):
+        """按编号 (可带 % 前缀) 查找任务"""
+        try:
+            job = self.jobs.get(int(arg.lstrip('%')))
+        except ValueError:
+            job = None
+        if job is None:
+            self._fail(f"❌ 任务不存在: {arg}")
+        return job
+    
+    def cmd_jobs(self, args):
+        """列出后台任务, jobs -j N 设置线程池大小"""
+        if args and args[0] == '-j':
+            try:
+                size = int(args[1])
+                if size < 1:
+                    raise ValueError
+            except (IndexError, ValueError):
+                self._usage("用法: jobs [-j <线程数>]")
+                return
+            self.max_jobs = size
+            if self._executor is not None:
+                # 已提交的任务继续在旧线程池中运行, 新任务使用新线程池
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            print(f"✅ 后台线程池大小: {size}")
+            return
+        
+        if not self.jobs:
+            print("📋 没有后台任务")
+            return
+        print(f"📋 后台任务 (线程池大小 {self.max_jobs}):")
+        print(f"{'编号':<6} {'状态':<10} {'耗时':>9}  命令")
+        for job in self.jobs.values():
+            print(f"[{job.id}]{'':<3} {job.state:<10} {job.elapsed:8.2f}s  {job.command}")
+    
+    def cmd_wait(self, args):
+        """等待后台任务结束 (不指定编号时等待全部)"""
+        jobs = [self._get_job(a) for a in args] if args else list(self.jobs.values())
+        if None in jobs:
+            return
+        status = 0
+        for job in jobs:
+            if not job.future.cancelled():
+                job.future.result()
+            print(f"[{job.id}] {job.state:<8} {job.elapsed:7.2f}s  {job.command}")
+            job.reported = True
+            status = status or (job.status or 0)
+        self.last_status = status
+    
+    def cmd_fg(self, args):
+        """等待任务结束并输出其捕获的内容 (不指定编号时取最近的任务)"""
+        if not self.jobs:
+            self._fail("❌ 没有后台任务")
+            return
+        job = self._get_job(args[0]) if args else self.jobs[max(self.jobs)]
+        if job is None:
+            return
+        if not job.future.cancelled():
+            job.future.result()
+        self._print_job_output(job)
+        del self.jobs[job.id]
+        self.last_status = job.status or 0
+    
+    def cmd_kill(self, args):
+        """终止后台任务: 等待中的任务直接取消, 运行中的任务在下一个检查点停止"""
+        if not args:
+            self._usage("用法: kill <任务编号>")
+            return
+        for arg in args:
+            job = self._get_job(arg)
+            if job is None:
+                continue
+            if job.future.done():
+                print(f"[{job.id}] 任务已结束")
+            elif job.future.cancel():
+                job.finished = time.time()
+                print(f"[{job.id}] 已取消")
+            else:
+                job.cancel_event.set()
+                print(f"[{job.id}] 已请求终止")
+
+    # ==================== 性能统计 ====================
+    
+    def _record_stats(self, name: str, sample: ResourceSample, status: int):
+        """把一次命令执行的资源消耗记入该命令的直方图"""
+        wall, cpu, read, written = sample.finish()
+        with self._stats_lock:
+            stats = self.command_stats.get(name)
+            if stats is None:
+                stats = self.command_stats[name] = CommandStats()
+            stats.wall.record(wall * 1e6)
+            stats.cpu.record(cpu * 1e6)
+            if status:
+                stats.failures += 1
+            if sample.shared:
+                stats.approximate += 1
+            if read is not None:
+                stats.bytes_read += read
+                stats.bytes_written += written
+    
+    def export_stats(self) -> Dict[str, Any]:
+        """导出全部命令统计 (可直接序列化为 JSON)"""
+        with self._stats_lock:
+            return {
+                'generated': datetime.datetime.now().isoformat(timespec='seconds'),
+                'commands': {name: stats.to_dict() for name, stats in sorted(self.command_stats.items())},
+            }
+    
+    def cmd_stats(self, args):
+        """命令耗时统计: stats [on|off|reset|json [文件]]"""
+        action = args[0].lower() if args else ''
+        if action in ('on', 'off'):
+            self.stats_enabled = action == 'on'
+            print(f"✅ 命令统计已{'开启' if self.stats_enabled else '关闭'}")
+            return
+        if action == 'reset':
+            with self._stats_lock:
+                self.command_stats.clear()
+            print("✅ 命令统计已清空")
+            return
+        if action == 'json':
+            text = json.dumps(self.export_stats(), ensure_ascii=False, indent=2)
+            if len(args) > 1:
+                path = os.path.join(self.current_dir, args[1])
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                print(f"✅ 统计已导出: {path}")
+            else:
+                print(text)
+            return
+        if action:
+            self._usage("用法: stats [on|off|reset|json [文件]]")
+            return
+        
+        if not self.command_stats:
+            print("📊 暂无统计数据" + ("" if self.stats_enabled else " (使用 'stats on' 开启)"))
+            return
+        
+        def ms(us):
+            return f"{us / 1000:.2f}"
+        
+        print(f"📊 命令统计 (单位: 毫秒){'' if self.stats_enabled else ' [已关闭]'}")
+        print(f"{'命令':<12} {'次数':>6} {'失败':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'平均':>9} {'CPU平均':>9} {'读取':>10} {'写入':>10}")
+        print("-" * 100)
+        with self._stats_lock:
+            rows = sorted(self.command_stats.items(), key=lambda item: -item[1].wall.total)
+            for name, stats in rows:
+                wall, cpu = stats.wall, stats.cpu
+                name = name + ("*" if stats.approximate else "")
+                print(f"{name:<12} {wall.count:>6} {stats.failures:>5} {ms(wall.percentile(50)):>9} "
+                      f"{ms(wall.percentile(95)):>9} {ms(wall.percentile(99)):>9} "
+                      f"{ms(wall.total / wall.count):>9} {ms(cpu.total / cpu.count):>9} "
+                      f"{self._format_size(stats.bytes_read):>10} {self._format_size(stats.bytes_written):>10}")
+            if any(stats.approximate for name, stats in rows):
+                print("* 部分执行时有其他任务或会话同时运行, CPU 和读写为近似值")
+    
+    def cmd_bench(self, args):
+        """运行基准测试套件: bench [用例...] [--scale S] [--save-baseline] (参数同 benchmark.py)"""
+        import benchmark
+        status = benchmark.run_benchmarks(args, system_class=type(self))
+        if status:
+            self.last_status = status
+
+# ==================== PartG 结束 ====================
+
+# ==================== PartH: 守护进程模式 ====================
+
+def default_socket_path() -> str:
+    """守护进程套接字路径 (client.py 中有相同的规则)"""
+    return os.environ.get('SUPERSIM_SOCKET') or state_path(DAEMON_SOCKET)
+
+def _run_session_command(session: SuperCommandLineSystem, command: str):
+    """在工作线程中执行会话的一行命令, 返回 (输出, 状态码)"""
+    import io
+    buffer = io.StringIO()
+    with capture_output(buffer), concurrent_work():
+        session.user_data.incr('commands_used')
+        try:
+            status = session.run_line(command)
+        except Exception as e:
+            print(f"错误: {e}")
+            status = 1
+    return buffer.getvalue(), status
+
+def _close_session(session: SuperCommandLineSystem):
+    """会话结束: 等待其后台任务并丢弃未取回的输出"""
+    import io
+    with capture_output(io.StringIO()):
+        session._drain_jobs()
+
+
+def serve_daemon(socket_path: str, max_sessions: int = 32) -> int:
+    """守护进程: 在 Unix 套接字上为多个并发会话执行命令
+
+    协议为按行分隔的 JSON。请求 {"cmd": 命令行, "cwd": 目录} 中的 cwd
+    只在会话 (连接) 的第一个请求中用作初始目录; 响应为
+    {"out": 输出, "status": 状态码, "cwd": 会话目录, "running": 会话是否继续}。
+    请求 {"op": "shutdown"} 停止守护进程。一行请求超过 DAEMON_LINE_LIMIT 时返回状态码 2 并关闭连接。
+    """
+    import asyncio
+    import socket
+    from concurrent.futures import ThreadPoolExecutor
+    
+    if not hasattr(socket, 'AF_UNIX'):
+        print("❌ 当前系统不支持 Unix 套接字, 无法使用守护进程模式")
+        return 1
+    
+    # 预热: 提前导入命令会用到的依赖, 客户端请求不再承担导入开销
+    import importlib
+    for name in HEAVY_MODULES:
+        if name != 'webbrowser' and module_available(name.split('.')[0]):
+            importlib.import_module(name)
+    # 会话中的交互式命令 (如游戏) 不能读取守护进程的标准输入
+    sys.stdin = open(os.devnull, 'r')
+    
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            print(f"❌ 守护进程已在运行: {socket_path}")
+            return 1
+        except OSError:
+            os.remove(socket_path)  # 上次异常退出留下的套接字文件
+        finally:
+            probe.close()
+    os.makedirs(os.path.dirname(socket_path) or '.', exist_ok=True)
+    
+    executor = ThreadPoolExecutor(max_workers=max_sessions, thread_name_prefix='session')
+    
+    async def handle(reader, writer):
+        loop = asyncio.get_running_loop()
+        session = None
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as e:
+                    line = e.partial
+                except asyncio.LimitOverrunError:
+                    # 超过行长度上限: 丢弃这一行的其余部分 (带着未读数据关闭连接会让对方收不到响应)
+                    while True:
+                        chunk = await reader.read(1 << 16)
+                        if not chunk or b'\n' in chunk:
+                            break
+                    response = {'out': f"❌ 请求超过 {DAEMON_LINE_LIMIT >> 20} MiB 上限\n", 'status': 2,
+                                'cwd': session.current_dir if session else None, 'running': False}
+                    writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    break
+                if request.get('op') == 'shutdown':
+                    writer.write(b'{"status": 0}\n')
+                    await writer.drain()
+                    stop.set()
+                    break
+                if session is None:
+                    cwd = request.get('cwd')
+                    session = SuperCommandLineSystem(current_dir=cwd if cwd and os.path.isdir(cwd) else None)
+                output, status = await loop.run_in_executor(
+                    executor, _run_session_command, session, request.get('cmd', ''))
+                response = {'out': output, 'status': status,
+                            'cwd': session.current_dir, 'running': session.running}
+                writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+                if not session.running:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            if session is not None:
+                await loop.run_in_executor(executor, _close_session, session)
+    
+    stop = None
+    
+    async def serve():
+        nonlocal stop
+        stop = asyncio.Event()
+        server = await asyncio.start_unix_server(handle, path=socket_path, limit=DAEMON_LINE_LIMIT)
+        os.chmod(socket_path, 0o600)
+        print(f"🚀 守护进程已启动: {socket_path}", flush=True)
+        async with server:
+            await stop.wait()
+    
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(wait=False)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        print("👋 守护进程已停止")
+    return 0
+
+# ==================== PartH 结束 ====================
+
 # ==================== PartF: 主函数和程序入口 ====================
 
-def main():
+def startup_profile(top: int = 15) -> int:
+    """在全新的解释器中测量启动耗时并报告导入耗时分布
+
+    返回 0 表示在预算内; 超出 STARTUP_BUDGET_MS 或启动路径上
+    出现 HEAVY_MODULES 中的依赖时返回 1。
+    """
+    import subprocess
+    probe = ("import sys, time; before = set(sys.modules); t = time.perf_counter(); "
+             "import main; t1 = time.perf_counter(); main.SuperCommandLineSystem(); "
+             "print((t1 - t) * 1000, (time.perf_counter() - t1) * 1000, "
+             "*[m for m in main.HEAVY_MODULES if m in sys.modules and m not in before])")
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"❌ 启动测量失败: {result.stderr.strip().splitlines()[-1:]}")
+        return 1
+
+    # 解析 "import time: self [us] | cumulative | imported package"
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), depth, int(fields[0]), int(fields[1])))
+
+    main_index = next((i for i, e in enumerate(entries) if e[0] == 'main' and e[1] == 0), None)
+    if main_index is None:
+        print("❌ 未找到 main 模块的导入记录")
+        return 1
+    # importtime 按完成顺序输出, main 的子模块位于其前方且缩进更深
+    children = []
+    for name, depth, self_us, cumulative_us in reversed(entries[:main_index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((name, cumulative_us))
+    fields = result.stdout.split()
+    import_ms, init_ms, eager = float(fields[0]), float(fields[1]), fields[2:]
+
+    print("⏱️  启动耗时分析:")
+    print(f"  导入 main:      {import_ms:8.1f} ms (预算 {STARTUP_BUDGET_MS} ms)")
+    print(f"  创建系统实例:   {init_ms:8.1f} ms")
+    print(f"  main 自身:      {entries[main_index][2] / 1000:8.1f} ms")
+    print(f"\n📊 main 的直接导入 (累计耗时前 {top} 项):")
+    for name, cumulative_us in sorted(children, key=lambda c: -c[1])[:top]:
+        print(f"  {name:<30} {cumulative_us / 1000:8.2f} ms")
+
+    status = 0
+    if eager:
+        print(f"\n❌ 以下依赖不应在启动时导入: {', '.join(eager)}")
+        status = 1
+    if import_ms > STARTUP_BUDGET_MS:
+        print(f"\n❌ 启动耗时超出预算: {import_ms:.1f} ms > {STARTUP_BUDGET_MS} ms")
+        status = 1
+    if status == 0:
+        print("\n✅ 启动耗时在预算内")
+    return status
+
+def _create_system(options) -> SuperCommandLineSystem:
+    """按命令行参数创建系统实例"""
+    system = SuperCommandLineSystem(max_jobs=options.jobs)
+    system.stats_enabled = options.stats or bool(options.stats_json)
+    return system
+
+def _export_stats(system: SuperCommandLineSystem, options):
+    """按 --stats-json 导出命令统计"""
+    if options.stats_json:
+        with open(options.stats_json, 'w', encoding='utf-8') as f:
+            json.dump(system.export_stats(), f, ensure_ascii=False, indent=2)
+
+def main(argv=None):
     """主函数"""
+    import argparse
+    parser = argparse.ArgumentParser(description="超级Python模拟系统")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="报告启动导入耗时分布, 超出预算时返回非零退出码")
+    parser.add_argument('-c', dest='commands', metavar='CMDS',
+                        help="执行命令后退出, 多条命令可用 ; && || 串联")
+    parser.add_argument('-f', dest='script', metavar='FILE',
+                        help="逐行执行脚本文件中的命令 ('-' 表示标准输入)")
+    parser.add_argument('-e', '--errexit', action='store_true',
+                        help="批处理模式下遇到失败命令立即停止")
+    parser.add_argument('-x', '--trace', action='store_true',
+                        help="批处理模式下把每条命令及其退出码输出到标准错误")
+    parser.add_argument('-j', '--jobs', type=int, default=None, metavar='N',
+                        help="后台任务 (命令 &) 线程池大小")
+    parser.add_argument('--daemon', action='store_true',
+                        help="以守护进程方式运行, 通过 Unix 套接字为多个会话服务 (客户端: client.py)")
+    parser.add_argument('--socket', metavar='PATH', default=None,
+                        help="守护进程的套接字路径")
+    parser.add_argument('--stats', action='store_true',
+                        help="开启命令耗时统计")
+    parser.add_argument('--stats-json', metavar='FILE',
+                        help="退出时把命令统计导出为 JSON (隐含 --stats)")
+    options = parser.parse_args(argv)
+    
+    if options.startup_profile:
+        return startup_profile()
+    
+    if options.daemon:
+        return serve_daemon(options.socket or default_socket_path())
+    
+    # 批处理模式: -c / -f, 或标准输入不是终端
+    if options.commands is not None or options.script is not None or not sys.stdin.isatty():
+        system = _create_system(options)
+        if options.commands is not None:
+            lines = [options.commands]
+        elif options.script not in (None, '-'):
+            try:
+                with open(options.script, 'r', encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+            except OSError as e:
+                print(f"❌ 读取脚本失败: {e}", file=sys.stderr)
+                return 2
+        else:
+            lines = sys.stdin
+        exit_code = system.run_batch(lines, errexit=options.errexit, trace=options.trace)
+        _export_stats(system, options)
+        return exit_code
+    
     try:
         print("🚀 正在启动超级Python模拟系统...")
-        system = SuperCommandLineSystem()
+        system = _create_system(options)
         system.run()
+        _export_stats(system, options)
     except KeyboardInterrupt:
         print("\n👋 程序已退出")
     except Exception as e:
         print(f"❌ 系统错误: {e}")
         print("💡 请检查依赖包是否安装完整")
         print("📦 需要安装的包: psutil, requests")
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
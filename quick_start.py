@@ -6,23 +6,23 @@
 
 import sys
 import os
+from importlib.util import find_spec
 
 def check_basic_dependencies():
     """检查基本依赖"""
     missing = []
     
-    try:
-        import psutil
+    # 只查找包是否存在, 不在启动检查时导入它们
+    if find_spec("psutil") is not None:
         print("✅ psutil 已安装")
-    except ImportError:
+    else:
         missing.append("psutil")
         print("❌ psutil 未安装")
     
     # 可选依赖
-    try:
-        import requests
+    if find_spec("requests") is not None:
         print("✅ requests 已安装")
-    except ImportError:
+    else:
         print("⚠️  requests 未安装 (网络功能将不可用)")
     
     return missing
@@ -0,0 +1,950 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令行框架测试脚本
+"""
+
+import os
+import sys
+
+from main import SuperCommandLineSystem
+
+
+def make_system(tmp_path, monkeypatch):
+    """在临时目录中创建系统实例"""
+    monkeypatch.chdir(tmp_path)
+    return SuperCommandLineSystem()
+
+
+def test_alias_dispatch(tmp_path, monkeypatch, capsys):
+    """测试别名预展开与别名修改后的分派"""
+    system = make_system(tmp_path, monkeypatch)
+    calls = []
+    system.register_command('probe', lambda args: calls.append(args))
+
+    system.cmd_alias(['pr', 'probe', '-x'])
+    system.execute_command('pr a')
+    system.cmd_unalias(['pr'])
+    system.execute_command('pr a')
+
+    assert calls == [['-x', 'a']]
+    assert '未知命令: pr' in capsys.readouterr().out
+
+
+def test_plugin_loaded_on_first_use(tmp_path, monkeypatch, capsys):
+    """测试插件命令在首次调用时才加载"""
+    plugin_dir = tmp_path / 'plugins'
+    plugin_dir.mkdir()
+    (plugin_dir / 'greet.py').write_text(
+        "# commands: hello, hi\n"
+        "LOADED = True\n"
+        "def cmd_hello(system, args):\n"
+        "    print('hello ' + ' '.join(args))\n"
+        "COMMANDS = {'hello': cmd_hello, 'hi': cmd_hello}\n",
+        encoding='utf-8')
+
+    system = make_system(tmp_path, monkeypatch)
+    system.plugin_dir = str(plugin_dir)
+    assert 'hi' not in system.commands
+
+    system.execute_command('hi there')
+    assert 'hello there' in capsys.readouterr().out
+    assert 'hello' in system.commands
+
+
+def test_batch_chaining_and_status(tmp_path, monkeypatch, capsys):
+    """测试批处理中的 ; && || 串联与退出码"""
+    system = make_system(tmp_path, monkeypatch)
+
+    assert system.run_line('echo a && type missing.txt && echo b') == 1
+    assert system.run_line('type missing.txt || echo c; echo d') == 0
+    assert system.run_line('echo "x; y"') == 0
+    assert system.execute_command('nosuchcommand') == 127
+    out = capsys.readouterr().out
+    assert 'b\n' not in out
+    assert 'c\nd\n' in out
+    assert '"x; y"' in out
+
+    assert system.run_batch(['echo 1', 'type missing.txt', 'echo 2']) == 1
+    assert system.run_batch(['type missing.txt', 'echo 3'], errexit=True) == 1
+    assert '3' not in capsys.readouterr().out.split()
+
+
+def test_pipeline_and_redirection(tmp_path, monkeypatch, capsys):
+    """测试管道在取够行数后停止读取, 以及 > / >> 重定向"""
+    system = make_system(tmp_path, monkeypatch)
+    (tmp_path / 'big.log').write_text(
+        ''.join(f"{i} {'ERROR' if i % 3 == 0 else 'ok'}\n" for i in range(1000)),
+        encoding='utf-8')
+
+    read = []
+    original = system._read_lines
+
+    def counting_read(file_names):
+        for line in original(file_names):
+            read.append(line)
+            yield line
+
+    monkeypatch.setattr(system, '_read_lines', counting_read)
+    assert system.execute_command('cat big.log | grep error | head 2') == 0
+    assert capsys.readouterr().out == '0 ERROR\n3 ERROR\n'
+    assert len(read) == 4
+
+    system.execute_command('echo b > out.txt')
+    system.execute_command('echo a >> out.txt')
+    system.execute_command('sort out.txt | uniq > sorted.txt')
+    assert (tmp_path / 'sorted.txt').read_text(encoding='utf-8') == 'a\nb\n'
+    assert system.execute_command('type missing.txt | head 1') == 1
+
+
+def test_background_jobs_capture_output(tmp_path, monkeypatch, capsys):
+    """测试后台任务各自捕获输出, fg 输出结果, kill 取消排队中的任务"""
+    import threading
+    system = make_system(tmp_path, monkeypatch)
+    release = threading.Event()
+    system.register_command('block', lambda args: release.wait(5))
+
+    system.max_jobs = 1
+    assert system.execute_command('block &') == 0
+    assert system.execute_command('echo queued &') == 0
+    system.execute_command('kill 2')
+    release.set()
+    system.execute_command('wait 1')
+
+    assert system.execute_command('echo from-job &') == 0
+    system.execute_command('fg 3')
+    out = capsys.readouterr().out
+    assert '[2] 已取消' in out
+    assert 'from-job\n[3] 完成' in out
+    assert out.count('queued') == 1
+    assert system._drain_jobs() is False
+
+
+def test_stats_histogram_and_export(tmp_path, monkeypatch, capsys):
+    """测试命令统计的分位数估计和 JSON 导出"""
+    from main import LatencyHistogram
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.record(value)
+    assert 400 <= histogram.percentile(50) <= 600
+    assert 900 <= histogram.percentile(99) <= 1000
+    assert histogram.percentile(100) == 1000
+
+    system = make_system(tmp_path, monkeypatch)
+    system.execute_command('echo untracked')
+    system.execute_command('stats on')
+    system.execute_command('echo a')
+    system.execute_command('type missing.txt')
+    system.execute_command('stats json stats.json')
+
+    import json
+    data = json.loads((tmp_path / 'stats.json').read_text(encoding='utf-8'))
+    assert data['commands']['echo']['wall']['count'] == 1
+    assert data['commands']['type']['failures'] == 1
+    assert data['commands']['echo']['approximate'] == 0
+
+    # 只有空闲线程 (如定时落盘的 Timer) 时不算并发: 命令自己线程池中的 CPU 也计入
+    import threading
+    import main
+    from concurrent.futures import ThreadPoolExecutor
+    system.user_data.incr('commands_used')
+    idle = ThreadPoolExecutor(max_workers=1)
+    idle.submit(int).result()
+    sample = main.ResourceSample()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        list(pool.map(lambda n: sum(range(n)), [2000000] * 2))
+    wall, cpu, read, written = sample.finish()
+    assert not sample.shared and cpu > wall / 2
+    idle.shutdown()
+    (tmp_path / 'w1.txt').write_text('a b\n' * 1000)
+    (tmp_path / 'w2.txt').write_text('c\n' * 1000)
+    capsys.readouterr()
+    system.execute_command('time wc -j 2 w1.txt w2.txt')
+    assert '≈' not in capsys.readouterr().out
+
+    # 有其他后台任务或会话中的命令同时运行时, CPU 只计本线程, 读写标为近似值
+    release = threading.Event()
+    entered = threading.Event()
+
+    def other_work():
+        with main.concurrent_work():
+            entered.set()
+            release.wait()
+
+    worker = threading.Thread(target=other_work)
+    worker.start()
+    entered.wait()
+    try:
+        sample = main.ResourceSample()
+        busy = threading.Thread(target=lambda: sum(range(3000000)))
+        busy.start()
+        busy.join()
+        wall, cpu, read, written = sample.finish()
+        assert sample.shared and cpu < wall / 2
+        system.execute_command('echo b')
+        capsys.readouterr()
+        system.execute_command('time echo c')
+        assert '≈' in capsys.readouterr().out
+    finally:
+        release.set()
+        worker.join()
+    system.execute_command('stats')
+    assert 'echo*' in capsys.readouterr().out
+    assert main.concurrent_work.running == 0
+
+
+def test_user_data_journal_survives_crash(tmp_path):
+    """测试计数先写入日志, 未正常退出时重新加载可从日志恢复"""
+    from main import UserDataStore
+    path = str(tmp_path / 'user_data.json')
+
+    store = UserDataStore(path, {'commands_used': 0})
+    for _ in range(UserDataStore.FLUSH_EVERY + 3):
+        store.incr('commands_used')
+    store['username'] = 'Alice'
+    # 模拟崩溃: 只有达到批量阈值的记录已落盘
+    reloaded = UserDataStore(path, {'commands_used': 0})
+    reloaded.load()
+    assert reloaded['commands_used'] == UserDataStore.FLUSH_EVERY
+
+    store.flush()
+    store.compact()
+    # 快照已包含全部记录, 残留的旧日志不应被重复累加
+    with open(path + '.journal', 'a', encoding='utf-8') as f:
+        f.write('[1, "incr", "commands_used", 1]\n')
+    reloaded = UserDataStore(path, {'commands_used': 0})
+    reloaded.load()
+    assert reloaded['commands_used'] == UserDataStore.FLUSH_EVERY + 3
+    assert reloaded['username'] == 'Alice'
+
+
+def test_history_search_and_recall(tmp_path, monkeypatch, capsys):
+    """测试历史记录跨会话保存、搜索排序和 !n / !前缀 展开"""
+    from main import HistoryStore
+    path = str(tmp_path / 'state' / 'history.db')
+    store = HistoryStore(path)
+    for command in ['dir logs', 'grep ERROR app.log', 'dir', 'grep ERROR app.log', 'echo hi']:
+        store.append(command)
+
+    reopened = HistoryStore(path)
+    assert [c for _, c in reopened.last(2)] == ['grep ERROR app.log', 'echo hi']
+    assert reopened.search('error')[0][:2] == ('grep ERROR app.log', 2)
+    assert [c for c, _, _ in reopened.search('di')] == ['dir', 'dir logs']
+    assert reopened.top(1) == [('grep ERROR app.log', 2)]
+    assert reopened.expand('!1') == 'dir logs'
+    assert reopened.expand('!di') == 'dir'
+    assert reopened.expand('!!') == 'echo hi'
+    assert reopened.expand('!nothing') is None
+
+    monkeypatch.setenv('SUPERSIM_HOME', str(tmp_path / 'home'))
+    system = make_system(tmp_path, monkeypatch)
+    capsys.readouterr()
+    for command in ('history top abc', 'history abc', 'history top 1 2'):
+        assert system.execute_command(command) == 2
+        assert '用法' in capsys.readouterr().out
+    assert system.execute_command('history top 3') == 0
+
+
+def test_sessions_have_independent_directories(tmp_path, monkeypatch):
+    """测试 cd 只修改会话自己的虚拟工作目录"""
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    (tmp_path / 'b' / 'note.txt').write_text('in b\n', encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+    first = SuperCommandLineSystem(current_dir=str(tmp_path))
+    second = SuperCommandLineSystem(current_dir=str(tmp_path))
+
+    first.execute_command('cd a')
+    second.execute_command('cd b')
+    assert first.current_dir == str(tmp_path / 'a')
+    assert second.execute_command('type note.txt') == 0
+    assert first.execute_command('type note.txt') == 1
+    assert os.getcwd() == str(tmp_path)
+    assert first.execute_command('cd missing') == 1
+
+
+def test_daemon_serves_sessions(tmp_path, monkeypatch):
+    """测试守护进程通过 Unix 套接字执行命令, 每个连接是独立的会话"""
+    import socket
+    import threading
+    import time
+    import pytest
+    if not hasattr(socket, 'AF_UNIX'):
+        pytest.skip("需要 Unix 套接字")
+    import json
+    import client
+    from main import serve_daemon
+
+    monkeypatch.setattr('sys.stdin', sys.stdin)
+    socket_path = str(tmp_path / 'd.sock')
+    (tmp_path / 'sub').mkdir()
+    server = threading.Thread(target=serve_daemon, args=(socket_path,), daemon=True)
+    server.start()
+    for _ in range(100):
+        try:
+            client.DaemonClient(socket_path).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+
+    first = client.DaemonClient(socket_path)
+    first.cwd = str(tmp_path)
+    second = client.DaemonClient(socket_path)
+    second.cwd = str(tmp_path)
+    assert first.request({'cmd': 'cd sub && pwd', 'cwd': first.cwd})['cwd'] == str(tmp_path / 'sub')
+    response = second.request({'cmd': 'pwd', 'cwd': second.cwd})
+    assert response['cwd'] == str(tmp_path) and response['status'] == 0
+    assert second.request({'cmd': 'type nope.txt'})['status'] == 1
+    first.close()
+    second.close()
+
+    # 超长的请求行: 返回状态码 2 并关闭连接, 守护进程继续服务其他会话
+    import main
+    oversized = client.DaemonClient(socket_path)
+    sender = threading.Thread(target=lambda: oversized.sock.sendall(b'x' * (main.DAEMON_LINE_LIMIT * 2) + b'\n'))
+    sender.daemon = True
+    sender.start()
+    response = json.loads(oversized.reader.readline())
+    assert response['status'] == 2 and not response['running']
+    assert oversized.reader.readline() == b''
+    oversized.close()
+    third = client.DaemonClient(socket_path)
+    assert third.request({'cmd': 'pwd', 'cwd': str(tmp_path)})['status'] == 0
+    third.close()
+
+    stopper = client.DaemonClient(socket_path)
+    assert stopper.request({'op': 'shutdown'})['status'] == 0
+    stopper.close()
+    server.join(5)
+    assert not os.path.exists(socket_path)
+
+
+def test_bench_suite_and_baseline(tmp_path, monkeypatch):
+    """测试基准套件在夹具上运行用例, 受控用例变慢时报告退化"""
+    import benchmark
+    monkeypatch.chdir(tmp_path)
+    root = str(tmp_path / 'fixtures')
+    params = dict(benchmark.SCALES['small'], text_mb=1, small_files=20, tree_depth=2)
+    benchmark.make_fixtures(root, 'small', params)
+    results = benchmark.run_suite(root, ['dir', 'grep', 'zip'], repeat=1)
+
+    assert sorted(results) == ['dir', 'grep', 'zip']
+    assert all(result['status'] == 0 and result['runs'] == 1 for result in results.values())
+    assert not os.listdir(os.path.join(root, 'scratch'))
+
+    baseline = {name: dict(result) for name, result in results.items()}
+    assert benchmark.compare(results, baseline) == []
+    baseline['grep']['median_ms'] = results['grep']['median_ms'] / 10 - benchmark.MIN_REGRESSION_MS
+    baseline['wc'] = {'median_ms': 0.001}
+    assert [name for name, _, _ in benchmark.compare(results, baseline)] == ['grep']
+
+
+def test_dir_sort_filter_and_pages(tmp_path, monkeypatch, capsys):
+    """测试 dir 的排序、通配符过滤和分页"""
+    system = make_system(tmp_path, monkeypatch)
+    (tmp_path / 'sub').mkdir()
+    for name, size in [('b.log', 30), ('a.log', 10), ('c.txt', 20)]:
+        (tmp_path / name).write_bytes(b'x' * size)
+
+    def listed(command):
+        capsys.readouterr()
+        assert system.execute_command(command) == 0
+        return [line.split()[1] for line in capsys.readouterr().out.splitlines()
+                if line.startswith('  📄') or line.startswith('  📁')]
+
+    assert listed('dir') == ['sub/', 'a.log', 'b.log', 'c.txt']
+    assert listed('dir -s') == ['sub/', 'b.log', 'c.txt', 'a.log']
+    assert listed('dir *.log -r') == ['b.log', 'a.log']
+    assert listed('dir . * --limit 2 --page 2') == ['b.log', 'c.txt']
+    assert sorted(listed('dir --stream --limit 10')) == ['a.log', 'b.log', 'c.txt', 'sub/']
+    assert system.execute_command('dir --stream -s') == 2
+
+
+def test_tree_limits_and_order(tmp_path, monkeypatch, capsys):
+    """测试 tree 的层数、条目上限和只显示目录, 并发扫描时输出顺序不变"""
+    for path in ['a/x/deep', 'a/y', 'b', 'c/z']:
+        (tmp_path / 'root' / path).mkdir(parents=True)
+    (tmp_path / 'root' / 'a' / 'x' / 'f.txt').write_text('12345', encoding='utf-8')
+    (tmp_path / 'root' / 'top.txt').write_text('', encoding='utf-8')
+    system = make_system(tmp_path, monkeypatch)
+
+    def lines(command):
+        capsys.readouterr()
+        system.execute_command(command)
+        return capsys.readouterr().out.splitlines()[1:-2]
+
+    full = lines('tree root -s')
+    assert [line.rsplit('── ', 1)[1][2:] for line in full] == \
+        ['a/', 'x/', 'deep/', 'f.txt (5 B)', 'y/', 'b/', 'c/', 'z/', 'top.txt (0 B)']
+    assert lines('tree root --depth 1') == ['├── 📁 a/', '├── 📁 b/', '├── 📁 c/', '└── 📄 top.txt']
+    assert lines('tree root --dirs-only --max-entries 3') == lines('tree root -d')[:3]
+    assert lines('tree root -d --depth 2')[-1] == '    └── 📁 z/'
+
+
+def test_disk_usage_dedupes_links_and_caches(tmp_path):
+    """测试 size 引擎对硬链接只计一次, 并只重新扫描 mtime 变化的目录"""
+    from main import SizeCache, disk_usage
+    root = tmp_path / 'data'
+    (root / 'a' / 'b').mkdir(parents=True)
+    (root / 'c').mkdir()
+    (root / 'a' / 'big.bin').write_bytes(b'x' * 5000)
+    os.link(root / 'a' / 'big.bin', root / 'c' / 'same.bin')
+    (root / 'a' / 'b' / 'small.txt').write_bytes(b'y' * 10)
+    for path in [root / 'a' / 'b', root / 'a', root / 'c', root]:
+        os.utime(path, (1e9, 1e9))
+    cache = SizeCache(str(tmp_path / 'state' / 'size.db'))
+
+    usage = disk_usage(str(root), cache)
+    assert (usage['apparent'], usage['files'], usage['dirs'], usage['scanned']) == (5010, 3, 3, 4)
+    assert usage['allocated'] >= 0
+
+    again = disk_usage(str(root), SizeCache(cache.path))
+    assert (again['apparent'], again['scanned']) == (5010, 0)
+
+    (root / 'c' / 'new.txt').write_bytes(b'z' * 7)
+    changed = disk_usage(str(root), cache)
+    assert (changed['apparent'], changed['files'], changed['scanned']) == (5017, 4, 1)
+    # 刚修改过的目录不写入缓存, 下次仍会重新扫描
+    assert disk_usage(str(root), cache)['scanned'] == 1
+
+
+def test_largest_files_and_directories(tmp_path, monkeypatch, capsys):
+    """测试 largest 汇总目录大小并只保留前 N 项, --exclude 跳过匹配的条目"""
+    for path, size in [('a/b/f1', 5000), ('a/f2', 3000), ('c/f3', 4000), ('cache/huge', 90000)]:
+        (tmp_path / 'root' / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / 'root' / path).write_bytes(b'x' * size)
+    system = make_system(tmp_path, monkeypatch)
+
+    assert system.execute_command('largest root 2 --exclude cache') == 0
+    out = capsys.readouterr().out
+    files, dirs = [[line.split()[-1] for line in part.splitlines() if line.startswith('  ')]
+                   for part in out.split('📁')]
+    assert files == ['a/b/f1', 'c/f3']
+    assert dirs == ['a/', 'a/b/']
+    assert '11.7 KB' in out
+    # 相对路径模式: 逐层拼出的相对路径与 os.path.relpath 相同
+    assert system.execute_command('largest root 5 --exclude cache --exclude a/b') == 0
+    out = capsys.readouterr().out
+    assert 'f1' not in out and 'a/f2' in out and '6.8 KB' in out
+    assert system.execute_command('largest root 0') == 2
+
+
+def test_fs_index_build_refresh_and_queries(tmp_path, monkeypatch):
+    """测试元数据索引: 建立后 find/size 从索引回答, 刷新只处理变化的目录"""
+    from main import FsIndex
+    root = tmp_path / 'data'
+    (root / 'a' / 'b').mkdir(parents=True)
+    (root / 'c').mkdir()
+    (root / 'a' / 'b' / 'report.txt').write_bytes(b'x' * 6)
+    (root / 'c' / 'Report-old.log').write_bytes(b'y' * 2)
+    for path in [root / 'a' / 'b', root / 'a', root / 'c', root]:
+        os.utime(path, (1e9, 1e9))
+    index = FsIndex(str(tmp_path / 'state' / 'index.db'))
+
+    assert index.build(str(root)) == [8, index.lookup(str(root))[2], 2, 3]
+    assert index.find(str(root), 'report') == [str(root / 'a' / 'b' / 'report.txt'),
+                                               str(root / 'c' / 'Report-old.log')]
+    assert index.find(str(root / 'a'), 're') == [str(root / 'a' / 'b' / 'report.txt')]
+    assert index.changed_dirs(str(root)) == 0
+
+    import shutil
+    shutil.rmtree(root / 'c')
+    (root / 'd').mkdir()
+    (root / 'd' / 'report2.txt').write_bytes(b'z' * 5)
+    assert index.refresh(str(root)) == {'checked': 4, 'rescanned': 1, 'removed': 1, 'skipped': 0}
+    assert index.lookup(str(root))[1:] == (11, index.lookup(str(root))[2], 2, 3)
+    assert [name for name, *_ in index.children(str(root))[0]] == ['a', 'd']
+    assert index.find(str(root), 'report')[-1] == str(root / 'd' / 'report2.txt')
+
+    # 删除的目录与名称排在其子目录之前的兄弟目录 (d、d-x、d/sub): 子树不会被重复访问和删除
+    (root / 'd' / 'sub' / 'deep').mkdir(parents=True)
+    (root / 'd-x').mkdir()
+    index.build(str(root))
+    shutil.rmtree(root / 'd')
+    shutil.rmtree(root / 'd-x')
+    assert index.refresh(str(root))['removed'] == 2
+    assert [name for name, *_ in index.children(str(root))[0]] == ['a']
+    (root / 'd').mkdir()
+    (root / 'd' / 'report2.txt').write_bytes(b'z' * 5)
+
+    # 不是有效 UTF-8 的文件名无法存入索引: 计数后在汇总中报告, 而不是悄悄丢弃
+    bad = os.path.join(os.fsencode(str(root / 'd')), b'bad-\xff.txt')
+    try:
+        open(bad, 'wb').close()
+    except OSError:
+        return
+    assert index.refresh(str(root))['skipped'] == 1
+    stats = {}
+    assert index.build(str(root), stats=stats)[2] == 2 and stats == {'skipped': 1}
+
+    monkeypatch.setenv('SUPERSIM_HOME', str(tmp_path / 'home'))
+    system = make_system(tmp_path, monkeypatch)
+    system.execute_command('index build data')
+    (root / 'a' / 'late.txt').write_bytes(b'')
+    assert system.execute_command('find data late') == 0
+    assert system._fs_index().find(str(root), 'late') == []
+
+
+def test_copy_tree_skips_unchanged_and_resumes(tmp_path, monkeypatch, capsys):
+    """测试并行复制: 未变化的文件跳过, 中断留下的 .part 文件续传"""
+    from main import copy_tree
+    src = tmp_path / 'src'
+    (src / 'sub').mkdir(parents=True)
+    for i in range(20):
+        (src / f'f{i}.txt').write_text(f'file {i}\n')
+    data = os.urandom(300000)
+    (src / 'sub' / 'big.bin').write_bytes(data)
+    os.utime(src / 'sub' / 'big.bin', (1e9, 1e9))
+    dst = tmp_path / 'dst'
+
+    stats = copy_tree(str(src), str(dst), workers=4)
+    assert (stats['files'], stats['copied'], stats['failed']) == (21, 21, 0)
+    assert (dst / 'sub' / 'big.bin').read_bytes() == data
+    assert os.stat(dst / 'sub' / 'big.bin').st_mtime == 1e9
+
+    (src / 'f3.txt').write_text('changed\n')
+    os.utime(src / 'f3.txt', (2e9, 2e9))
+    stats = copy_tree(str(src), str(dst))
+    assert (stats['copied'], stats['skipped']) == (1, 20)
+    assert (dst / 'f3.txt').read_text() == 'changed\n'
+
+    # 模拟中断: 只写了前一部分的 .part 文件
+    os.remove(dst / 'sub' / 'big.bin')
+    (dst / 'sub' / 'big.bin.part').write_bytes(data[:100000])
+    stats = copy_tree(str(src), str(dst))
+    assert (stats['resumed'], stats['written']) == (1, 200000)
+    assert (dst / 'sub' / 'big.bin').read_bytes() == data
+    assert not (dst / 'sub' / 'big.bin.part').exists()
+
+    system = make_system(tmp_path, monkeypatch)
+    assert system.execute_command('copy --hash src dst') == 0
+    assert '跳过 21 个未变化的文件' in capsys.readouterr().out
+    assert system.execute_command('copy src src/inner') == 1
+
+
+def test_delete_tree_dry_run_and_parallel_delete(tmp_path, monkeypatch, capsys):
+    """测试并行删除: --dry-run 只统计, 删除时不跟随指向目录的符号链接"""
+    import main
+    monkeypatch.setattr(main, 'DELETE_BATCH', 7)
+    root = tmp_path / 'junk'
+    for d in range(3):
+        (root / f'd{d}' / 'sub').mkdir(parents=True)
+        for i in range(20):
+            (root / f'd{d}' / 'sub' / f'f{i}').write_bytes(b'x' * 10)
+    keep = tmp_path / 'keep'
+    keep.mkdir()
+    (keep / 'important').write_text('keep')
+    os.symlink(keep, root / 'link')
+
+    stats = main.delete_tree(str(root), dry_run=True, workers=3)
+    assert (stats['files'], stats['dirs'], stats['bytes']) == (61, 6, 600 + len(str(keep)))
+    assert (root / 'd1' / 'sub' / 'f5').exists()
+
+    system = make_system(tmp_path, monkeypatch)
+    assert system.execute_command('del --dry-run junk') == 0
+    assert '61 个文件, 6 个子目录' in capsys.readouterr().out
+    assert system.execute_command('del -j 3 junk') == 0
+    assert not root.exists()
+    assert (keep / 'important').read_text() == 'keep'
+
+
+def test_type_line_index_hex_and_tolerant_decoding(tmp_path, monkeypatch, capsys):
+    """测试 type: 稀疏行索引跳转、二进制文件十六进制显示、非 UTF-8 内容替换显示"""
+    from main import LineIndex
+    monkeypatch.setattr(LineIndex, 'STEP', 64)
+    monkeypatch.setenv('SUPERSIM_HOME', str(tmp_path / 'home'))
+    lines = [f"line {i} " + 'x' * (i % 17) for i in range(1, 1001)]
+    path = tmp_path / 'app.log'
+    path.write_text('\n'.join(lines) + '\n')
+
+    index = LineIndex.open(str(path))
+    with open(path, 'rb') as f:
+        assert index.seek_line(f, 1) == 0
+        offset = index.seek_line(f, 500)
+        f.seek(offset)
+        assert f.readline().decode().rstrip() == lines[499]
+        assert index.line_at(f, offset + 3) == 500
+        assert index.seek_line(f, 1001) is None
+        assert index.line_count(f) == 1000
+    assert LineIndex.open(str(path)) is index
+
+    system = make_system(tmp_path, monkeypatch)
+    capsys.readouterr()
+    assert system.execute_command('type --line 998 -n 2 app.log') == 0
+    assert capsys.readouterr().out.splitlines()[2:] == lines[997:999]
+    assert system.execute_command('type --line 2000 app.log') == 1
+    # 以 0 开头的行数按十进制解析; 只有 --offset 接受 0x 十六进制
+    capsys.readouterr()
+    assert system.execute_command('type --line 010 -n 02 app.log') == 0
+    assert capsys.readouterr().out.splitlines()[2:] == lines[9:11]
+    offset = len(lines[0]) + 1
+    assert system.execute_command(f'type --offset {hex(offset)} -n 1 app.log') == 0
+    assert lines[1] in capsys.readouterr().out
+    assert system.execute_command('type --line 0x10 app.log') == 2
+
+    (tmp_path / 'latin.txt').write_bytes(b'caf\xe9\nok')
+    (tmp_path / 'blob.bin').write_bytes(b'AB\x00\x01' * 5)
+    capsys.readouterr()
+    assert system.execute_command('type latin.txt') == 0
+    assert capsys.readouterr().out.splitlines()[2:] == ['caf�', 'ok']
+    assert system.execute_command('type blob.bin') == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[1] == '00000000  41 42 00 01 41 42 00 01  41 42 00 01 41 42 00 01  |AB..AB..AB..AB..|'
+    assert out[2].startswith('00000010  41 42 00 01')
+
+
+def test_tail_reads_from_end_and_follows_rotation(tmp_path, monkeypatch, capsys):
+    """测试 tail: 从末尾按块向前定位; -f 跟踪增长、截断和轮转"""
+    from main import TailFollower, _tail_offset
+    path = tmp_path / 'app.log'
+    path.write_bytes(b''.join(b'line %d\n' % i for i in range(1, 1001)))
+    with open(path, 'rb') as f:
+        for count in (1, 3, 999, 1000, 5000):
+            f.seek(_tail_offset(f, count, block=16))
+            assert f.read().splitlines() == [b'line %d' % i for i in range(max(1, 1001 - count), 1001)]
+
+    system = make_system(tmp_path, monkeypatch)
+    capsys.readouterr()
+    assert system.execute_command('tail app.log 2') == 0
+    assert capsys.readouterr().out.splitlines()[2:] == ['line 999', 'line 1000']
+
+    follower = TailFollower([str(path)], [path.stat().st_size])
+    try:
+        assert list(follower.poll()) == []
+        with open(path, 'a') as f:
+            f.write('new 1\n')
+        assert list(follower.poll()) == [(str(path), 'new 1\n', False)]
+        path.write_text('x\n')
+        assert [text for _, text, _ in follower.poll()] == ['文件被截断, 从头读取', 'x\n']
+        os.rename(path, tmp_path / 'app.log.1')
+        with open(tmp_path / 'app.log.1', 'a') as f:
+            f.write('last words\n')
+        path.write_text('fresh\n')
+        assert [text for _, text, _ in follower.poll()] == ['last words\n', '文件已被轮转, 跟踪新文件', 'fresh\n']
+    finally:
+        follower.close()
+
+
+def test_grep_recursive_regex_context_and_mmap(tmp_path, monkeypatch, capsys):
+    """测试 grep: 递归搜索、正则/整词/大小写选项、上下文、计数, 以及 mmap 路径与整体读入结果一致"""
+    import main
+    src = tmp_path / 'src'
+    (src / 'pkg').mkdir(parents=True)
+    (src / '.git').mkdir()
+    (src / 'pkg' / 'a.py').write_text('import os\nraise Error("x")\nerrors = 1\npass\n')
+    (src / 'pkg' / 'b.txt').write_text('no Error here\n')
+    (src / 'notes.py').write_text('ERROR\nfine\n')
+    (src / '.git' / 'config').write_text('error\n')
+    (src / 'blob.py').write_bytes(b'\0error')
+
+    system = make_system(tmp_path, monkeypatch)
+    capsys.readouterr()
+    assert system.execute_command('grep -w error src --include *.py') == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out == [f'  {os.path.join("src", "notes.py")}:1: ERROR',
+                   f'  {os.path.join("src", "pkg", "a.py")}:2: raise Error("x")',
+                   '📊 找到 2 个匹配, 分布在 2 个文件中 (跳过 1 个二进制文件)']
+    assert system.execute_command('grep -c -s Error src --exclude b.txt') == 0
+    assert capsys.readouterr().out.splitlines()[0] == f'  {os.path.join("src", "pkg", "a.py")}: 1'
+    assert system.execute_command('grep -C 1 ^err src/pkg/a.py') == 0
+    assert capsys.readouterr().out.splitlines()[2:-1] == ['    2- raise Error("x")', '    3: errors = 1',
+                                                          '    4- pass']
+    assert system.execute_command('grep ( src') == 2
+    assert system.execute_command('type src/pkg/a.py | grep -s ^err') == 0
+    assert capsys.readouterr().out.splitlines()[-1] == 'errors = 1'
+
+    lines = [f"{i} {'Error' if i % 7 == 0 else 'ok'} {'x' * (i % 50)}" for i in range(2000)]
+    (tmp_path / 'big.log').write_text('\n'.join(lines))
+    matcher = main._GrepMatcher('error')
+    expected = main.grep_file(str(tmp_path / 'big.log'), matcher, 2, 1)
+    assert expected[0] == len([line for line in lines if 'Error' in line])
+    monkeypatch.setattr(main, 'GREP_MMAP_MIN', 0)
+    monkeypatch.setattr(main._GrepMatcher, 'BLOCK', 1000)
+    assert main.grep_file(str(tmp_path / 'big.log'), matcher, 2, 1) == expected
+
+
+def test_grep_content_index_incremental(tmp_path, monkeypatch, capsys):
+    """测试 index grep: 内容索引增量更新 (只读取变化的文件), grep --indexed 筛选候选文件后结果与全量搜索一致"""
+    import main
+    monkeypatch.setenv('SUPERSIM_HOME', str(tmp_path / 'home'))
+    src = tmp_path / 'src'
+    (src / 'pkg').mkdir(parents=True)
+    (src / 'pkg' / 'a.py').write_text('def parse_header(line):\n    return line\n')
+    (src / 'pkg' / 'b.py').write_text('HEADER = 1\n')
+    (src / 'c.txt').write_text('nothing\n' * 300 + ''.join(f'row {i}\n' for i in range(300)))
+
+    system = make_system(tmp_path, monkeypatch)
+    assert system.execute_command('index grep src') == 0
+    index = main.GrepIndex.locate(str(src / 'pkg'))
+    assert [name for name, _, _ in index.files] == ['c.txt', os.path.join('pkg', 'a.py'),
+                                                    os.path.join('pkg', 'b.py')]
+    assert index.candidates(main._pattern_trigrams(r'parse_(head|body)')) == [1]
+    assert index.candidates(main._pattern_trigrams('row 29\\d')) == [0]
+    assert main._pattern_trigrams('a|header') == set()
+    index.close()
+
+    (src / 'pkg' / 'b.py').write_text('def parse_header():\n    pass\n')
+    (src / 'pkg' / 'new.py').write_text('x = "PARSE_HEADER"\n')
+    os.remove(src / 'pkg' / 'a.py')
+    stats = main.GrepIndex.locate(str(src)).update()
+    assert (stats['files'], stats['read'], stats['removed']) == (3, 2, 1)
+
+    capsys.readouterr()
+    assert system.execute_command('grep parse_header src') == 0
+    full = capsys.readouterr().out.splitlines()
+    assert system.execute_command('grep --indexed parse_header src') == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[0].startswith('⚡ 内容索引筛出 2/3 个文件')
+    assert sorted(out[1:]) == sorted(full)
+    (tmp_path / 'other').mkdir()
+    assert system.execute_command('grep --indexed x other') == 1
+
+
+def test_sort_external_merge_and_options(tmp_path, monkeypatch, capsys):
+    """测试 sort: 超过内存预算时分段外部归并 (含多级归并), 结果与内存排序一致; -n/-r/-k/-t/-u/-s 选项"""
+    import main
+    import random
+    rng = random.Random(7)
+    rows = [f'{rng.randint(-500, 500)},k{rng.randint(0, 40)},{i}' for i in range(20000)]
+    (tmp_path / 'rows.txt').write_text('\n'.join(rows) + '\n')
+    monkeypatch.setattr(main, 'SORT_FANIN', 4)
+
+    system = make_system(tmp_path, monkeypatch)
+    assert system.execute_command('sort -n -t, -k1 -S 256K -j 1 -o out.txt rows.txt') == 0
+    assert (tmp_path / 'out.txt').read_text().splitlines() == \
+        sorted(rows, key=lambda row: (int(row.split(',')[0]), row))
+    assert 'out.txt' in capsys.readouterr().out
+
+    options = system._parse_sort_args(['-rsu', '-t,', '-k2'])[0]
+    stats = {}
+    result = list(main.external_sort([str(tmp_path / 'rows.txt')], options, memory=256 * 1024,
+                                     workers=1, stats=stats))
+    assert stats['runs'] > main.SORT_FANIN
+    first = {}
+    for row in rows:
+        first.setdefault(row.split(',')[1], row)
+    assert [line.decode() for line in result] == [first[key] for key in sorted(first, reverse=True)]
+    # 多进程分段排序 (子进程不由 fork 启动) 的结果与单进程相同
+    assert list(main.external_sort([str(tmp_path / 'rows.txt')], options, memory=256 * 1024, workers=2)) == result
+
+    (tmp_path / 'a.txt').write_text('b\n10\n9')
+    (tmp_path / 'b.txt').write_text('a\n')
+    assert system.execute_command('sort -n a.txt b.txt') == 0
+    assert capsys.readouterr().out.splitlines()[2:] == ['a', 'b', '9', '10']
+    assert system.execute_command('type a.txt | sort -r | head 1') == 0
+    assert capsys.readouterr().out.splitlines() == ['b']
+    assert system.execute_command('sort -k0 a.txt') == 2
+
+    # -n 只认开头的十进制数: nan、inf、1_0 这类 float() 能解析的写法不算数值 (nan 会破坏排序)
+    options = system._parse_sort_args(['-n'])[0]
+    lines = [b'2', b'nan', b'-1', b'inf', b'1_0', b'NaN', b'3', b'-infinity', b'0.5']
+    assert list(main.external_sort([], options, lines=iter(lines))) == \
+        [b'-1', b'-infinity', b'NaN', b'inf', b'nan', b'0.5', b'1_0', b'2', b'3']
+
+
+def test_uniq_counts_adjacent_and_spill(tmp_path, monkeypatch, capsys):
+    """测试 uniq: -c/-d/-u 与 -a 相邻模式; 超过内存预算时按哈希分区溢出, 输出仍按首次出现的顺序"""
+    import collections
+    import main
+    import random
+    rng = random.Random(5)
+    rows = [f"{'x' * rng.randint(0, 40)}{rng.randint(0, 3000)}".encode() for _ in range(20000)]
+    totals = collections.Counter(rows)
+    for counts, rereadable in ((False, True), (True, True), (True, False)):
+        stats = {}
+        result = list(main.unique_lines(lambda: iter(rows), counts, rereadable, 20000, stats))
+        assert stats['spilled'] > 0
+        expected = list(dict.fromkeys(rows))
+        assert [line for line, _ in result] == expected
+        if counts:
+            assert [count for _, count in result] == [totals[line] for line in expected]
+
+    # 分区的不同摘要数超过预算: 按摘要的下一个字节递归重新分区, 结果不变
+    monkeypatch.setattr(main, 'UNIQ_PARTITIONS', 2)
+    for counts, rereadable in ((False, False), (True, True), (True, False)):
+        stats = {}
+        result = list(main.unique_lines(lambda: iter(rows), counts, rereadable, 20000, stats))
+        assert stats['repartitioned'] > 0
+        assert [line for line, _ in result] == expected
+        if counts:
+            assert [count for _, count in result] == [totals[line] for line in expected]
+
+    (tmp_path / 'a.txt').write_text('b\nb\na\r\nb\nc\n')
+    system = make_system(tmp_path, monkeypatch)
+    capsys.readouterr()
+    assert system.execute_command('uniq -c a.txt') == 0
+    assert capsys.readouterr().out.splitlines()[2:] == ['      3 b', '      1 a', '      1 c',
+                                                         '📊 原始行数: 5, 去重后: 3']
+    assert system.execute_command('uniq -u a.txt') == 0
+    assert capsys.readouterr().out.splitlines()[2:4] == ['a', 'c']
+    assert system.execute_command('uniq -ad a.txt') == 0
+    assert capsys.readouterr().out.splitlines()[2:] == ['b', '📊 去重后: 1']
+    assert system.execute_command('type a.txt | uniq -a -c') == 0
+    assert capsys.readouterr().out.splitlines() == ['      2 b', '      1 a', '      1 b', '      1 c']
+
+
+def test_freq_sketches_fields_and_merge(tmp_path, monkeypatch, capsys):
+    """测试 freq: Space-Saving 高频值在小容量下仍排在前列, HyperLogLog 误差在范围内, 字段提取与状态合并"""
+    import collections
+    import main
+    import random
+    rng = random.Random(11)
+    values = [f'u{min(int(rng.paretovariate(1.2)), 5000)}' for _ in range(30000)] + \
+        [f'x{i}' for i in range(8000)]
+    rng.shuffle(values)
+    exact = collections.Counter(values)
+    summary, distinct = main.SpaceSaving(50), main.HyperLogLog()
+    for start in range(0, len(values), 1000):
+        batch = collections.Counter(value.encode() for value in values[start:start + 1000])
+        summary.update(batch)
+        distinct.update(batch)
+    for value, count, error in summary.top(5):
+        assert count - error <= exact[value.decode()] <= count
+    assert [value.decode() for value, _, _ in summary.top(3)] == [v for v, _ in exact.most_common(3)]
+    assert abs(distinct.count() - len(exact)) < 0.04 * len(exact)
+
+    (tmp_path / 'a.log').write_text('GET /a 200\nGET /b 404\nPOST /a 200\n')
+    (tmp_path / 'b.log').write_text('GET /a 500\n')
+    system = make_system(tmp_path, monkeypatch)
+    capsys.readouterr()
+    assert system.execute_command('freq -f 2 --save a.json a.log') == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[0].startswith('📊 共 3 个值, 约 2 个不同值')
+    assert out[2].split() == ['2', '66.7%', '/a']
+    assert system.execute_command('freq -e \\s(\\d+)$ -k 1 --load a.json b.log') == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[0].startswith('📊 共 4 个值, 约 3 个不同值')
+    assert out[2].split() == ['2', '50.0%', '/a']
+    assert system.execute_command('type a.log | freq -f 3 -k 1') == 0
+    assert capsys.readouterr().out.splitlines()[-1].split() == ['2', '66.7%', '200']
+
+
+def test_wc_chunked_multi_file_totals(tmp_path, monkeypatch, capsys):
+    """测试 wc: 分块统计与整体读入结果一致 (跨块的单词和 UTF-8 字符不重复计数), 通配符、合计行与 -l"""
+    import main
+    import random
+    rng = random.Random(3)
+    text = ''.join(rng.choice(['ab', ' ', '\n', 'é', '\t', '中文']) for _ in range(5000)) + 'end'
+    (tmp_path / 'a.txt').write_text(text, encoding='utf-8')
+    (tmp_path / 'b.txt').write_text('one two\n', encoding='utf-8')
+    monkeypatch.setattr(main, 'WC_CHUNK', 7)
+    expected = {'lines': len(text.splitlines()), 'words': len(text.split()), 'chars': len(text),
+                'bytes': len(text.encode('utf-8'))}
+    assert main.wc_file(str(tmp_path / 'a.txt')) == expected
+
+    system = make_system(tmp_path, monkeypatch)
+    capsys.readouterr()
+    assert system.execute_command('wc *.txt') == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[1].split() == [str(expected[key]) for key in ('lines', 'words', 'chars', 'bytes')] + ['a.txt']
+    assert out[3].split() == [str(expected['lines'] + 1), str(expected['words'] + 2),
+                              str(expected['chars'] + 8), str(expected['bytes'] + 8), '总计']
+    assert system.execute_command('wc -l b.txt') == 0
+    assert capsys.readouterr().out.splitlines() == ['📄 b.txt: 1 行']
+    assert system.execute_command('wc b.txt missing.txt') == 1
+
+    # 当前目录路径本身含有 [ ] 时, 只有参数中的通配符生效
+    odd = tmp_path / 'logs[1]'
+    odd.mkdir()
+    (odd / 'x.txt').write_text('a b\n', encoding='utf-8')
+    (odd / 'y.txt').write_text('c\n', encoding='utf-8')
+    assert system.execute_command('cd logs[1]') == 0
+    capsys.readouterr()
+    assert system.execute_command('wc *.txt') == 0
+    assert [line.split()[-1] for line in capsys.readouterr().out.splitlines()[1:]] == ['x.txt', 'y.txt', '总计']
+
+
+def test_grep_regex_matches_stay_within_lines():
+    """测试 grep: 能匹配换行符的正则 (\\s、[^…]) 不会跨行匹配, 结果与逐行匹配一致"""
+    import re
+    import main
+    data = b'xa\nyy\nfoo bar\nab\ncd\n'
+    assert main._grep_buffer(data, main._GrepMatcher(r'\s+yy')) == (0, [])
+    assert main._grep_buffer(data, main._GrepMatcher(r'b[^x]c')) == (0, [])
+    assert main._grep_buffer(data, main._GrepMatcher(r'a\s*$')) == (1, [(1, True, 'xa')])
+    assert main._grep_buffer(data, main._GrepMatcher(r'o\sb')) == (1, [(3, True, 'foo bar')])
+    for pattern in (r'\s+yy', r'[^z]+', r'a\W', r'a\s+', r'\s'):
+        expected = [line for line in data.decode().splitlines() if re.search(pattern, line, re.I)]
+        assert [line[2] for line in main._grep_buffer(data, main._GrepMatcher(pattern))[1]] == expected
+
+
+def test_grep_non_ascii_regex_ignores_case(tmp_path, monkeypatch, capsys):
+    """测试 grep: 含非 ASCII 字符的正则按 Unicode 不区分大小写 (CAFÉ 匹配 café, ПРИВЕТ 匹配 привет)"""
+    import main
+    data = 'café au lait\nCAFE\nпривет, мир\nпока\n'.encode('utf-8')
+    assert main._grep_buffer(data, main._GrepMatcher('CAFÉ'))[1] == [(1, True, 'café au lait')]
+    assert main._grep_buffer(data, main._GrepMatcher('ПРИВЕТ|ПОКА'))[0] == 2
+    assert main._grep_buffer(data, main._GrepMatcher('[ПP]РИВЕТ'))[0] == 1
+    assert main._grep_buffer(data, main._GrepMatcher('мир', word=True))[0] == 1
+    assert main._grep_buffer(data, main._GrepMatcher('ПРИВЕТ', ignore_case=False))[0] == 0
+    system = make_system(tmp_path, monkeypatch)
+    (tmp_path / 'notes.txt').write_bytes(data)
+    capsys.readouterr()
+    system.execute_command('grep ПРИВЕТ notes.txt')
+    out = capsys.readouterr().out
+    assert 'привет, мир' in out and '找到 1 个匹配' in out
+
+
+def test_process_pool_does_not_fork(tmp_path):
+    """测试进程池: 子进程不由 fork 启动 (本进程可能有其他线程), 顶层函数可以在子进程中运行"""
+    import main
+    (tmp_path / 'a.txt').write_bytes(b'hello world\n')
+    pool = main._process_pool(1)
+    try:
+        assert pool._mp_context.get_start_method() != 'fork'
+        result = pool.submit(main._content_trigram_batch, [str(tmp_path / 'a.txt'), str(tmp_path / 'none')]).result()
+    finally:
+        pool.shutdown()
+    assert result == main._content_trigram_batch([str(tmp_path / 'a.txt'), str(tmp_path / 'none')])
+    assert result[0] is not None and result[1] is None
+
+
+def test_head_tail_count_forms(tmp_path, monkeypatch, capsys):
+    """测试 head/tail 的行数写法: N、-N、-n N 在命令和管道中都可用, 旧写法 head <文件> [行数] 仍可用"""
+    (tmp_path / 'a.txt').write_text(''.join(f'{i}\n' for i in range(1, 8)))
+    system = make_system(tmp_path, monkeypatch)
+    capsys.readouterr()
+    for command in ('type a.txt | head 2', 'type a.txt | head -2', 'type a.txt | head -n 2'):
+        assert system.execute_command(command) == 0
+        assert capsys.readouterr().out.splitlines() == ['1', '2']
+    for command in ('type a.txt | tail 2', 'type a.txt | tail -2', 'type a.txt | tail -n 2'):
+        assert system.execute_command(command) == 0
+        assert capsys.readouterr().out.splitlines() == ['6', '7']
+    for command in ('head a.txt 3', 'head -3 a.txt', 'head -n 3 a.txt'):
+        assert system.execute_command(command) == 0
+        assert capsys.readouterr().out.splitlines()[2:] == ['1', '2', '3']
+    assert system.execute_command('head -n') == 2
+    assert system.execute_command('head a.txt many') == 2
+
+
+def test_grep_pipeline_count_context_and_file_only_options(tmp_path, monkeypatch, capsys):
+    """测试管道中的 grep: -c 输出匹配行数, -A/-B/-C 输出上下文 (不连续处为 --), 只适用于文件的选项报用法错误"""
+    (tmp_path / 'f.txt').write_text('a1\nb2\nc3\nb4\nx5\nx6\nx7\nb8\n')
+    system = make_system(tmp_path, monkeypatch)
+    capsys.readouterr()
+    assert system.execute_command('type f.txt | grep -c b') == 0
+    assert capsys.readouterr().out.splitlines() == ['3']
+    assert system.execute_command('type f.txt | grep -C 1 b') == 0
+    assert capsys.readouterr().out.splitlines() == ['a1', 'b2', 'c3', 'b4', 'x5', '--', 'x7', 'b8']
+    assert system.execute_command('type f.txt | grep -A 1 c') == 0
+    assert capsys.readouterr().out.splitlines() == ['c3', 'b4']
+    assert system.execute_command('type f.txt | grep -B 2 x7') == 0
+    assert capsys.readouterr().out.splitlines() == ['x5', 'x6', 'x7']
+    for option in ('--include *.txt', '--exclude *.txt', '-j 2', '--indexed'):
+        assert system.execute_command(f'type f.txt | grep {option} b') == 2
+        assert '用法' in capsys.readouterr().out
+    assert system.execute_command('type f.txt | grep -A') == 2
+
+
+def test_wc_pipeline_options(tmp_path, monkeypatch, capsys):
+    """测试管道中的 wc: -l 只输出行数, 未知选项报用法错误"""
+    (tmp_path / 'f.txt').write_text('one two\nthree\n')
+    system = make_system(tmp_path, monkeypatch)
+    capsys.readouterr()
+    assert system.execute_command('type f.txt | wc -l') == 0
+    assert capsys.readouterr().out.splitlines() == ['2']
+    assert system.execute_command('type f.txt | wc') == 0
+    assert capsys.readouterr().out.splitlines() == ['2 3 14']
+    assert system.execute_command('type f.txt | wc -x') == 2
+    assert '用法' in capsys.readouterr().out
+    assert system.execute_command('type f.txt | wc -j 2') == 2
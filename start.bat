@@ -8,7 +8,7 @@ REM 检查Python是否安装
 python --version >nul 2>&1
 if errorlevel 1 (
     echo  Python未安装或未添加到PATH
-    echo 请先安装Python 3.6+
+    echo 请先安装Python 3.9+
     pause
     exit /b 1
 )
@@ -6,24 +6,19 @@
 
 import sys
 import os
+from importlib.util import find_spec
 
 def check_dependencies():
     """检查依赖包"""
     missing_packages = []
     
-    try:
-        import psutil
-        print("✅ psutil 已安装")
-    except ImportError:
-        missing_packages.append("psutil")
-        print("❌ psutil 未安装")
-    
-    try:
-        import requests
-        print("✅ requests 已安装")
-    except ImportError:
-        missing_packages.append("requests")
-        print("❌ requests 未安装")
+    # 只查找包是否存在, 不在启动检查时导入它们
+    for package in ("psutil", "requests"):
+        if find_spec(package) is not None:
+            print(f"✅ {package} 已安装")
+        else:
+            missing_packages.append(package)
+            print(f"❌ {package} 未安装")
     
     return missing_packages
 